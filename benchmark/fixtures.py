@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: fixtures.py
+@Time    : 2025/4/12 上午11:45
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 生成基准测试的任务数据：每个任务一个目录，包含若干 JPEG 照片和多页扫描 PDF，与下载器的目录结构一致
+@Usage   : tasks = make_fixture_tasks(data_dir, num_tasks=20, seed=42)，返回 {task_id: [文件路径, ...]}
+"""
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+
+def _make_page(size, rng, label):
+    """生成一页模拟扫描件：白底、若干文字行和表格线"""
+    width, height = size
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((width // 10, height // 20), label, fill="black")
+    for i in range(rng.randint(20, 40)):
+        y = height // 10 + i * height // 50
+        draw.line((width // 10, y, width // 10 + rng.randint(width // 4, width * 3 // 4), y), fill="black", width=3)
+    # 模拟印章
+    if rng.random() < 0.5:
+        x, y = rng.randint(width // 2, width * 3 // 4), rng.randint(height // 2, height * 3 // 4)
+        draw.ellipse((x, y, x + width // 6, y + width // 6), outline="red", width=8)
+    return image
+
+
+def make_fixture_tasks(data_dir, num_tasks=20, seed=42, files_per_task=(1, 4), pdf_ratio=0.5, pdf_pages=(1, 8),
+                       page_size=(1654, 2339)):
+    """
+    生成基准测试任务。
+    :param data_dir: 数据目录，每个任务的文件保存在 data_dir/<task_id>/ 下
+    :param num_tasks: 任务数量
+    :param seed: 随机种子，相同种子生成相同的任务
+    :param files_per_task: 每个任务的文件数量范围
+    :param pdf_ratio: 文件为 PDF 的比例，其余为 JPEG 照片
+    :param pdf_pages: PDF 页数范围
+    :param page_size: 页面像素尺寸，默认为 200 DPI 的 A4
+    :return: {task_id: [文件路径, ...]}
+    """
+    rng = random.Random(seed)
+    tasks = {}
+    for task_no in range(num_tasks):
+        task_id = f"bench{seed:04d}{task_no:06d}"
+        task_dir = os.path.join(data_dir, task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        file_paths = []
+        for file_no in range(rng.randint(*files_per_task)):
+            if rng.random() < pdf_ratio:
+                pages = [_make_page(page_size, rng, f"{task_id} {file_no} page {page_no + 1}")
+                         for page_no in range(rng.randint(*pdf_pages))]
+                file_path = os.path.join(task_dir, f"{file_no:04d}.pdf")
+                pages[0].save(file_path, "PDF", resolution=200, save_all=True, append_images=pages[1:])
+            else:
+                file_path = os.path.join(task_dir, f"{file_no:04d}.jpg")
+                _make_page(page_size, rng, f"{task_id} {file_no}").save(file_path, "JPEG", quality=85)
+            file_paths.append(file_path)
+        tasks[task_id] = file_paths
+    return tasks
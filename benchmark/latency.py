@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: latency.py
+@Time    : 2025/4/12 上午10:05
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基准测试的延迟分布模型和延迟统计
+@Usage   : LatencyModel.from_config({"dist": "lognormal", "median": 1200, "sigma": 0.4}).sample()；
+           LatencyRecorder.record("vlm_page", 1.2)，summary() 输出 p50/p95/p99
+"""
+import math
+import random
+import threading
+
+
+class LatencyModel:
+    """
+    可配置的延迟分布，单位为毫秒：
+    fixed(value)、uniform(low, high)、normal(mean, std)、lognormal(median, sigma)、exponential(mean)；
+    per_item 为每个额外元素（图像、页面）增加的延迟。
+    """
+
+    def __init__(self, dist="fixed", per_item=0.0, seed=None, **params):
+        self.dist = dist
+        self.per_item = float(per_item)
+        self.params = params
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, seed=None):
+        """根据配置字典创建延迟模型，配置为数字时视为固定延迟"""
+        if config is None:
+            return cls("fixed", value=0)
+        if isinstance(config, (int, float)):
+            return cls("fixed", value=config)
+        return cls(seed=seed, **config)
+
+    def _sample_ms(self):
+        params = self.params
+        with self.lock:
+            if self.dist == "fixed":
+                return float(params.get("value", 0))
+            if self.dist == "uniform":
+                return self.random.uniform(params.get("low", 0), params.get("high", 0))
+            if self.dist == "normal":
+                return self.random.gauss(params.get("mean", 0), params.get("std", 0))
+            if self.dist == "lognormal":
+                return self.random.lognormvariate(math.log(max(params.get("median", 1), 1e-3)), params.get("sigma", 0))
+            if self.dist == "exponential":
+                return self.random.expovariate(1.0 / max(params.get("mean", 1), 1e-3))
+        raise ValueError(f"Invalid latency distribution: {self.dist}")
+
+    def sample(self, items=1):
+        """
+        采样一次延迟。
+        :param items: 请求中的元素数量（图像数、页数），超过 1 的部分按 per_item 增加延迟
+        :return: 延迟秒数
+        """
+        latency_ms = max(self._sample_ms(), 0.0) + self.per_item * max(items - 1, 0)
+        return latency_ms / 1000
+
+
+def percentile(values, q):
+    """线性插值计算百分位数，values 需已排序"""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class LatencyRecorder:
+    """按阶段名称记录延迟，线程安全"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # 阶段名称 -> 延迟秒数列表
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+
+    def summary(self):
+        """
+        统计各阶段的延迟分布。
+        :return: 阶段名称 -> {count, mean, p50, p95, p99, max}，单位为秒
+        """
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        return {
+            stage: {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1],
+            }
+            for stage, values in samples.items() if values
+        }
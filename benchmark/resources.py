@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: resources.py
+@Time    : 2025/4/12 下午2:10
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基准测试的 CPU 和内存统计，包括当前进程及其子进程（渲染进程池、进程模式的处理单元）
+@Usage   : with ResourceMonitor() as monitor: ...; monitor.summary()
+"""
+import os
+import threading
+import time
+
+from utils.memory import get_rss_mb
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _child_pids(pid):
+    """读取 /proc 获取进程的所有后代进程，非 Linux 系统返回空列表"""
+    children = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # 进程名可能包含空格，从最后一个右括号之后解析
+                fields = file.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    descendants, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            descendants.append(child)
+            stack.append(child)
+    return descendants
+
+
+def _proc_cpu_rss(pid):
+    """读取 /proc/<pid>/stat 中的 CPU 时间（秒）和 RSS（MB）"""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        # utime、stime 为第 14、15 个字段，rss 为第 24 个字段（去掉 pid 和进程名后下标减 2）
+        cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        rss = int(fields[21]) * _PAGE_SIZE / 1024 / 1024
+        return cpu, rss
+    except (OSError, IndexError, ValueError):
+        return 0.0, 0.0
+
+
+class ResourceMonitor:
+    """在后台线程中采样 CPU 时间和内存，统计代码块执行期间的资源占用"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.child_cpu = {}  # 子进程 pid -> 最近一次采样的 CPU 时间，子进程退出后保留最后的值
+        self.child_cpu_start = {}  # 开始时已存在的子进程的 CPU 时间
+        self.peak_rss_mb = 0.0  # 当前进程的峰值内存
+        self.peak_total_rss_mb = 0.0  # 当前进程及子进程的峰值内存之和
+        self.wall_start = self.wall_end = 0.0
+        self.cpu_start = self.cpu_end = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _self_cpu():
+        times = os.times()
+        return times.user + times.system
+
+    def _sample(self):
+        total_rss = get_rss_mb()
+        child_cpu = {}
+        for child in _child_pids(self.pid):
+            cpu, rss = _proc_cpu_rss(child)
+            child_cpu[child] = cpu
+            total_rss += rss
+        with self.lock:
+            self.child_cpu.update(child_cpu)
+            self.peak_rss_mb = max(self.peak_rss_mb, get_rss_mb())
+            self.peak_total_rss_mb = max(self.peak_total_rss_mb, total_rss)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.wall_start = time.time()
+        self.cpu_start = self._self_cpu()
+        self.child_cpu_start = {child: _proc_cpu_rss(child)[0] for child in _child_pids(self.pid)}
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._sample()
+        self._stop_event.set()
+        self._thread.join()
+        self.wall_end = time.time()
+        self.cpu_end = self._self_cpu()
+        return False
+
+    def summary(self):
+        """
+        :return: 用时、CPU 时间（当前进程和子进程）、平均 CPU 占用（按单核计）和峰值内存
+        """
+        wall = max(self.wall_end - self.wall_start, 1e-6)
+        with self.lock:
+            child_cpu = sum(cpu - self.child_cpu_start.get(child, 0.0) for child, cpu in self.child_cpu.items())
+        self_cpu = self.cpu_end - self.cpu_start
+        return {
+            "wall_seconds": wall,
+            "cpu_seconds": self_cpu,
+            "child_cpu_seconds": child_cpu,
+            "cpu_utilisation": (self_cpu + child_cpu) / wall,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_total_rss_mb": self.peak_total_rss_mb,
+        }
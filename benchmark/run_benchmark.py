@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: run_benchmark.py
+@Time    : 2025/4/12 下午3:00
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 端到端吞吐基准测试：启动本地模拟服务，生成任务数据，通过 ParallelProcessor 依次运行各工作流，
+           输出每小时任务数、各阶段 p50/p95/p99 延迟、CPU 和内存占用
+@Usage   : 在项目根目录运行 python -m benchmark.run_benchmark [--config benchmark/benchmark.yaml]
+           [--workflows mini,ultra] [--tasks 20] [--workers 4] [--worker-mode thread] [--processor-mode worker]
+"""
+import argparse
+import copy
+import functools
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import yaml
+
+from benchmark.stand_ins import install_mineru_stand_in
+
+# MinerU 替身必须在导入 models 之前注册
+install_mineru_stand_in()
+
+from benchmark.fixtures import make_fixture_tasks  # noqa: E402
+from benchmark.latency import LatencyRecorder  # noqa: E402
+from benchmark.resources import ResourceMonitor  # noqa: E402
+from benchmark.stub_servers import start_stub_servers, stop_stub_servers  # noqa: E402
+from models import LLM, MinerUOCR, PaddleOCR, SealExtractor, VLM  # noqa: E402
+from models.name_classifier import NameTypeClassifier  # noqa: E402
+from parallel_processor import ParallelProcessor  # noqa: E402
+from utils import load_config  # noqa: E402
+from utils.rasterizer import PdfRasterizer  # noqa: E402
+
+# 需要统计延迟的阶段：阶段名称 -> (类, 方法名)，方法不存在时跳过
+STAGES = {
+    "task": (ParallelProcessor, "_run_workflow"),
+    "store": (ParallelProcessor, "_store_result"),
+    "vlm_file": (VLM, "process"),
+    "vlm_image": (VLM, "_process_image"),
+    "vlm_batch": (VLM, "_process_batch"),
+    "vlm_text": (VLM, "process_text"),
+    "vlm_file_list": (VLM, "process_file_list"),
+    "name_classify": (NameTypeClassifier, "classify"),
+    "name_type": (VLM, "judge_name_type"),
+    "llm_text": (LLM, "process"),
+    "seal": (SealExtractor, "process"),
+    "ocr_paddle": (PaddleOCR, "process"),
+    "ocr_mineru": (MinerUOCR, "process"),
+}
+
+
+def deep_update(target, source):
+    """递归合并配置字典"""
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            deep_update(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def instrument(recorder):
+    """包装各阶段的方法，记录每次调用的用时。进程模式下子进程中的调用不会被记录"""
+
+    def timed(stage, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            time_start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                recorder.record(stage, time.time() - time_start)
+        return wrapper
+
+    for stage, (cls, name) in STAGES.items():
+        method = getattr(cls, name, None)
+        if method is not None:
+            setattr(cls, name, timed(stage, method))
+
+    # 页面渲染是异步的，从提交到完成计时，已渲染的页面直接返回
+    page_future = PdfRasterizer._page_future
+
+    @functools.wraps(page_future)
+    def timed_page_future(self, *args, **kwargs):
+        time_start = time.time()
+        future = page_future(self, *args, **kwargs)
+        future.add_done_callback(lambda _: recorder.record("rasterize_page", time.time() - time_start))
+        return future
+
+    PdfRasterizer._page_future = timed_page_future
+
+
+def build_config(bench_config, servers, workflow_type, run_dir):
+    """在 config/config.yaml 的基础上生成测试配置"""
+    config = deep_update(copy.deepcopy(load_config()), copy.deepcopy(bench_config.get("overrides", {})))
+    workflow_config = config.setdefault("workflow_config", {})
+    workflow_config.update({
+        "workflow_type": workflow_type,
+        "task_queue_db": os.path.join(run_dir, "task_queue.db"),
+        "last_check_time": os.path.join(run_dir, "last_check_time.txt"),
+    })
+    config.setdefault("data_config", {}).update({
+        "data_dir": os.path.join(run_dir, "data"),
+        "output_dir": os.path.join(run_dir, "output"),
+        "delete_files": True,
+    })
+    config.setdefault("results_db_config", {}).update({
+        "db_type": "sqlite",
+        "db_name": os.path.join(run_dir, "audit_results.db"),
+    })
+    config.setdefault("logging_config", {})["file"] = os.path.join(run_dir, "logs")
+    config.setdefault("vlm_config", {})["service_url"] = f"{servers['vlm'].base_url}/v1"
+    config.setdefault("llm_config", {})["service_url"] = f"{servers['llm'].base_url}/v1"
+    config.setdefault("ocr_paddle_config", {})["service_url"] = f"{servers['ocr'].base_url}/ocr"
+    config.setdefault("seal_config", {})["service_url"] = f"{servers['seal'].base_url}/seal-recognition"
+    config["mineru_stand_in"] = bench_config.get("latency", {}).get("mineru")
+    return config
+
+
+def run_workflow(bench_config, servers, recorder, workflow_type):
+    """使用 ParallelProcessor 运行一个工作流的全部测试任务，返回测试结果"""
+    settings = bench_config.get("benchmark", {})
+    run_dir = os.path.join(settings.get("work_dir", "./data/benchmark"), workflow_type)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    config = build_config(bench_config, servers, workflow_type, run_dir)
+
+    fixtures = dict(bench_config.get("fixtures", {}))
+    for key in ("files_per_task", "pdf_pages", "page_size"):
+        if key in fixtures:
+            fixtures[key] = tuple(fixtures[key])
+    tasks = make_fixture_tasks(config["data_config"]["data_dir"], num_tasks=settings.get("num_tasks", 20), **fixtures)
+    files = sum(len(file_paths) for file_paths in tasks.values())
+
+    processor = ParallelProcessor(config, delete=True)
+    # 任务直接写入持久化队列，不经过 Oracle 下载
+    for task_id, file_paths in tasks.items():
+        processor.downloader.add_task(task_id, file_paths)
+
+    recorder.reset()
+    timeout = settings.get("timeout", 3600)
+    logging.warning(f"开始测试工作流 {workflow_type}：{len(tasks)} 个任务，{files} 个文件，"
+                    f"{processor.num_workers} 个处理单元（{processor.worker_mode}，{processor.processor_mode}）")
+    with ResourceMonitor() as monitor:
+        processor.start_workers()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            counts = processor.task_queue.status_counts()
+            if counts.get("pending", 0) + counts.get("claimed", 0) == 0:
+                break
+            time.sleep(0.5)
+        else:
+            logging.error(f"工作流 {workflow_type} 超过 {timeout} 秒未完成")
+        processor.stop()
+    counts = processor.task_queue.status_counts()
+    processor.task_queue.close()
+
+    resources = monitor.summary()
+    done = counts.get("done", 0)
+    return {
+        "workflow": workflow_type,
+        "tasks": len(tasks),
+        "files": files,
+        "done": done,
+        "failed": counts.get("failed", 0),
+        "num_workers": processor.num_workers,
+        "worker_mode": processor.worker_mode,
+        "processor_mode": processor.processor_mode,
+        "tasks_per_hour": done * 3600 / resources["wall_seconds"],
+        "resources": resources,
+        "stages": recorder.summary(),
+    }
+
+
+def format_report(result):
+    """将单个工作流的测试结果格式化为文本表格"""
+    resources = result["resources"]
+    lines = [
+        f"工作流 {result['workflow']}（{result['num_workers']} 个处理单元，{result['worker_mode']}，{result['processor_mode']}）",
+        f"  任务 {result['done']}/{result['tasks']} 完成，失败 {result['failed']}，用时 {resources['wall_seconds']:.1f} 秒，"
+        f"吞吐 {result['tasks_per_hour']:.1f} 个/小时",
+        f"  CPU {resources['cpu_seconds']:.1f} 秒（子进程 {resources['child_cpu_seconds']:.1f} 秒），"
+        f"平均占用 {resources['cpu_utilisation']:.0%}，峰值内存 {resources['peak_rss_mb']:.0f} MB"
+        f"（含子进程 {resources['peak_total_rss_mb']:.0f} MB）",
+        f"  {'阶段':<16}{'次数':>8}{'平均':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}",
+    ]
+    for stage, stats in sorted(result["stages"].items()):
+        lines.append(f"  {stage:<18}{stats['count']:>8}{stats['mean']:>10.3f}{stats['p50']:>10.3f}"
+                     f"{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Audits 端到端吞吐基准测试")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(__file__), "benchmark.yaml"),
+                        help="基准测试配置文件")
+    parser.add_argument("--workflows", help="逗号分隔的工作流类型，默认使用配置文件中的列表")
+    parser.add_argument("--tasks", type=int, help="每个工作流的任务数")
+    parser.add_argument("--workers", type=int, help="处理单元数量")
+    parser.add_argument("--worker-mode", choices=["thread", "process"], help="处理单元类型")
+    parser.add_argument("--processor-mode", choices=["worker", "pipeline"], help="处理方式")
+    parser.add_argument("--report", help="测试报告文件")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        bench_config = yaml.safe_load(f)
+    settings = bench_config.setdefault("benchmark", {})
+    workflow_overrides = bench_config.setdefault("overrides", {}).setdefault("workflow_config", {})
+    if args.tasks:
+        settings["num_tasks"] = args.tasks
+    if args.report:
+        settings["report_file"] = args.report
+    if args.workers:
+        workflow_overrides["num_workers"] = args.workers
+    if args.worker_mode:
+        workflow_overrides["worker_mode"] = args.worker_mode
+    if args.processor_mode:
+        workflow_overrides["processor_mode"] = args.processor_mode
+    workflows = args.workflows.split(",") if args.workflows else settings.get("workflows", ["mini"])
+    if workflow_overrides.get("worker_mode") == "process":
+        logging.warning("进程模式下子进程中的模型调用不计入阶段延迟，只统计任务整体用时和服务端延迟")
+
+    recorder = LatencyRecorder()
+    instrument(recorder)
+    servers = start_stub_servers(bench_config.get("latency", {}), bench_config.get("servers", {}), recorder)
+    results = []
+    try:
+        for workflow_type in workflows:
+            results.append(run_workflow(bench_config, servers, recorder, workflow_type))
+    finally:
+        stop_stub_servers(servers)
+
+    report = "\n\n".join(format_report(result) for result in results)
+    # 日志级别可能被设置为 WARNING，报告直接输出到标准输出
+    print(report)
+    report_file = settings.get("report_file", "./data/benchmark/report.json")
+    os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump({"config": bench_config, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"测试报告已保存到 {report_file}")
+    return 0 if all(result["failed"] == 0 and result["done"] == result["tasks"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
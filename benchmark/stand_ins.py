@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: stand_ins.py
+@Time    : 2025/4/12 上午11:20
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基准测试使用的 MinerU 替身。MinerU 在进程内加载版面分析和 OCR 模型，没有服务接口，
+           替身按配置的每页延迟模拟解析用时，返回固定的文本内容，无需安装 magic-pdf 和 GPU
+@Usage   : 在导入 models 之前调用 install_mineru_stand_in()，工作流中的 MinerUOCR 即为替身；
+           延迟分布由 config["mineru_stand_in"] 配置；进程模式的子进程由 parallel_processor 按环境变量
+           AUDITS_MINERU_STAND_IN 重新注册替身
+"""
+import logging
+import os
+import sys
+import time
+import types
+
+from benchmark.latency import LatencyModel
+from utils.pdf_utils import get_pdf_page_count
+
+# 环境变量，设置后 parallel_processor 在 spawn 启动的子进程中同样注册替身
+STAND_IN_ENV = "AUDITS_MINERU_STAND_IN"
+
+# 模拟 MinerU 解析结果（content_list）中每页的文本
+PAGE_TEXT = ("违法建设行为调查询问笔录。当事人：张三。图斑编号：HZJGZW202401-441322122510Z0006。"
+             "建筑层数：3层；占地面积：120平方米；建筑面积：360平方米。")
+
+
+class MinerUOCR:
+    def __init__(self, config):
+        """
+        初始化 MinerU 替身。
+        :param config: 配置文件，mineru_stand_in 为每页解析延迟的分布配置
+        """
+        self.config = config.get("ocr_mineru_config", {})
+        self.output_dir = os.path.join(config.get("data_config", {}).get("output_dir"), "miner")
+        self.delete_files = config.get("data_config", {}).get("delete_files")
+        self.latency = LatencyModel.from_config(config.get("mineru_stand_in"))
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _content_list(self, input_path):
+        """按页数生成 MinerU 格式的 content_list"""
+        pages = get_pdf_page_count(input_path) if input_path.lower().endswith(".pdf") else 1
+        return [{"type": "text", "text": PAGE_TEXT, "page_idx": page_idx} for page_idx in range(pages)]
+
+    def process(self, input_path, llm_text=True):
+        """
+        模拟 OCR 处理流程，按页数等待后返回与 MinerUOCR.process 相同格式的结果。
+        :param input_path: 输入文件路径
+        :param llm_text: 是否返回合并后的文本
+        """
+        if not input_path.lower().endswith((".pdf", ".jpg", ".jpeg", ".png", ".bmp")):
+            logging.error(f"不支持的文件类型：{input_path}")
+            return None
+        content = self._content_list(input_path)
+        time.sleep(self.latency.sample(len(content)))
+        if llm_text:
+            return "\n\n".join(item["text"] for item in content)
+        return {"file_name": os.path.basename(input_path),
+                "content": [dict(item, title="") for item in content]}
+
+
+def install_mineru_stand_in():
+    """
+    用替身模块替换 models.ocr_mineru，必须在导入 models 之前调用，已注册时不重复注册。
+    替身注册在当前进程的 sys.modules 中，不修改项目代码。spawn 启动的子进程不继承 sys.modules，
+    因此同时设置环境变量 STAND_IN_ENV，子进程导入 parallel_processor 时在导入 models 之前重新注册。
+    """
+    os.environ[STAND_IN_ENV] = "1"
+    if getattr(sys.modules.get("models.ocr_mineru"), "MinerUOCR", None) is MinerUOCR:
+        return
+    if "models" in sys.modules:
+        raise RuntimeError("install_mineru_stand_in() must be called before importing models")
+    module = types.ModuleType("models.ocr_mineru")
+    module.MinerUOCR = MinerUOCR
+    sys.modules["models.ocr_mineru"] = module
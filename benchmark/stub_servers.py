@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: stub_servers.py
+@Time    : 2025/4/12 上午10:40
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基准测试使用的本地模拟服务：OpenAI 兼容的 chat 接口（vLLM）、PaddleX 的 /ocr 和 /seal-recognition 接口，
+           按配置的延迟分布返回固定格式的结果，不加载任何模型
+@Usage   : servers = start_stub_servers(latency_config, chat_config, recorder)；servers["vlm"].url；stop_stub_servers(servers)
+"""
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark.latency import LatencyModel
+
+# 模拟 VLM/LLM 抽取的完整结果，按 null_ratio 随机置空部分字段以触发后续识别阶段
+EXTRACTION_RESULT = {
+    "公章": True,
+    "当事人": "张三",
+    "图斑编号": "HZJGZW202401-441322122510Z0006",
+    "建筑层数": 3,
+    "占地面积": 120,
+    "建筑面积": 360,
+}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, name, handler_class, latency, recorder, options=None, host="127.0.0.1", port=0):
+        """
+        初始化模拟服务。
+        :param name: 服务名称，用于延迟统计
+        :param handler_class: 请求处理类
+        :param latency: 延迟模型 LatencyModel
+        :param recorder: 服务端延迟统计 LatencyRecorder
+        :param options: 处理类使用的其它配置
+        :param port: 端口，0 表示随机空闲端口
+        """
+        super().__init__((host, port), handler_class)
+        self.name = name
+        self.latency = latency
+        self.recorder = recorder
+        self.options = options or {}
+        self.random = random.Random(self.options.get("seed"))
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True, name=f"stub_{self.name}")
+        self.thread.start()
+        logging.info(f"模拟服务 {self.name} 已启动: {self.base_url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    path_suffix = ""
+
+    def log_message(self, format, *args):
+        """关闭默认的访问日志"""
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith(self.path_suffix):
+            self._send_json({"errorCode": 404, "errorMsg": f"Not found: {self.path}"}, status=404)
+            return
+        time_start = time.time()
+        request = self._read_json()
+        items, response = self.respond(request)
+        # 按延迟分布模拟模型推理用时
+        time.sleep(max(self.server.latency.sample(items) - (time.time() - time_start), 0))
+        self._send_json(response)
+        self.server.recorder.record(f"server_{self.server.name}", time.time() - time_start)
+
+    def respond(self, request):
+        """返回 (请求中的元素数量, 响应数据)"""
+        raise NotImplementedError
+
+
+class ChatHandler(_StubHandler):
+    """OpenAI 兼容的 /v1/chat/completions 接口"""
+    path_suffix = "/chat/completions"
+
+    def respond(self, request):
+        texts, images = [], 0
+        for message in request.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+                continue
+            for part in content or []:
+                if part.get("type") == "image_url":
+                    images += 1
+                elif part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+        prompt = "\n".join(texts)
+
+        if "判断当事人" in prompt:
+            content = "0"
+        elif "文件名列表" in prompt:
+            content = json.dumps({"当事人": EXTRACTION_RESULT["当事人"]}, ensure_ascii=False)
+        else:
+            null_ratio = self.server.options.get("null_ratio", 0.0)
+            result = {key: (None if self.server.random.random() < null_ratio else value)
+                      for key, value in EXTRACTION_RESULT.items()}
+            if images > 1:
+                content = json.dumps([result] * images, ensure_ascii=False)
+            else:
+                content = json.dumps(result, ensure_ascii=False)
+
+        # 粗略估算 token 数：中文约 1 字 1 token，每张图像按 image_tokens 计
+        prompt_tokens = len(prompt) + images * self.server.options.get("image_tokens", 1000)
+        completion_tokens = len(content)
+        response = {
+            "id": f"chatcmpl-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        return max(images, 1), response
+
+
+class OcrHandler(_StubHandler):
+    """PaddleX 通用 OCR 产线的 /ocr 接口"""
+    path_suffix = "/ocr"
+
+    def respond(self, request):
+        rec_texts = ["当事人：张三", "图斑编号：HZJGZW202401-441322122510Z0006",
+                     "建筑层数：3层", "占地面积：120平方米"]
+        rec_polys = [[[10, 10 + 40 * i], [600, 10 + 40 * i], [600, 40 + 40 * i], [10, 40 + 40 * i]]
+                     for i in range(len(rec_texts))]
+        return 1, {
+            "logId": str(int(time.time() * 1000)),
+            "errorCode": 0,
+            "errorMsg": "Success",
+            "result": {"ocrResults": [{"prunedResult": {"rec_texts": rec_texts, "rec_polys": rec_polys}}]},
+        }
+
+
+class SealHandler(_StubHandler):
+    """PaddleX 印章识别产线的 /seal-recognition 接口"""
+    path_suffix = "/seal-recognition"
+
+    def respond(self, request):
+        seal_res_list = []
+        if self.server.random.random() < self.server.options.get("seal_ratio", 0.5):
+            seal_res_list.append({"text_type": "seal", "rec_texts": ["某某村民委员会"], "rec_scores": [0.98]})
+        return 1, {
+            "logId": str(int(time.time() * 1000)),
+            "errorCode": 0,
+            "errorMsg": "Success",
+            "result": {"sealRecResults": [{"prunedResult": {"seal_res_list": seal_res_list}}]},
+        }
+
+
+def start_stub_servers(latency_config, server_config, recorder):
+    """
+    启动全部模拟服务。
+    :param latency_config: 各服务的延迟分布配置（vlm、llm、ocr、seal）
+    :param server_config: 各服务的其它配置，例如 chat 的 null_ratio、seal 的 seal_ratio
+    :param recorder: 服务端延迟统计
+    :return: 服务名称 -> StubServer
+    """
+    handlers = {"vlm": ChatHandler, "llm": ChatHandler, "ocr": OcrHandler, "seal": SealHandler}
+    servers = {}
+    for name, handler_class in handlers.items():
+        options = server_config.get(name, {})
+        latency = LatencyModel.from_config(latency_config.get(name), seed=options.get("seed"))
+        servers[name] = StubServer(name, handler_class, latency, recorder, options).start()
+    return servers
+
+
+def stop_stub_servers(servers):
+    for server in servers.values():
+        server.stop()
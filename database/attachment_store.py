@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: attachment_store.py
+@Time    : 2025/4/14 上午9:40
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 按材料 id 保存已下载的附件，记录大小、ETag 和 SHA-256，超过磁盘配额时淘汰最久未使用的附件（LRU）。
+           记录修改或多条记录共用材料时，未变化的附件直接硬链接（或复制）到任务目录，不再从文件服务器重新下载
+@Usage   : store = AttachmentStore(store_dir, max_size_mb=20480)；store.fetch(material_id, file_url, file_path)
+"""
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.result_cache import file_sha256
+
+
+class AttachmentStore:
+    def __init__(self, store_dir, max_size_mb=20480, revalidate=True, link_mode="hardlink", retries=3):
+        """
+        初始化附件存储。
+        :param store_dir: 附件存储目录，需与数据目录在同一文件系统上才能硬链接
+        :param max_size_mb: 磁盘配额（MB）
+        :param revalidate: 使用已保存的附件前是否通过 HEAD 请求校验 ETag 和大小
+        :param link_mode: 附件放入任务目录的方式，hardlink 或 copy，硬链接失败时自动改为复制
+        :param retries: 下载重试次数
+        """
+        self.store_dir = store_dir
+        self.blob_dir = os.path.join(store_dir, "blobs")
+        self.max_bytes = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.revalidate = revalidate
+        self.link_mode = link_mode
+        self.retries = retries
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._material_locks = {}  # 材料 id -> 锁，同一材料同时只下载一次
+        self.session = self._create_session()
+        self.conn = self.connect_db()
+        self.create_table()
+
+    def _create_session(self):
+        session = requests.Session()
+        retry_strategy = Retry(
+            total=self.retries,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"]
+        )
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=32)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def connect_db(self) -> sqlite3.Connection:
+        """连接到附件索引数据库并开启 WAL 模式"""
+        conn = sqlite3.connect(os.path.join(self.store_dir, "index.db"), timeout=30, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create_table(self):
+        """创建附件索引表"""
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            material_id TEXT PRIMARY KEY,
+            blob_path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            sha256 TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_attachments_accessed ON attachments (accessed_at)")
+
+    def _material_lock(self, material_id):
+        with self.lock:
+            return self._material_locks.setdefault(material_id, threading.Lock())
+
+    def _lookup(self, material_id):
+        """查询已保存的附件，文件已被删除、大小或 SHA-256 与索引不一致时删除索引"""
+        with self.lock:
+            row = self.conn.execute("SELECT blob_path, size, etag, sha256 FROM attachments WHERE material_id = ?",
+                                    (material_id,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]) or os.path.getsize(row[0]) != row[1]:
+                self.conn.execute("DELETE FROM attachments WHERE material_id = ?", (material_id,))
+                return None
+        # 在锁外计算哈希，同一材料的调用方已持有材料锁
+        if file_sha256(row[0]) != row[3]:
+            logging.warning(f"附件 {material_id} 的内容与保存时的 SHA-256 不一致，重新下载")
+            with self.lock:
+                self.conn.execute("DELETE FROM attachments WHERE material_id = ?", (material_id,))
+            os.remove(row[0])
+            return None
+        return {"blob_path": row[0], "size": row[1], "etag": row[2], "sha256": row[3]}
+
+    def _is_unchanged(self, entry, file_url):
+        """
+        通过 HEAD 请求校验文件服务器上的附件是否变化。服务器未返回 ETag 和大小时认为材料 id 对应的内容不变；
+        HEAD 请求失败或服务器不支持（如 405）时无法校验，重新下载。
+        """
+        if not self.revalidate:
+            return True
+        try:
+            response = self.session.head(file_url, verify=False, timeout=(10, 30), allow_redirects=True)
+            response.raise_for_status()
+        except Exception as e:
+            logging.warning(f"校验附件 {file_url} 失败，重新下载: {str(e)}")
+            return False
+        etag = response.headers.get("ETag")
+        length = response.headers.get("Content-Length")
+        if etag and entry["etag"] and etag != entry["etag"]:
+            return False
+        if length and length.isdigit() and int(length) != entry["size"]:
+            return False
+        return True
+
+    def _download(self, material_id, file_url):
+        """下载附件到存储目录，边下载边计算 SHA-256，返回索引信息"""
+        tmp_path = os.path.join(self.blob_dir, f".{material_id}.{threading.get_ident()}.tmp")
+        attempt = 0
+        while True:
+            try:
+                digest, size = hashlib.sha256(), 0
+                response = self.session.get(file_url, stream=True, verify=False, timeout=(30, 120))
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(64 * 1024):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) != size:
+                    raise IOError(f"附件大小不一致，应为 {length} 字节，实际 {size} 字节")
+                break
+            except Exception as e:
+                attempt += 1
+                logging.error(f"下载失败: {str(e)}，尝试 {attempt}/{self.retries}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if attempt >= self.retries:
+                    return None
+                time.sleep(2)
+
+        sha256 = digest.hexdigest()
+        blob_path = os.path.join(self.blob_dir, sha256[:2], f"{material_id}")
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+        now = time.time()
+        entry = {"blob_path": blob_path, "size": size, "etag": response.headers.get("ETag"), "sha256": sha256}
+        with self.lock:
+            # 内容变化后哈希目录不同，删除旧的附件
+            row = self.conn.execute("SELECT blob_path FROM attachments WHERE material_id = ?", (material_id,)).fetchone()
+            if row is not None and row[0] != blob_path and os.path.exists(row[0]):
+                os.remove(row[0])
+            self.conn.execute("""
+            INSERT OR REPLACE INTO attachments (material_id, blob_path, size, etag, sha256, stored_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (material_id, blob_path, size, entry["etag"], sha256, now, now))
+        return entry
+
+    def _place(self, blob_path, file_path):
+        """将附件放入任务目录，已存在的同名文件先删除"""
+        if os.path.lexists(file_path):
+            os.remove(file_path)
+        if self.link_mode == "hardlink":
+            try:
+                os.link(blob_path, file_path)
+                return
+            except OSError:
+                # 跨文件系统或文件系统不支持硬链接
+                pass
+        shutil.copyfile(blob_path, file_path)
+
+    def fetch(self, material_id, file_url, file_path):
+        """
+        获取附件：已保存且未变化时直接放入任务目录，否则重新下载。
+        :param material_id: 材料 id（downloadId）
+        :param file_url: 下载地址
+        :param file_path: 任务目录中的文件路径
+        :return: 是否成功
+        """
+        material_id = str(material_id)
+        with self._material_lock(material_id):
+            entry = self._lookup(material_id)
+            if entry is not None and self._is_unchanged(entry, file_url):
+                self.hits += 1
+                with self.lock:
+                    self.conn.execute("UPDATE attachments SET accessed_at = ? WHERE material_id = ?",
+                                      (time.time(), material_id))
+            else:
+                self.misses += 1
+                entry = self._download(material_id, file_url)
+                if entry is None:
+                    logging.error(f"文件 {file_path} 下载失败，重试次数已用尽")
+                    return False
+                self.evict()
+            self._place(entry["blob_path"], file_path)
+        return True
+
+    def evict(self):
+        """超过磁盘配额时按最近使用时间淘汰附件，任务目录中已硬链接的文件不受影响"""
+        if not self.max_bytes:
+            return
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM attachments").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self.conn.execute("SELECT material_id, blob_path, size FROM attachments ORDER BY accessed_at").fetchall()
+            removed = 0
+            for material_id, blob_path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                material_lock = self._material_locks.get(material_id)
+                if material_lock is not None and material_lock.locked():
+                    # 正在放入任务目录或刚下载完成的附件不淘汰
+                    continue
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+                self.conn.execute("DELETE FROM attachments WHERE material_id = ?", (material_id,))
+                total -= size
+                removed += 1
+        logging.info(f"附件存储超过配额，淘汰 {removed} 个附件，当前 {total / 1024 / 1024:.0f} MB")
+
+    def stats(self):
+        """命中次数、下载次数、附件数和容量（MB）"""
+        with self.lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM attachments").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "size_mb": total / 1024 / 1024}
+
+    def close(self):
+        self.session.close()
+        self.conn.close()
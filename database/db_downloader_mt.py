@@ -9,6 +9,7 @@
 @Usage   :
 """
 import datetime
+import hashlib
 import threading
 import time
 import logging
@@ -20,22 +21,62 @@ from urllib3.util.retry import Retry
 import cx_Oracle
 import queue
 
+from .attachment_store import AttachmentStore
+from .task_queue import PersistentTaskQueue
+
+
+# 能反映文件内容变化的材料字段（大小、哈希、上传时间），同一 id 和文件名的材料重新上传后至少其中之一会变化
+CONTENT_FIELDS = ("fileSize", "size", "md5", "sha256", "etag", "updateTime", "uploadTime", "createTime")
+
+
+def material_fingerprint(raw_materials):
+    """
+    材料列表的指纹，由各材料的 id、文件名和 CONTENT_FIELDS 中的字段计算，与材料顺序无关。
+    :param raw_materials: SCZZCL 中的材料列表
+    :return: SHA-256 十六进制字符串；任一材料缺少 CONTENT_FIELDS 中的全部字段时无法判断内容是否变化，返回 None
+    """
+    items = []
+    for material in raw_materials:
+        content = {field: material[field] for field in CONTENT_FIELDS if material.get(field) not in (None, "")}
+        if not content:
+            return None
+        items.append((str(material.get("id")), str(material.get("fileName")),
+                      json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)))
+    return hashlib.sha256(json.dumps(sorted(items), ensure_ascii=False).encode("utf-8")).hexdigest()
+
 
 class DataDownloader:
-    def __init__(self, config):
+    def __init__(self, config, task_queue_db=None):
         self.config = config
         self.db_config = config.get("db_download_config", {})
+        self.workflow_config = config.get("workflow_config", {})
         self.data_dir = config.get("data_config", {}).get("data_dir")
         self.check_dir_exist(self.data_dir)
-        self.task_queue = queue.Queue()
+        # 持久化任务队列，程序重启后未完成的任务不会丢失
+        task_queue_db = task_queue_db or self.workflow_config.get("task_queue_db", "./data/task_queue.db")
+        self.task_queue = PersistentTaskQueue(task_queue_db,
+                                              max_attempts=self.workflow_config.get("task_max_attempts", 3),
+                                              policy=self.workflow_config.get("scheduling_policy", "fifo"),
+                                              aging_seconds=self.workflow_config.get("aging_seconds", 600))
         self.lock = threading.Lock()
         self.retries = self.db_config.get("retries", 3)
         self.num_threads = self.db_config.get("num_threads", 16)
+        self.skip_unchanged = self.db_config.get("skip_unchanged", False)  # 材料列表未变化的记录是否跳过重新审核
         self.connection = None  # 数据库
         self.cursor = None  # 游标
         self.download_threads = []  # 线程列表
+        # 材料列表变化时任务正在处理中的记录，记录 id -> (记录字段字典, 是否强制重新审核)，下次扫描时重新处理
+        self.deferred_records = {}
         self.running = True
-        self.processed_tasks = set()  # 已处理任务记录
+        # 附件存储，按材料 id 复用已下载的附件
+        self.attachment_store = None
+        attachment_config = config.get("attachment_config", {})
+        if attachment_config.get("enabled", False):
+            self.attachment_store = AttachmentStore(attachment_config.get("store_dir", "./data/attachments"),
+                                                    max_size_mb=attachment_config.get("max_size_mb", 20480),
+                                                    revalidate=attachment_config.get("revalidate", True),
+                                                    link_mode=attachment_config.get("link_mode", "hardlink"),
+                                                    retries=self.retries)
 
     def connect_db(self):
         try:
@@ -102,10 +143,34 @@ class DataDownloader:
                     return False
                 time.sleep(2)
 
-    def process_record(self, row_dict):
+    def process_record(self, row_dict, force=False):
+        """
+        下载一条记录的附件并加入任务队列。
+        :param row_dict: 记录字段字典
+        :param force: 是否强制重新审核，为 True 时不检查材料列表是否变化（按 ID 列表下载时使用）
+        """
         record_id = str(row_dict['ID'])
         sczzcl = row_dict['SCZZCL'] or '[]'
         raw_materials = json.loads(sczzcl)
+        fingerprint = material_fingerprint(raw_materials)
+        if self.task_queue.is_queued(record_id):
+            # 已在队列中的任务材料列表未变化时，其附件已下载到本地，无需重复下载
+            if fingerprint is not None and self.task_queue.queued_fingerprint(record_id) == fingerprint:
+                logging.info(f"任务 {record_id} 已在队列中，跳过下载")
+                return
+            # 材料列表已变化（或无法判断）：撤回等待处理的任务后重新下载；任务已被领取时，处理完成后在下次扫描时重新处理
+            if not self.task_queue.withdraw(record_id):
+                with self.lock:
+                    self.deferred_records[record_id] = (row_dict, force)
+                logging.info(f"任务 {record_id} 正在处理中且材料列表已变化，处理完成后重新下载和审核")
+                return
+            logging.info(f"任务 {record_id} 在队列中等待时材料列表已变化，重新下载")
+        # 记录的其它字段修改后 UPDATE_TIME_ 也会变化，材料列表与上次审核相同时沿用已保存的审核结果；
+        # 材料缺少大小等字段时无法判断，总是重新审核
+        if not force and self.skip_unchanged and fingerprint is not None and \
+                self.task_queue.audited_fingerprint(record_id) == fingerprint:
+            logging.info(f"任务 {record_id} 的材料列表与上次审核相同，跳过下载和重新审核（skip_unchanged）")
+            return
         output_dir = os.path.join(self.data_dir, record_id)
         self.check_dir_exist(output_dir)
 
@@ -116,7 +181,11 @@ class DataDownloader:
             file_id = material['id']
             file_url = f'http://163.179.247.76:8086/ibps/components/upload/download.htm?downloadId={file_id}'
             file_path = os.path.join(output_dir, file_name)
-            if self.download_file(file_url, file_path):
+            if self.attachment_store is not None:
+                downloaded = self.attachment_store.fetch(file_id, file_url, file_path)
+            else:
+                downloaded = self.download_file(file_url, file_path)
+            if downloaded:
                 file_paths.append(file_path)
 
         # TODO: 自定义排序键函数
@@ -134,13 +203,21 @@ class DataDownloader:
 
         time_end = time.time()
         if file_paths:
-            with self.lock:
-                if record_id not in self.processed_tasks:
-                    logging.info(f"下载任务 {record_id} 已保存到 {output_dir}, 用时 {time_end - time_start}")
-                    self.task_queue.put((record_id, file_paths))
-                    self.processed_tasks.add(record_id)
+            if self.task_queue.enqueue(record_id, file_paths, fingerprint=fingerprint):
+                logging.info(f"下载任务 {record_id} 已保存到 {output_dir}, 用时 {time_end - time_start}")
+
+    def process_deferred_records(self):
+        """重新处理材料列表变化时任务正在处理中的记录，任务仍在处理中时继续推迟"""
+        with self.lock:
+            deferred, self.deferred_records = self.deferred_records, {}
+        for record_id, (row_dict, force) in deferred.items():
+            try:
+                self.process_record(row_dict, force=force)
+            except Exception as e:
+                logging.error(f"处理记录 {record_id} 失败: {e}")
 
     def download_with_threading(self, last_check_time=None):
+        self.process_deferred_records()
         try:
             if not self.connection or not self.cursor:
                 self.connect_db()
@@ -203,10 +280,11 @@ class DataDownloader:
             # 如果下载出错，返回原始时间戳
             return last_check_time
 
-    def download(self, id_list=None):
+    def download(self, id_list=None, force=True):
         """
         根据传入的ID列表下载文件
         :param id_list: 固定的ID列表
+        :param force: 是否强制重新审核，默认 True，指定的记录即使材料列表未变化也重新加入队列
         """
         try:
             if not self.connection or not self.cursor:
@@ -230,7 +308,7 @@ class DataDownloader:
             # 启动处理线程
             self.download_threads = []
             for _ in range(self.num_threads):
-                thread = threading.Thread(target=self.process_task_worker, args=(task_queue, columns))
+                thread = threading.Thread(target=self.process_task_worker, args=(task_queue, columns, force))
                 thread.start()
                 self.download_threads.append(thread)
 
@@ -241,12 +319,12 @@ class DataDownloader:
             logging.error(f"下载任务时出错: {str(e)}")
             self.reconnect_db()
 
-    def process_task_worker(self, task_queue, columns):
+    def process_task_worker(self, task_queue, columns, force=False):
         while True:
             try:
                 row = task_queue.get(timeout=1)
                 row_dict = dict(zip(columns, row))
-                self.process_record(row_dict)
+                self.process_record(row_dict, force=force)
                 task_queue.task_done()
             except queue.Empty:
                 break
@@ -261,11 +339,12 @@ class DataDownloader:
         return self.task_queue
 
     def add_task(self, task_id, file_paths):
-        with self.lock:
-            if task_id not in self.processed_tasks:
-                self.task_queue.put((task_id, file_paths))
-                self.processed_tasks.add(task_id)
+        return self.task_queue.enqueue(task_id, file_paths)
 
-    def task_done(self):
-        with self.lock:
-            self.task_queue.task_done()
\ No newline at end of file
+    def ack_task(self, task_id):
+        """确认任务处理完成"""
+        self.task_queue.ack(task_id)
+
+    def nack_task(self, task_id, error=None):
+        """任务处理失败，未超过最大尝试次数时重新放回队列"""
+        return self.task_queue.nack(task_id, error)
\ No newline at end of file
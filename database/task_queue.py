@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: task_queue.py
+@Time    : 2025/4/8 上午10:12
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基于 SQLite(WAL) 的持久化任务队列，程序重启后可以从中断处继续处理
+@Usage   : 任务状态流转 pending -> claimed -> done，失败时 nack 回到 pending，超过最大尝试次数后为 failed；
+           领取顺序由调度策略决定（fifo、sjf、aging）
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from utils.pdf_utils import get_pdf_page_count
+
+PENDING = "pending"  # 等待处理
+CLAIMED = "claimed"  # 已被处理单元领取
+DONE = "done"  # 处理完成
+FAILED = "failed"  # 超过最大尝试次数
+
+
+def estimate_task_cost(file_paths, bytes_weight=0.1):
+    """
+    估算任务的处理代价：图像记为 1 页，PDF 通过 pdfinfo 读取页数，再加上文件大小的权重。
+    :param file_paths: 任务的文件路径列表
+    :param bytes_weight: 每 MB 文件大小折算的页数
+    :return: 包含文件数、字节数、页数和代价的字典
+    """
+    total_bytes, total_pages = 0, 0
+    for file_path in file_paths:
+        try:
+            total_bytes += os.path.getsize(file_path)
+        except OSError:
+            pass
+        if file_path.lower().endswith(".pdf"):
+            total_pages += get_pdf_page_count(file_path)
+        else:
+            total_pages += 1
+    cost = total_pages + total_bytes / (1024 * 1024) * bytes_weight
+    return {"files": len(file_paths), "bytes": total_bytes, "pages": total_pages, "cost": cost}
+
+
+def _fifo_order(now, aging_seconds):
+    """先进先出"""
+    return "enqueued_at", ()
+
+
+def _sjf_order(now, aging_seconds):
+    """短任务优先"""
+    return "cost, enqueued_at", ()
+
+
+def _aging_order(now, aging_seconds):
+    """短任务优先，每等待 aging_seconds 秒代价减少 1 页，避免大任务长期饥饿"""
+    return "cost - (? - enqueued_at) / ?, enqueued_at", (now, aging_seconds)
+
+
+# 调度策略：名称 -> 生成 ORDER BY 子句及参数的函数，可按需注册新的策略
+SCHEDULING_POLICIES = {
+    "fifo": _fifo_order,
+    "sjf": _sjf_order,
+    "aging": _aging_order,
+}
+
+
+class PersistentTaskQueue:
+    def __init__(self, db_path, max_attempts=3, policy="fifo", aging_seconds=600):
+        """
+        初始化持久化任务队列。
+        :param db_path: SQLite 数据库文件路径
+        :param max_attempts: 单个任务的最大尝试次数
+        :param policy: 调度策略名称，见 SCHEDULING_POLICIES
+        :param aging_seconds: aging 策略下代价每减少 1 页需要等待的秒数
+        """
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f"Invalid scheduling policy: {policy}")
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.policy = policy
+        self.aging_seconds = max(float(aging_seconds), 1.0)
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)  # 有新任务入队时唤醒等待的处理单元
+        self.conn = self.connect_db()
+        self.create_table()
+        self.recover()
+
+    def connect_db(self) -> sqlite3.Connection:
+        """连接到 SQLite 数据库并开启 WAL 模式，保证崩溃后数据一致"""
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create_table(self):
+        """创建任务表"""
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            file_paths TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            last_error TEXT,
+            files INTEGER NOT NULL DEFAULT 0,  -- 代价估算：文件数、字节数、页数和代价
+            bytes INTEGER NOT NULL DEFAULT 0,
+            pages INTEGER NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            fingerprint TEXT  -- 材料列表指纹，任务完成后即为最近一次审核的材料列表
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, enqueued_at)")
+
+    def recover(self):
+        """将上次运行中被领取但未确认的任务恢复为待处理状态"""
+        with self.lock:
+            cursor = self.conn.execute("UPDATE tasks SET status = ?, updated_at = ? WHERE status = ?",
+                                       (PENDING, time.time(), CLAIMED))
+            if cursor.rowcount:
+                logging.info(f"从持久化队列中恢复 {cursor.rowcount} 个未完成的任务")
+
+    def put(self, item):
+        """兼容 queue.Queue 的入队接口，item 为 (task_id, file_paths) 或 (task_id, file_paths, fingerprint)"""
+        return self.enqueue(*item)
+
+    def enqueue(self, task_id, file_paths, fingerprint=None):
+        """
+        任务入队，已在队列中（待处理或处理中）的任务不会重复入队。
+        入队前估算任务代价，供调度策略使用。
+        :param fingerprint: 任务材料列表的指纹，任务完成后用于判断记录的材料是否变化
+        :return: 是否新入队
+        """
+        if self.is_queued(task_id):
+            return False
+        # 估算代价需要读取 PDF 信息，在锁外完成
+        estimate = estimate_task_cost(file_paths)
+        now = time.time()
+        with self.not_empty:
+            row = self.conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row and row[0] in (PENDING, CLAIMED):
+                return False
+            self.conn.execute("""
+            INSERT OR REPLACE INTO tasks (task_id, file_paths, status, attempts, enqueued_at, updated_at, last_error,
+                                          files, bytes, pages, cost, fingerprint)
+            VALUES (?, ?, ?, 0, ?, ?, NULL, ?, ?, ?, ?, ?)
+            """, (task_id, json.dumps(file_paths, ensure_ascii=False), PENDING, now, now,
+                  estimate["files"], estimate["bytes"], estimate["pages"], estimate["cost"], fingerprint))
+            self.not_empty.notify()
+        logging.info(f"任务 {task_id} 入队，文件 {estimate['files']} 个，{estimate['pages']} 页，"
+                     f"{estimate['bytes'] / 1024 / 1024:.1f} MB，代价 {estimate['cost']:.1f}")
+        return True
+
+    def _claim_one(self):
+        """按调度策略领取一个待处理任务，调用方需持有锁"""
+        order_by, order_params = SCHEDULING_POLICIES[self.policy](time.time(), self.aging_seconds)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                f"SELECT task_id, file_paths FROM tasks WHERE status = ? ORDER BY {order_by} LIMIT 1",
+                (PENDING, *order_params)).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE tasks SET status = ?, attempts = attempts + 1, updated_at = ? WHERE task_id = ?",
+                                  (CLAIMED, time.time(), row[0]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def get(self, block=True, timeout=None):
+        """
+        领取一个任务，兼容 queue.Queue 的接口。
+        :param block: 队列为空时是否阻塞等待
+        :param timeout: 阻塞等待的超时时间（秒）
+        :return: (task_id, file_paths)
+        :raises queue.Empty: 队列为空
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.not_empty:
+            while True:
+                item = self._claim_one()
+                if item is not None:
+                    return item
+                if not block:
+                    raise queue.Empty
+                if deadline is None:
+                    self.not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def ack(self, task_id):
+        """确认任务处理完成"""
+        with self.lock:
+            self.conn.execute("UPDATE tasks SET status = ?, updated_at = ?, last_error = NULL WHERE task_id = ?",
+                              (DONE, time.time(), task_id))
+
+    def nack(self, task_id, error=None):
+        """
+        任务处理失败，未超过最大尝试次数时重新放回队列。
+        :return: 是否重新入队
+        """
+        with self.not_empty:
+            row = self.conn.execute("SELECT attempts FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                return False
+            status = PENDING if row[0] < self.max_attempts else FAILED
+            self.conn.execute("UPDATE tasks SET status = ?, updated_at = ?, last_error = ? WHERE task_id = ?",
+                              (status, time.time(), error, task_id))
+            if status == PENDING:
+                self.not_empty.notify()
+                return True
+            logging.error(f"任务 {task_id} 已失败 {row[0]} 次，不再重试")
+            return False
+
+    def is_queued(self, task_id):
+        """任务是否在队列中等待或正在处理"""
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row is not None and row[0] in (PENDING, CLAIMED)
+
+    def audited_fingerprint(self, task_id):
+        """最近一次成功审核的材料列表指纹，任务未完成或没有记录指纹时返回 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT status, fingerprint FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or row[0] != DONE:
+            return None
+        return row[1]
+
+    def queued_fingerprint(self, task_id):
+        """在队列中等待或正在处理的任务的材料列表指纹，任务不在队列中或没有记录指纹时返回 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT status, fingerprint FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or row[0] not in (PENDING, CLAIMED):
+            return None
+        return row[1]
+
+    def withdraw(self, task_id):
+        """
+        撤回等待处理的任务，用于记录的材料列表变化后重新下载和入队。
+        :return: 是否撤回，任务已被领取或不在队列中时返回 False
+        """
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM tasks WHERE task_id = ? AND status = ?", (task_id, PENDING))
+        return cursor.rowcount > 0
+
+    def qsize(self):
+        """待处理任务数量"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def status_counts(self):
+        """各状态的任务数量"""
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: client_pool.py
+@Time    : 2025/4/12 下午5:10
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 进程内共享的 OpenAI 客户端，每个服务地址一个客户端，复用 HTTP 长连接，避免每次请求重新建立连接
+@Usage   : client = get_openai_client(service_url, max_connections=64, timeout=120)；
+           OpenAI 客户端是线程安全的，多个处理线程可以同时使用同一个客户端
+"""
+import logging
+import threading
+
+import httpx
+from openai import OpenAI
+
+_clients = {}  # (服务地址, API key) -> OpenAI 客户端
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(service_url, api_key="EMPTY", max_connections=64, max_keepalive_connections=32,
+                      timeout=120, connect_timeout=10):
+    """
+    获取服务地址对应的共享 OpenAI 客户端，首次调用时创建，连接池和超时以首次调用的参数为准。
+    :param service_url: 服务地址
+    :param api_key: API key，vLLM 不需要，可以为任意值
+    :param max_connections: 连接池的最大连接数
+    :param max_keepalive_connections: 连接池中保持的空闲长连接数
+    :param timeout: 请求超时时间（秒）
+    :param connect_timeout: 建立连接的超时时间（秒）
+    :return: OpenAI 客户端
+    """
+    key = (service_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive_connections),
+                timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            )
+            client = OpenAI(api_key=api_key, base_url=service_url, http_client=http_client)
+            _clients[key] = client
+            logging.info(f"已创建 {service_url} 的共享客户端，最大连接数 {max_connections}，超时 {timeout} 秒")
+        return client
+
+
+def get_client_for_config(model_config, api_key="EMPTY"):
+    """按模型配置（vlm_config、llm_config）中的服务地址和连接池参数获取共享客户端"""
+    return get_openai_client(
+        model_config.get("service_url"),
+        api_key=api_key,
+        max_connections=model_config.get("max_connections", 64),
+        max_keepalive_connections=model_config.get("max_keepalive_connections", 32),
+        timeout=model_config.get("timeout", 120),
+        connect_timeout=model_config.get("connect_timeout", 10),
+    )
+
+
+def close_clients():
+    """关闭所有共享客户端的连接"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
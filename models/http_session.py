@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: http_session.py
+@Time    : 2025/4/13 上午10:20
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 进程内共享的 PaddleX 服务 HTTP 会话，每个服务地址一个带连接池的 requests.Session，复用长连接，
+           统一设置连接和读取超时，并按服务地址统计请求延迟
+@Usage   : session = get_service_session(service_url, pool_size=4, timeout=90, connect_timeout=10)；
+           response = session.post_json_retry(payload) 在重试次数和总时限内重试，超出后抛出异常；
+           log_endpoint_stats() 输出各服务地址的延迟统计
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_sessions = {}  # 服务地址 -> ServiceSession
+_sessions_lock = threading.Lock()
+
+
+class EndpointStats:
+    """单个服务地址的请求统计，保留最近 window 次请求的延迟用于计算百分位数"""
+
+    def __init__(self, service_url, window=1000):
+        self.service_url = service_url
+        self.requests = 0  # 请求次数
+        self.errors = 0  # 失败次数（连接失败、超时、非 200 状态码）
+        self.total_time = 0.0  # 累计用时（秒）
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, success=True):
+        """记录一次请求"""
+        with self.lock:
+            self.requests += 1
+            self.total_time += elapsed
+            self.latencies.append(elapsed)
+            if not success:
+                self.errors += 1
+
+    @staticmethod
+    def _percentile(values, q):
+        if not values:
+            return 0.0
+        return values[min(math.ceil(len(values) * q / 100) - 1, len(values) - 1)]
+
+    def summary(self):
+        """返回统计摘要字符串"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            avg_time = self.total_time / self.requests if self.requests else 0.0
+            return (f"{self.service_url}: 请求 {self.requests} 次, 失败 {self.errors} 次, 平均 {avg_time:.3f} 秒, "
+                    f"p50 {self._percentile(latencies, 50):.3f} 秒, p95 {self._percentile(latencies, 95):.3f} 秒, "
+                    f"最大 {latencies[-1] if latencies else 0.0:.3f} 秒")
+
+
+class ServiceSession:
+    """带连接池和超时的服务会话，requests.Session 的连接池是线程安全的，多个处理线程可以共用"""
+
+    def __init__(self, service_url, pool_size=4, timeout=90, connect_timeout=10, max_retries=3, retry_delay=3,
+                 deadline=None):
+        self.service_url = service_url
+        self.timeout = (connect_timeout, timeout)
+        self.max_retries = max(int(max_retries), 1)  # 单次调用的最大尝试次数
+        self.retry_delay = retry_delay  # 重试之间的等待秒数
+        self.deadline = deadline  # 单次调用（包括全部重试）的总时限（秒），为空时只受尝试次数限制
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = EndpointStats(service_url)
+
+    def post_json(self, payload, timeout=None):
+        """
+        发送 JSON 请求并记录用时，连接失败、超时和非 200 状态码计为失败。
+        :param payload: 请求数据
+        :param timeout: (连接超时, 读取超时)，为空时使用会话的超时设置
+        :return: requests.Response，连接失败或超时时抛出 requests.exceptions.RequestException
+        """
+        time_start = time.time()
+        success = False
+        try:
+            response = self.session.post(self.service_url, json=payload, timeout=timeout or self.timeout)
+            success = response.status_code == 200
+            return response
+        finally:
+            self.stats.record(time.time() - time_start, success=success)
+
+    def post_json_retry(self, payload):
+        """
+        发送 JSON 请求，连接失败、超时和非 200 状态码时重试，最多尝试 max_retries 次且总用时不超过 deadline，
+        服务无响应时尽快失败，不长时间占用处理单元和连接。
+        :param payload: 请求数据
+        :return: 状态码为 200 的 requests.Response，重试次数或总时限用尽时抛出最后一次的 RequestException
+        """
+        time_start = time.time()
+        for attempt in range(1, self.max_retries + 1):
+            timeout = self.timeout
+            if self.deadline:
+                remaining = self.deadline - (time.time() - time_start)
+                timeout = (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+            try:
+                response = self.post_json(payload, timeout=timeout)
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as e:
+                elapsed = time.time() - time_start
+                out_of_time = self.deadline and elapsed + self.retry_delay >= self.deadline
+                if attempt >= self.max_retries or out_of_time:
+                    logging.error(f"{self.service_url} 请求失败 {attempt} 次，用时 {elapsed:.1f} 秒，放弃重试: {e}")
+                    raise
+                logging.warning(f"{self.service_url} 第 {attempt} 次请求失败，{self.retry_delay} 秒后重试: {e}")
+                time.sleep(self.retry_delay)
+
+    def close(self):
+        self.session.close()
+
+
+def get_service_session(service_url, pool_size=4, timeout=90, connect_timeout=10, max_retries=3, retry_delay=3,
+                        deadline=None):
+    """
+    获取服务地址对应的共享会话，首次调用时创建，连接池、超时和重试设置以首次调用的参数为准。
+    :param service_url: 服务地址
+    :param pool_size: 连接池大小，一般与并发调用该服务的处理单元数量一致
+    :param timeout: 读取超时时间（秒）
+    :param connect_timeout: 建立连接的超时时间（秒）
+    :param max_retries: 单次调用的最大尝试次数
+    :param retry_delay: 重试之间的等待秒数
+    :param deadline: 单次调用（包括全部重试）的总时限（秒）
+    :return: ServiceSession
+    """
+    with _sessions_lock:
+        session = _sessions.get(service_url)
+        if session is None:
+            session = ServiceSession(service_url, pool_size=pool_size, timeout=timeout, connect_timeout=connect_timeout,
+                                     max_retries=max_retries, retry_delay=retry_delay, deadline=deadline)
+            _sessions[service_url] = session
+            logging.info(f"已创建 {service_url} 的共享会话，连接池大小 {pool_size}，超时 {timeout} 秒")
+        return session
+
+
+def get_session_for_config(service_config, config):
+    """
+    按服务配置（ocr_paddle_config、seal_config）获取共享会话，连接池大小默认为处理单元数量。
+    :param service_config: 服务配置
+    :param config: 完整配置，用于读取 workflow_config.num_workers
+    """
+    num_workers = max(int(config.get("workflow_config", {}).get("num_workers", 1)), 1)
+    return get_service_session(
+        service_config.get("service_url"),
+        pool_size=service_config.get("pool_size") or num_workers,
+        timeout=service_config.get("timeout", 90),
+        connect_timeout=service_config.get("connect_timeout", 10),
+        max_retries=service_config.get("max_retries", 3),
+        retry_delay=service_config.get("retry_delay", 3),
+        deadline=service_config.get("retry_deadline"),
+    )
+
+
+def log_endpoint_stats():
+    """输出所有服务地址的请求延迟统计"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        logging.info(session.stats.summary())
+
+
+def close_sessions():
+    """关闭所有共享会话的连接"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -11,7 +11,7 @@
 import json
 import logging
 import time
-from openai import OpenAI
+from models.client_pool import get_client_for_config
 from utils.utils import load_examples
 
 
@@ -144,25 +144,21 @@ from utils.utils import load_examples
 import json
 import logging
 import time
-from openai import OpenAI
 
 
 class LLM:
     def __init__(self, config):
         """初始化LLM"""
         self.key = ['当事人', '图斑编号', '建筑层数', '占地面积', '建筑面积']
+        self.llm_config = config.get("llm_config", {})
         self.service_url = config.get("llm_config", {}).get("service_url")
         self.model = config.get("llm_config", {}).get("model", "QwQ-32B")
         self.api_key = "EMPTY"  # 使用空字符串或任意值，因为 vLLM 不需要 API key
         self.prompt = []
 
     def init_client(self):
-        """初始化OpenAI客户端"""
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.service_url,
-        )
-        return client
+        """获取进程内共享的OpenAI客户端，复用长连接"""
+        return get_client_for_config(self.llm_config, api_key=self.api_key)
 
     def init_prompt(self):
         """初始化对话内容"""
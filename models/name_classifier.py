@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: name_classifier.py
+@Time    : 2025/4/15 上午10:30
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 当事人类型判断：先按机构名称后缀和自然人姓名规则判断，规则无法判断时再调用模型（VLM.judge_name_type），
+           模型的判断结果按规范化后的名称组合缓存在进程内（LRU）和结果缓存数据库（cache_config.name_type）中
+@Usage   : classifier = get_name_classifier(config)；name_type = classifier.classify(names)  # 0 自然人，1 企业或组织
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from utils.result_cache import get_result_cache, make_cache_key
+
+_classifiers = {}  # 模型服务地址 -> NameTypeClassifier
+_classifiers_lock = threading.Lock()
+
+# 机构名称后缀，名称以其结尾即判断为企业或组织
+ORG_SUFFIXES = (
+    "公司", "集团", "合作社", "联合社", "委员会", "村民小组", "局", "厅", "委", "办", "办公室", "办事处", "政府",
+    "街道", "管理处", "管理所", "派出所", "中心", "研究院", "设计院", "医院", "学校", "小学", "中学", "大学", "学院",
+    "幼儿园", "银行", "协会", "商会", "基金会", "事务所", "工作室", "厂", "场", "店", "商行", "经营部", "门市部",
+    "加工部", "服务部", "站", "馆", "社区", "教会", "寺", "庙", "祠堂",
+)
+# 名称中出现即判断为企业或组织的关键字
+ORG_KEYWORDS = ("有限", "股份", "公司", "集团", "合作社", "委员会", "人民政府", "（普通合伙）", "(普通合伙)")
+# 后缀可能与人名重名（如“张中心”），只对后缀前至少有两个字且总长至少 4 个字的名称使用，更短的名称由模型判断
+_MIN_ORG_LENGTH = 4
+_MIN_ORG_PREFIX = 2
+
+# 常见单姓和复姓，以其开头的 2 至 4 个汉字的名称判断为自然人
+SINGLE_SURNAMES = set(
+    "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟"
+    "谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤常温康施文牛樊葛邢"
+    "安齐易乔伍庞颜倪庄聂章鲁岳翟殷詹申欧耿关兰焦俞左柳甘祝包宁尚符舒阮柯纪梅童凌毕单季裴霍涂成苗谷盛曲翁冉骆蓝路"
+    "游辛靳管柴蒙鲍华喻祁蒲房滕屈饶解牟艾尤阳时穆农司卓古吉缪简车项连芦麦褚娄窦戚岑景党宫费卜冷晏席卫米柏宗瞿桂全"
+    "佟应臧闵苟邬边卞姬师和仇栾隋商刁沙荣巫寇桑郎甄丛仲虞敖巩明佘池查麻苑迟邝官封谈匡鞠惠荆乐冀郁胥南班储原栗燕楚"
+    "鄢劳谌奚皮粟冼蔺楼盘满闻位厉伊仝区郜海阚花权强帅屠豆朴盖练廉禹井祖漆巴丰支卿国狄平计索宣晋相初门云容敬来扈晁"
+    "芮都普阙浦戈伏鹿薄邸雍辜羊阿乌母裘亓修邰赫杭况那宿鲜印逯隆茹诸战慕危玉银亢嵇公哈湛宾戎勾茅利於呼居揭干但尉冶"
+    "斯元束檀衣信展阴昝智幸奉植衡富尧闭由"
+)
+COMPOUND_SURNAMES = ("欧阳", "司马", "上官", "诸葛", "东方", "皇甫", "尉迟", "公孙", "慕容", "长孙", "宇文", "司徒",
+                     "夏侯", "轩辕", "令狐", "钟离", "端木", "南宫", "西门", "独孤", "申屠", "澹台", "公冶", "濮阳")
+_CHINESE_NAME_PATTERN = re.compile(r"^[一-龥·]{2,5}$")
+
+
+def normalize_name(name):
+    """规范化当事人名称：去除空白，全角括号统一为半角括号"""
+    name = re.sub(r"\s+", "", str(name))
+    return name.replace("（", "(").replace("）", ")")
+
+
+def rule_name_type(name):
+    """
+    按规则判断单个名称的类型。
+    :param name: 规范化后的名称
+    :return: 0 表示自然人，1 表示企业或组织，无法判断时返回 None
+    """
+    if any(keyword in name for keyword in ORG_KEYWORDS):
+        return 1
+    for suffix in ORG_SUFFIXES:
+        if name.endswith(suffix):
+            if len(name) >= max(_MIN_ORG_LENGTH, len(suffix) + _MIN_ORG_PREFIX):
+                return 1
+            # 以机构后缀结尾的短名称既可能是机构也可能是人名，不按姓氏规则判断
+            return None
+    if _CHINESE_NAME_PATTERN.match(name):
+        for surname in COMPOUND_SURNAMES:
+            if name.startswith(surname) and 3 <= len(name) <= 4:
+                return 0
+        if name[0] in SINGLE_SURNAMES and 2 <= len(name) <= 4:
+            return 0
+    return None
+
+
+class NameTypeClassifier:
+    def __init__(self, config, max_entries=4096):
+        """
+        初始化当事人类型判断器。
+        :param config: 完整配置，规则无法判断时使用其中的 vlm_config 创建 VLM 实例
+        :param max_entries: 进程内缓存的最大名称组合数
+        """
+        self.config = config
+        self.model = config.get("vlm_config", {}).get("model", "Qwen2.5-VL-32B")
+        self.max_entries = max_entries
+        self.cache = get_result_cache(config, "name_type")  # 模型判断结果的持久化缓存，未开启时为 None
+        self.lock = threading.Lock()
+        self._memory = OrderedDict()  # 规范化后的名称组合 -> 类型，按最近使用排序
+        self.stats = {"rule": 0, "cache": 0, "model": 0}  # 各判断来源的命中次数，读写均在 self.lock 下进行
+
+    def _count(self, source):
+        with self.lock:
+            self.stats[source] += 1
+
+    def _memory_get(self, key):
+        with self.lock:
+            if key not in self._memory:
+                return None
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+    def _memory_set(self, key, name_type):
+        with self.lock:
+            self._memory[key] = name_type
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _judge_by_model(self, names):
+        """调用模型判断，只缓存有效的结果（0 或 1）"""
+        from models.vlm_extraction import VLM
+
+        cache_key = make_cache_key(list(names), self.model, VLM.PROMPT_VERSION) if self.cache is not None else None
+        if cache_key is not None:
+            name_type = self.cache.get(cache_key)
+            if name_type is not None:
+                self._count("cache")
+                self._memory_set(names, name_type)
+                return name_type
+
+        self._count("model")
+        name_type = VLM(self.config).judge_name_type(list(names))
+        if name_type in (0, 1):
+            self._memory_set(names, name_type)
+            if cache_key is not None:
+                self.cache.set(cache_key, name_type)
+        return name_type
+
+    def classify(self, names):
+        """
+        判断当事人类型。任一名称为机构时为企业或组织，全部名称为自然人时为自然人，其余情况由模型判断。
+        :param names: 当事人名称列表
+        :return: 0 表示自然人，1 表示企业或组织，无法判断时返回 None
+        """
+        names = tuple(sorted({normalize_name(name) for name in names or [] if name and normalize_name(name)}))
+        if not names:
+            return None
+
+        rule_types = [rule_name_type(name) for name in names]
+        if 1 in rule_types:
+            self._count("rule")
+            return 1
+        if all(name_type == 0 for name_type in rule_types):
+            self._count("rule")
+            return 0
+
+        name_type = self._memory_get(names)
+        if name_type is not None:
+            self._count("cache")
+            return name_type
+        logging.info(f"当事人 {list(names)} 无法按规则判断类型，使用模型判断")
+        return self._judge_by_model(names)
+
+
+def get_name_classifier(config):
+    """获取进程内共享的当事人类型判断器，同一模型服务的判断结果在各任务之间共享"""
+    key = config.get("vlm_config", {}).get("service_url")
+    with _classifiers_lock:
+        classifier = _classifiers.get(key)
+        if classifier is None:
+            classifier = NameTypeClassifier(config)
+            _classifiers[key] = classifier
+        return classifier
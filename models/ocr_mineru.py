@@ -12,6 +12,7 @@ import logging
 import os
 import json
 import sys
+from importlib.metadata import PackageNotFoundError, version
 
 from magic_pdf.config.enums import SupportedPdfParseMethod
 from magic_pdf.data.data_reader_writer import FileBasedDataReader, FileBasedDataWriter
@@ -20,10 +21,22 @@ from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
 from magic_pdf.data.read_api import read_local_images
 from loguru import logger
 
+from utils.result_cache import file_sha256, get_result_cache, make_cache_key
+
 logger.remove(0)  # 移除默认的日志处理器
 logger.add(sys.stderr, level="CRITICAL")  # 只输出 CRITICAL 级别的日志
 
+def _engine_version():
+    """MinerU（magic-pdf）的版本，作为 OCR 缓存键的一部分，升级后旧的解析结果自动失效"""
+    try:
+        return version("magic-pdf")
+    except PackageNotFoundError:
+        return "unknown"
+
+
 class MinerUOCR:
+    ENGINE_VERSION = _engine_version()
+
     def __init__(self, config):
         """
         初始化 OCR 处理器。
@@ -34,6 +47,7 @@ class MinerUOCR:
         self.output_dir = os.path.join(config.get("data_config", {}).get("output_dir"), "miner")
         self.image_dir = os.path.join(self.output_dir, "images")
         self.delete_files = config.get("data_config", {}).get("delete_files")
+        self.cache = get_result_cache(config, "ocr")  # 解析结果缓存，未开启时为 None
         self._prepare_directories()
         self._initialize_readers_writers()
         # logging.info(f"OCR 处理器已初始化，输出目录为 {self.output_dir}")
@@ -172,15 +186,28 @@ class MinerUOCR:
         """
         file_name = os.path.basename(input_path)
         name_without_suff = os.path.splitext(file_name)[0]
+        if not input_path.lower().endswith((".pdf", ".jpg", ".jpeg", ".png", ".bmp")):
+            logging.error(f"不支持的文件类型：{input_path}")
+            return None
+
+        # 相同内容的文件直接使用缓存的 content_list，不再重复解析
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(file_sha256(input_path), "mineru", self.ENGINE_VERSION,
+                                       self.config.get("model"))
+            json_content = self.cache.get(cache_key)
+            if json_content is not None:
+                logging.info(f"文件 {file_name} 命中 MinerU 解析结果缓存")
+                return self._convert_to_llm_format(json_content, file_name, llm_text=llm_text)
+
         if input_path.lower().endswith(".pdf"):
             pipe_result = self._process_pdf(input_path)
-        elif input_path.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
-            pipe_result = self._process_image(input_path)
         else:
-            logging.error(f"不支持的文件类型：{input_path}")
-            return None
+            pipe_result = self._process_image(input_path)
 
         md_content, json_content = self._save_files(pipe_result, name_without_suff)
+        if cache_key is not None:
+            self.cache.set(cache_key, json_content)
 
         llm_results = self._convert_to_llm_format(json_content, file_name, llm_text=llm_text)
         return llm_results
@@ -12,11 +12,11 @@ import logging
 import os
 import json
 import base64
-import time
 
-import requests
 # from modelscope.models.multi_modal.vldoc.conv_fpn_trans import logging
-from pdf2image import convert_from_path
+from models.http_session import get_session_for_config
+from utils.rasterizer import get_rasterizer
+from utils.result_cache import file_sha256, get_result_cache, make_cache_key
 
 
 class PaddleOCR:
@@ -30,6 +30,12 @@ class PaddleOCR:
         self.image_dir = os.path.join(self.output_dir , "images")
         self.service_url = config.get("ocr_paddle_config", {}).get("service_url")
         self.delete_files = config.get("data_config", {}).get("delete_files")
+        self.pdf_dpi = config.get("ocr_paddle_config", {}).get("pdf_dpi", 200)  # PDF 渲染分辨率
+        self.rasterizer = get_rasterizer(config)
+        self.session = get_session_for_config(config.get("ocr_paddle_config", {}), config)  # 共享连接池和超时
+        self.pipeline = config.get("ocr_paddle_config", {}).get("pipeline", "OCR")
+        self.engine_version = config.get("ocr_paddle_config", {}).get("engine_version", "")  # 服务端 PaddleX 版本，升级后修改使缓存失效
+        self.cache = get_result_cache(config, "ocr")  # 识别结果缓存，未开启时为 None
         self._prepare_directories()
         # logging.info(f"OCR 处理器已初始化，服务器地址为： {self.service_url}")
 
@@ -38,12 +44,11 @@ class PaddleOCR:
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.image_dir, exist_ok=True)
 
-    def _call_ocr_service(self, image_path, max_retries=10, delay=3):
+    def _call_ocr_service(self, image_path):
         """
-        调用 OCR 服务，获取文字检测结果。
+        调用 OCR 服务，获取文字检测结果。重试次数和总时限由 ocr_paddle_config 的 max_retries、retry_deadline 设置，
+        用尽后抛出异常。
         :param image_path: 输入图片路径
-        :param max_retries: 最大重试次数
-        :param delay: 每次重试之间的延迟秒数
         :return: OCR 结果（包含文字边界框和内容）
         """
         with open(image_path, "rb") as file:
@@ -52,39 +57,17 @@ class PaddleOCR:
 
         payload = {"file": file_data, "fileType": 1}  # fileType=1 表示图像文件
 
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(self.service_url, json=payload, timeout=(30, 90))
-
-                if response.status_code != 200:
-                    logging.error(f"请求失败，状态代码 {response.status_code}: {response.text}")
-
-                ocr_result = response.json()
-                # print(f"OCR 结果已获取：{image_path}")
-                return ocr_result
-
-            except Exception as e:
-                logging.error(f"尝试 {attempt + 1} 次,失败: {e}")
-                if attempt < max_retries - 1:
-                    logging.info(f"在 {delay} 秒后重试...")
-                    time.sleep(delay)
-                else:
-                    logging.error("达到最大重试次数。")
-                    raise
+        response = self.session.post_json_retry(payload)
+        return response.json()
 
     def _convert_pdf_to_images(self, pdf_path):
         """
-        将 PDF 转换为图像列表。
+        将 PDF 转换为图像。
         :param pdf_path: 输入 PDF 文件路径
-        :return: 图像路径列表
+        :return: 图像路径的生成器，按需逐页渲染
         """
-        images = convert_from_path(pdf_path)
-        image_paths = []
-        for i, image in enumerate(images):
-            image_path = os.path.join(self.image_dir, f"page_{i + 1}.jpg")
-            image.save(image_path, "JPEG")
-            image_paths.append(image_path)
-        return image_paths
+        # 页面图像由渲染服务按页并行渲染，并在各模型之间共享
+        return self.rasterizer.iter_pages(pdf_path, dpi=self.pdf_dpi)
 
     def _save_results(self, results, name_without_suff):
         """
@@ -248,17 +231,30 @@ class PaddleOCR:
         """
         file_name = os.path.basename(input_path)
         name_without_suff = os.path.splitext(file_name)[0]
-        if input_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-            # print("处理图像文件...")
-            results = self._process_image(input_path)
-            llm_data = self._convert_to_llm_format(results, file_name, is_pdf=False, llm_text=llm_text)
-        elif input_path.lower().endswith('.pdf'):
-            # print("处理 PDF 文件...")
-            results = self._process_pdf(input_path)
-            llm_data = self._convert_to_llm_format(results, file_name, is_pdf=True, llm_text=llm_text)
-        else:
+        is_pdf = input_path.lower().endswith('.pdf')
+        if not is_pdf and not input_path.lower().endswith(('.jpg', '.jpeg', '.png')):
             raise ValueError("不支持的文件类型，请提供图像或 PDF 文件。")
 
+        # 相同内容的文件直接使用缓存的识别结果（rec_texts 和 rec_polys），不再重复请求 OCR 服务
+        cache_key, results = None, None
+        if self.cache is not None:
+            cache_key = make_cache_key(file_sha256(input_path), "paddle", self.pipeline, self.engine_version,
+                                       self.pdf_dpi if is_pdf else None)
+            results = self.cache.get(cache_key)
+            if results is not None:
+                logging.info(f"文件 {file_name} 命中 PaddleOCR 识别结果缓存")
+
+        if results is None:
+            if is_pdf:
+                # print("处理 PDF 文件...")
+                results = self._process_pdf(input_path)
+            else:
+                # print("处理图像文件...")
+                results = self._process_image(input_path)
+            if cache_key is not None:
+                self.cache.set(cache_key, results)
+        llm_data = self._convert_to_llm_format(results, file_name, is_pdf=is_pdf, llm_text=llm_text)
+
         if not self.delete_files:
              self._save_results(results, name_without_suff)
 
@@ -6,15 +6,15 @@
 @Author  : ZhouFei
 @Email   : zhoufei.net@gmail.com
 @Desc    : 使用 PaddleX 框架的印章识别产线检测佐证材料中的印章
-@Usage   : 提取印章内容并判断是否包含合法公章
+@Usage   : 提取印章内容并判断是否包含合法公章；每个任务使用新的实例，开启 early_exit 后任务中识别到可信的印章即停止请求服务
 """
 import json
 import logging
 import os
 import base64
-import time
-import requests
-from pdf2image import convert_from_path
+from models.http_session import get_session_for_config
+from utils.rasterizer import get_rasterizer
+from utils.result_cache import file_sha256, get_result_cache, make_cache_key
 
 class SealExtractor:
     def __init__(self, config):
@@ -27,6 +27,16 @@ class SealExtractor:
         self.service_url = config.get("seal_config",{}).get("service_url")
         self.delete_files = config.get("data_config", {}).get("delete_files")
         self.pdf_max_pages = config.get("vlm_config", {}).get("pdf_max_pages", 10)
+        self.pdf_dpi = config.get("seal_config", {}).get("pdf_dpi", 200)  # PDF 渲染分辨率
+        self.rasterizer = get_rasterizer(config)
+        self.session = get_session_for_config(config.get("seal_config", {}), config)  # 共享连接池和超时
+        self.pipeline = config.get("seal_config", {}).get("pipeline", "seal_recognition")
+        self.engine_version = config.get("seal_config", {}).get("engine_version", "")  # 服务端 PaddleX 版本，升级后修改使缓存失效
+        self.early_exit = config.get("seal_config", {}).get("early_exit", False)  # 识别到可信的印章后是否停止识别
+        self.min_score = config.get("seal_config", {}).get("min_score", 0.8)  # 可信印章的最低识别分数
+        self.cache = get_result_cache(config, "seal")  # 单张图像的识别结果缓存，未开启时为 None
+        self.seal_found = False  # 当前任务中是否已识别到可信的印章
+        self.skipped = 0  # 提前结束而跳过的图像数
         self._prepare_directories()
         # logging.info(f"Seal 服务已经初始化，服务器地址为： {self.service_url}")
 
@@ -36,12 +46,10 @@ class SealExtractor:
         os.makedirs(self.image_dir, exist_ok=True)
 
 
-    def _call_seal_recognition_service(self, image_path, max_retries=10, delay=3):
+    def _call_seal_recognition_service(self, image_path):
         """
-        调用印章识别服务。
+        调用印章识别服务，重试次数和总时限由 seal_config 的 max_retries、retry_deadline 设置，用尽后抛出异常。
         :param image_path: 输入图像的路径
-        :param max_retries: 最大重试次数
-        :param delay: 每次重试之间的延迟秒数
         :return: 识别结果
         """
         with open(image_path, "rb") as file:
@@ -53,47 +61,50 @@ class SealExtractor:
             "fileType": 1  # 图像文件类型（1 表示图片）
         }
 
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(self.service_url, json=payload)
-                response.raise_for_status()
-                result = response.json()
-                # print("印章识别成功：")
-                return result
-            except requests.exceptions.RequestException as e:
-                logging.error(f"尝试 {attempt + 1} 次,失败: {e}")
-                if attempt < max_retries - 1:
-                    logging.info(f"在 {delay} 秒后重试...")
-                    time.sleep(delay)
-                else:
-                    logging.error("达到最大重试次数。")
-                    raise
+        response = self.session.post_json_retry(payload)
+        return response.json()
 
     def _convert_pdf_to_images(self, pdf_path):
         """
-        将 PDF 转换为图像列表。
+        将 PDF 转换为图像，只渲染前 pdf_max_pages 页。
         :param pdf_path: 输入 PDF 文件路径
-        :return: 图像列表
+        :return: 图像路径的生成器，按需逐页渲染
         """
-        images = convert_from_path(pdf_path)
-        image_paths = []
-        for i, image in enumerate(images):
-            image_path = os.path.join(self.image_dir, f"page_{i + 1}.jpg")
-            image.save(image_path, "JPEG")
-            image_paths.append(image_path)
-
-        if self.pdf_max_pages is not None:
-            image_paths = image_paths[:self.pdf_max_pages]
-
-        return image_paths
+        # 页面图像由渲染服务按页并行渲染，并在各模型之间共享
+        return self.rasterizer.iter_pages(pdf_path, dpi=self.pdf_dpi, max_pages=self.pdf_max_pages)
+
+    @staticmethod
+    def _prune_result(result):
+        """只保留判断印章需要的字段（text_type、rec_texts、rec_scores），减小缓存体积"""
+        seal_rec_results = []
+        for item in result.get("result", {}).get("sealRecResults", []):
+            seal_res_list = [
+                {key: seal_res.get(key) for key in ("text_type", "rec_texts", "rec_scores") if key in seal_res}
+                for seal_res in item.get("prunedResult", {}).get("seal_res_list", [])
+            ]
+            seal_rec_results.append({"prunedResult": {"seal_res_list": seal_res_list}})
+        return {"result": {"sealRecResults": seal_rec_results}}
+
+    def _has_confident_seal(self, result):
+        """识别结果中是否有分数不低于 min_score 的印章"""
+        return any((item["seal_score"] or 0) >= self.min_score for item in self._convert_to_llm_format(result))
 
     def _process_image(self, image_path):
         """
-        处理单个图像文件。
+        处理单个图像文件，先按图像内容哈希查询缓存。
         :param image_path: 输入图像路径
         :return: 印章识别结果
         """
-        result = self._call_seal_recognition_service(image_path)
+        cache_key, result = None, None
+        if self.cache is not None:
+            cache_key = make_cache_key(file_sha256(image_path), "seal", self.pipeline, self.engine_version)
+            result = self.cache.get(cache_key)
+        if result is None:
+            result = self._call_seal_recognition_service(image_path)
+            if cache_key is not None and result:
+                self.cache.set(cache_key, self._prune_result(result))
+        if result and self._has_confident_seal(result):
+            self.seal_found = True
         return result
 
     def _process_pdf(self, pdf_path):
@@ -104,10 +115,14 @@ class SealExtractor:
         """
         image_paths = self._convert_pdf_to_images(pdf_path)
         results = []
-        for image_path in image_paths:
-            result = self._call_seal_recognition_service(image_path)
+        for page_no, image_path in enumerate(image_paths, start=1):
+            result = self._process_image(image_path)
             if result:
                 results.append(result)
+            if self.early_exit and self.seal_found:
+                # 后续页面不再渲染和识别
+                logging.info(f"{os.path.basename(pdf_path)} 第 {page_no} 页识别到印章，跳过剩余页面")
+                break
 
         # 删除生成的文件，释放空间
         if os.path.exists(self.image_dir):
@@ -160,6 +175,11 @@ class SealExtractor:
         主流程：处理输入文件（图像或 PDF）。
         """
         name_without_suff = os.path.splitext(os.path.basename(input_path))[0]
+        if self.early_exit and self.seal_found:
+            # 工作流只需要判断任务中是否有印章，已识别到可信的印章时跳过剩余文件
+            self.skipped += 1
+            logging.info(f"任务中已识别到印章，跳过文件 {os.path.basename(input_path)}")
+            return []
         if input_path.lower().endswith(('.jpg', '.jpeg', '.png')):
             # print("处理图像文件...")
             results = self._process_image(input_path)
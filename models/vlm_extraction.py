@@ -15,28 +15,56 @@ import os
 import time
 import json
 import base64
-from collections import Counter
-
-import nltk
-import tiktoken
-from nltk.tokenize import sent_tokenize
-
-# 下载NLTK数据
-# nltk.download('punkt')
-from openai import OpenAI, OpenAIError
-from pdf2image import convert_from_path
+import hashlib
+import math
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from openai import OpenAIError
 from PIL import Image
+from models.client_pool import get_client_for_config
+from utils.rasterizer import get_rasterizer
+from utils.result_cache import get_result_cache, make_cache_key
+from utils.text_chunker import get_text_chunker
 Image.MAX_IMAGE_PIXELS = 1000000000
 
 class VLM:
+    PROMPT_VERSION = 1  # 修改 _vlm_service 中的系统提示或请求参数时递增，使已缓存的识别结果失效
+
     def __init__(self, config):
         self.config = config.get("vlm_config", {})
         self.output_dir = os.path.join(config.get("data_config", {}).get("output_dir"), "vlm")
         self.image_dir = os.path.join(self.output_dir, "images")
+        self.delete_files = config.get("data_config", {}).get("delete_files")
         self._prepare_directories()
         self.service_url = self.config.get("service_url")
         self.model = self.config.get("model", "Qwen2.5-VL-32B")
         self.pdf_max_pages = self.config.get("pdf_max_pages", 10)
+        self.pdf_dpi = self.config.get("pdf_dpi", 200)  # PDF 渲染分辨率
+        self.pdf_page_mode = self.config.get("pdf_page_mode", "sequential")  # PDF 页面处理方式: sequential、concurrent 或 batch
+        self.pdf_max_inflight = max(int(self.config.get("pdf_max_inflight", 4)), 1)  # 并发模式下同时请求的最大页数（批次数）
+        self.batch_max_images = max(int(self.config.get("batch_max_images", 1)), 1)  # 单次请求最多打包的图像数，1 表示不打包
+        self.batch_max_visual_tokens = self.config.get("batch_max_visual_tokens", 6144)  # 单次请求的视觉 token 预算
+        self.batch_image_size = self.config.get("batch_image_size", 1280)  # 打包时照片压缩后的最大边长
+        # 视觉 token 预算：按图像类型（文档、照片）限制每张图像的视觉 token 数
+        visual_budget = self.config.get("visual_budget", {})
+        self.visual_budget_enabled = visual_budget.get("enabled", False)
+        self.visual_max_tokens = {
+            "document": visual_budget.get("document_max_tokens", 2560),  # 扫描件、表格等文字密集的页面
+            "photo": visual_budget.get("photo_max_tokens", 1024),  # 现场照片
+        }
+        self.visual_min_tokens = visual_budget.get("min_tokens", 256)
+        self.send_pixel_limits = visual_budget.get("send_pixel_limits", True)  # 是否通过 mm_processor_kwargs 发送像素上下限
+        self.rasterizer = get_rasterizer(config)
+        self.cache = get_result_cache(config, "vlm")  # 页面识别结果缓存，未开启时为 None
+        # 文本分块：tokenizer 默认从模型目录加载，上下文预算包括 prompt 和 completion
+        self.chunker = get_text_chunker(self.config.get("tokenizer_dir", self.config.get("model_dir")))
+        self.text_max_tokens = self.config.get("text_max_tokens", 5120)
+        self.text_completion_tokens = self.config.get("text_completion_tokens", 512)
+        self.text_max_inflight = max(int(self.config.get("text_max_inflight", 4)), 1)  # 同时请求的最大分块数
+        self.text_chunk_retries = max(int(self.config.get("text_chunk_retries", 1)), 0)  # 分块失败后的重试次数
         self.key = ['公章', '当事人', '图斑编号', '建筑层数', '占地面积', '建筑面积']
         self.api_key = "EMPTY"  # 使用空字符串或任意值，因为 vLLM 不需要 API key
         # logging.info(f"VLM 服务已经初始化，服务器地址为： {self.service_url}")
@@ -44,12 +72,8 @@ class VLM:
         self.last_result = None  # 添加变量用于记录上一次模型识别的结果
 
     def init_client(self):
-        """初始化OpenAI客户端"""
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.service_url,
-        )
-        return client
+        """获取进程内共享的OpenAI客户端，复用长连接"""
+        return get_client_for_config(self.config, api_key=self.api_key)
 
     def _prepare_directories(self):
         """创建必要的输出目录"""
@@ -82,47 +106,93 @@ class VLM:
             image = image.resize((new_width, new_height), Image.LANCZOS)
         return image
 
-    def _compress_image(self, input_path, output_path, quality=100, max_size=2048):
-        """压缩图像文件并保存为 JPEG 格式"""
-        with Image.open(input_path) as img:
-            # 转换为 RGB 模式（如果图像是 PNG 或其他模式）
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+    @staticmethod
+    def _classify_image(image):
+        """
+        粗略区分图像类型：文档扫描件背景接近白色且颜色饱和度低，其余视为照片。
+        在 128 像素的缩略图上统计，用时可以忽略。
+        :param image: RGB 图像
+        :return: "document" 或 "photo"
+        """
+        thumb = image.copy()
+        thumb.thumbnail((128, 128))
+        gray = thumb.convert("L").histogram()
+        total = max(sum(gray), 1)
+        bright_ratio = sum(gray[200:]) / total
+        saturation = thumb.convert("HSV").getchannel("S").histogram()
+        mean_saturation = sum(i * count for i, count in enumerate(saturation)) / total
+        return "document" if bright_ratio >= 0.5 and mean_saturation < 40 else "photo"
+
+    @staticmethod
+    def _fit_visual_tokens(image, max_tokens):
+        """
+        等比缩放图像，使视觉 token 数（每 28x28 像素一个 token）不超过 max_tokens，边长对齐到 28 的倍数。
+        """
+        width, height = image.size
+        if math.ceil(width / 28) * math.ceil(height / 28) <= max_tokens:
+            return image
+        scale = math.sqrt(max_tokens * 28 * 28 / (width * height))
+        new_width = max(int(width * scale) // 28 * 28, 28)
+        new_height = max(int(height * scale) // 28 * 28, 28)
+        return image.resize((new_width, new_height), Image.LANCZOS)
+
+    def _compress_image(self, input_path, quality=100, max_size=2048, output_path=None, image_type=None):
+        """
+        在内存中压缩图像：读取一次，等比缩放后编码为 JPEG，再转换为 base64 字符串。
+        开启视觉 token 预算时，再按图像类型的预算缩放。
+        :param input_path: 输入图像路径
+        :param quality: JPEG 质量
+        :param max_size: 最大边长
+        :param output_path: 压缩后图像的保存路径，为空时不写入磁盘
+        :param image_type: 图像类型（document 或 photo），为空时自动判断
+        :return: base64 字符串，失败时返回空字符串
+        """
+        try:
+            with Image.open(input_path) as img:
+                # 转换为 RGB 模式（如果图像是 PNG 或其他模式）
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
                 # 等比缩放图像
-            max_size = max(max_size, 512)
-            img = self._resize_image(img, max_size=max_size)
-            # 保存为 JPEG 格式，指定质量
-            img.save(output_path, "JPEG", quality=quality)
+                max_size = max(max_size, 512)
+                img = self._resize_image(img, max_size=max_size)
+                if self.visual_budget_enabled:
+                    image_type = image_type or self._classify_image(img)
+                    img = self._fit_visual_tokens(img, self.visual_max_tokens[image_type])
+                # 编码为 JPEG 格式，指定质量
+                buffer = BytesIO()
+                img.save(buffer, "JPEG", quality=quality)
+        except Exception as e:
+            logging.error(f"压缩图像 {input_path} 时发生错误：{e}")
+            return ""
+        image_bytes = buffer.getvalue()
+        if output_path:
+            with open(output_path, "wb") as image_file:
+                image_file.write(image_bytes)
+        return base64.b64encode(image_bytes).decode('utf-8')
 
-    def _convert_pdf_to_images(self, pdf_path):
+    def _encode_pdf_pages(self, pdf_path):
         """
-        将 PDF 转换为图像列表。
+        将 PDF 页面压缩并编码为 base64，只渲染前 pdf_max_pages 页。
+        只有不删除文件（delete_files 为 False）时才将压缩后的页面保存到磁盘，便于排查。
         :param pdf_path: 输入 PDF 文件路径
-        :return: 图像路径列表
+        :return: (页面图像路径, base64 字符串) 的生成器，按需逐页渲染并压缩
+        """
+        # 页面图像由渲染服务按页并行渲染，并在各模型之间共享
+        page_paths = self.rasterizer.iter_pages(pdf_path, dpi=self.pdf_dpi, max_pages=self.pdf_max_pages)
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        for i, page_path in enumerate(page_paths):
+            output_path = None
+            if not self.delete_files:
+                output_path = os.path.join(self.image_dir, f"{pdf_name}_compressed_page_{i + 1}.jpg")
+            # 压缩图像并调整分辨率，PDF 页面按文档的视觉 token 预算缩放
+            yield page_path, self._compress_image(page_path, quality=80, max_size=2048, output_path=output_path,
+                                                  image_type="document")
+
+    def _vlm_service(self, prompt, max_retries=5, delay=3, initial_quality=80, is_image_request=True, image_path=None):
+        """
+        调用模型
+        :param image_path: 图像请求的原始图像路径，请求失败时据此降低质量重新压缩
         """
-        images = convert_from_path(pdf_path)
-        image_paths = []
-        for i, image in enumerate(images):
-            # 生成图像路径
-            image_path = os.path.join(self.image_dir, f"page_{i + 1}.jpg")
-
-            # 保存图像为 JPEG 格式
-            image.save(image_path, "JPEG")
-
-            # 压缩图像并调整分辨率
-            compressed_image_path = os.path.join(self.image_dir, f"compressed_page_{i + 1}.jpg")
-            self._compress_image(image_path, compressed_image_path, quality=80, max_size=2048)
-
-            # 替换为压缩后的图像路径
-            image_paths.append(compressed_image_path)
-
-            # 删除原始图像
-            os.remove(image_path)
-
-        return image_paths
-
-    def _vlm_service(self, prompt, max_retries=5, delay=3, initial_quality=80, is_image_request=True):
-        """调用模型"""
 
         # 如果有上一次的结果，将其作为上下文信息添加到prompt中
         if self.last_result:
@@ -161,34 +231,30 @@ class VLM:
                     temperature=0.0,
                     top_p=1.0,
                     max_tokens=512,
-                    extra_body={
-                        "repetition_penalty": 1.05,
-                    },
+                    extra_body=self._extra_body(is_image_request),
                 )
                 response_data = response.choices[0].message.content
+                self._log_usage(response, prompt)
                 return response_data
             except Exception as e:
                 logging.error(f"请求失败，正在重试（{attempt + 1}/{max_retries}）... 错误信息：{e}")
                 if attempt < max_retries - 1 and is_image_request:
-                    # 在重试之前，尝试重新压缩图像并转换为Base64
-                    if hasattr(self, '_image_path') and callable(self._process_image):  # 确保存在_image_path和_process_image方法
-                        image_path = getattr(self, '_image_path', None)  # 获取_image_path属性的值
-                        if image_path:
-                            # 逐步降低图像质量
-                            current_quality = max(current_quality - 20, min_quality)
-                            logging.info(f"尝试重新压缩图像，降低质量：{current_quality}，图像最大分辨率：{512 * max_size_ratio}")
-                            compressed_image_path = os.path.join(self.image_dir, f"compressed_{current_quality}.jpg")
-                            self._compress_image(image_path, compressed_image_path, quality=current_quality, max_size=512*max_size_ratio)
-                            encoded_image = self._encode_image(compressed_image_path)
-                            if encoded_image:
-                                # 更新prompt中的图像URL
-                                prompt[0] = {
-                                    "type": "image_url",
-                                    "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
-                                }
-                                messages[1]["content"] = prompt
-                            else:
-                                logging.error("重新压缩图像并转换为Base64失败。")
+                    # 在重试之前，尝试在内存中重新压缩图像并转换为Base64
+                    if image_path:
+                        # 逐步降低图像质量
+                        current_quality = max(current_quality - 20, min_quality)
+                        logging.info(f"尝试重新压缩图像，降低质量：{current_quality}，图像最大分辨率：{512 * max_size_ratio}")
+                        encoded_image = self._compress_image(image_path, quality=current_quality,
+                                                             max_size=512 * max_size_ratio)
+                        if encoded_image:
+                            # 更新prompt中的图像URL
+                            prompt[0] = {
+                                "type": "image_url",
+                                "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
+                            }
+                            messages[1]["content"] = prompt
+                        else:
+                            logging.error("重新压缩图像并转换为Base64失败。")
                     time.sleep(delay)
                     delay *= 1  # 每次重试增加延迟
                     max_size_ratio -= 1
@@ -196,51 +262,266 @@ class VLM:
                     logging.error("请求失败，已超过最大重试次数。")
                     return ""
 
-    def _process_image(self, image_path):
-        """处理图像文件"""
-        # 设置_image_path属性
-        self._image_path = image_path
-
-        # 将图像文件编码为 base64 字符串
-        encoded_image = self._encode_image(image_path)
-        if encoded_image:
-            prompt = [
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
+    def _extra_body(self, is_image_request):
+        """
+        vLLM 的额外请求参数。开启视觉 token 预算时，通过 mm_processor_kwargs 限制服务端缩放后的像素范围，
+        上限为文档预算，作为本地缩放之外的保护。
+        """
+        extra_body = {"repetition_penalty": 1.05}
+        if is_image_request and self.visual_budget_enabled and self.send_pixel_limits:
+            extra_body["mm_processor_kwargs"] = {
+                "min_pixels": self.visual_min_tokens * 28 * 28,
+                "max_pixels": max(self.visual_max_tokens.values()) * 28 * 28,
+            }
+        return extra_body
 
-                },
-                {"type": "text", "text": f"""要抽取的关键信息：{self.key}, 其中公章为bool类型，只要有公章则为True；
+    @staticmethod
+    def _log_usage(response, prompt):
+        """记录每次请求实际使用的 prompt token 数，用于权衡准确率和吞吐"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        images = sum(1 for part in prompt if isinstance(part, dict) and part.get("type") == "image_url")
+        logging.info(f"VLM 请求 {images} 张图像，prompt tokens {usage.prompt_tokens}，"
+                     f"completion tokens {usage.completion_tokens}")
+
+    def _image_instruction(self):
+        """图像抽取的指令文本"""
+        return f"""要抽取的关键信息：{self.key}, 其中公章为bool类型，只要有公章则为True；
                                     当事人最多不超过五个，其它字段唯一；
                                     建筑层数、占地面积和建筑面积均以数字表示，单位固定为平方米。若原始数据中出现其他单位，请自动转换为平方米，最终结果中不附加任何单位，若有小数部分，请保留小数。
                                     对于占地面积和建筑面积，无需进行推导计算，直接输出明确的结果。
                                     图斑编号的格式为：HZJGZWYYYYMM-XXXXXXXXXXXXZNNNN，即不是身份证号，也不是农宅施编号，严格以HZJGZW开头的编号格式。
                                     文档可能包含竖着和横着两个方向的文本，请确保能够抽取所有方向的关键信息。
                                     在返回结果时使用json格式，包含多个key-value对，key值为我指定的关键信息值唯一，value值为所抽取的结果。
-                                    如果认为图像中没有关键信息key，则将value赋值为“null”。请只输出json格式的结果，不要包含其它多余文字！"""}
-            ]
+                                    如果认为图像中没有关键信息key，则将value赋值为“null”。请只输出json格式的结果，不要包含其它多余文字！"""
+
+    @staticmethod
+    def _image_sha256(encoded_image):
+        return hashlib.sha256(encoded_image.encode("ascii")).hexdigest()
+
+    def _cache_key(self, encoded_image, batch=None, index=None):
+        """
+        图像识别结果的缓存键：发送的图像内容的 SHA-256、指令文本、上一次的结果（上下文）、模型名称和 prompt 版本。
+        打包请求的结果来自返回数组的 prompt，键中另外包含 prompt 模式、批次中全部图像的 SHA-256 和图像位置，
+        不会被单张请求读取。缓存未开启时返回 None。
+        :param encoded_image: 发送的图像 base64 字符串
+        :param batch: 打包请求的 (图像路径, base64 字符串) 列表，单张请求时为 None
+        :param index: 图像在批次中的位置
+        """
+        if self.cache is None:
+            return None
+        parts = [self._image_sha256(encoded_image), self._image_instruction(), self.last_result, self.model,
+                 self.PROMPT_VERSION]
+        if batch is not None:
+            parts += ["batch", [self._image_sha256(encoded) for _, encoded in batch], index]
+        return make_cache_key(*parts)
+
+    def _cache_lookup(self, key):
+        """读取缓存的原始结果字符串，未命中时返回 None"""
+        if key is None:
+            return None
+        return self.cache.get(key)
+
+    def _cache_store(self, key, response_data):
+        """只缓存可以解析为 JSON 的结果，请求失败或格式错误的结果下次重新请求"""
+        if key is None or not response_data:
+            return
+        try:
+            json.loads(response_data.strip("```").strip("json").strip())
+        except json.JSONDecodeError:
+            return
+        self.cache.set(key, response_data)
 
-            results = self._vlm_service(prompt, max_retries=5, delay=3, is_image_request=True)
+    def _request_image(self, image_path, encoded_image):
+        """请求模型识别单张图像，不经过缓存"""
+        prompt = [
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
 
+            },
+            {"type": "text", "text": self._image_instruction()}
+        ]
+        return self._vlm_service(prompt, max_retries=5, delay=3, is_image_request=True, image_path=image_path)
+
+    def _process_image(self, image_path, encoded_image=None):
+        """
+        处理图像文件，先查询结果缓存，未命中时请求模型并缓存结果
+        :param image_path: 图像路径，请求失败时据此重新压缩
+        :param encoded_image: 已在内存中压缩编码的 base64 字符串，为空时直接编码原始文件
+        """
+        # 将图像文件编码为 base64 字符串
+        if encoded_image is None:
+            if self.visual_budget_enabled:
+                # 按图像类型的视觉 token 预算缩放，不直接发送原始文件
+                encoded_image = self._compress_image(image_path, quality=90, max_size=2048)
+            else:
+                encoded_image = self._encode_image(image_path)
+        if encoded_image:
+            cache_key = self._cache_key(encoded_image)
+            results = self._cache_lookup(cache_key)
+            if results is not None:
+                logging.info(f"图像 {os.path.basename(image_path)} 命中识别结果缓存")
+                return results
+
+            results = self._request_image(image_path, encoded_image)
+            self._cache_store(cache_key, results)
             return results
         else:
             logging.error("图像文件编码失败。")
 
-    def _process_pdf(self, pdf_path):
-        """处理 PDF 文件"""
-        # 将 PDF 转换为图像列表
-        image_paths = self._convert_pdf_to_images(pdf_path)
-        results = []
+    @property
+    def batch_enabled(self):
+        """是否将多张图像打包到一次请求中"""
+        return self.batch_max_images > 1
 
-        # 指定最大页数,限制最大页数
-        if self.pdf_max_pages is not None:
-            image_paths = image_paths[:self.pdf_max_pages]
+    def _visual_tokens(self, image_path, max_size):
+        """
+        估算图像缩放到 max_size 后的视觉 token 数。Qwen2.5-VL 每 28x28 像素对应一个 token，只读取图像头信息。
+        开启视觉 token 预算时不超过最大的类型预算。
+        """
+        try:
+            with Image.open(image_path) as img:
+                width, height = img.size
+        except Exception:
+            width = height = max_size
+        scale = min(max_size / max(width, height, 1), 1.0)
+        tokens = math.ceil(width * scale / 28) * math.ceil(height * scale / 28)
+        if self.visual_budget_enabled:
+            tokens = min(tokens, max(self.visual_max_tokens.values()))
+        return tokens
+
+    def _pack_batches(self, items, max_size):
+        """
+        按图像数量上限和视觉 token 预算将图像依次打包，单张超出预算的图像单独成批。
+        :param items: (图像路径, base64 字符串) 的可迭代对象，可以是按需渲染的生成器
+        :param max_size: 图像压缩后的最大边长，用于估算视觉 token
+        :return: 批次的生成器，每个批次为 (图像路径, base64 字符串) 列表
+        """
+        batch, batch_tokens = [], 0
+        for image_path, encoded_image in items:
+            if not encoded_image:
+                logging.error(f"图像 {image_path} 编码失败，跳过。")
+                continue
+            tokens = self._visual_tokens(image_path, max_size)
+            if batch and (len(batch) >= self.batch_max_images or batch_tokens + tokens > self.batch_max_visual_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append((image_path, encoded_image))
+            batch_tokens += tokens
+        if batch:
+            yield batch
 
-        for image_path in image_paths:
-            results.append(self._process_image(image_path))
+    @staticmethod
+    def _parse_batch_response(response_data, count):
+        """解析打包请求返回的 JSON 数组，数量与图像数不一致时返回 None"""
+        try:
+            json_content = response_data.strip("```").strip("json").strip()
+            results = json.loads(json_content)
+        except (AttributeError, json.JSONDecodeError) as e:
+            logging.error(f"打包请求返回结果不是有效的 JSON 格式: {e}")
+            return None
+        if not isinstance(results, list) or len(results) != count or not all(isinstance(r, dict) for r in results):
+            return None
+        return results
 
+    def _process_batch(self, batch):
+        """
+        将多张图像打包为一次请求，已缓存的图像不再发送，剩余一张时单独请求。
+        :param batch: (图像路径, base64 字符串) 列表
+        :return: 每张图像的原始结果字符串列表，与 _process_image 的返回值格式一致
+        """
+        if len(batch) == 1:
+            image_path, encoded_image = batch[0]
+            return [self._process_image(image_path, encoded_image=encoded_image)]
+
+        cache_keys = [self._cache_key(encoded_image) for _, encoded_image in batch]
+        results = [self._cache_lookup(cache_key) for cache_key in cache_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) < len(batch):
+            logging.info(f"打包请求中 {len(batch) - len(missing)} 张图像命中识别结果缓存")
+        if len(missing) == 1:
+            i = missing[0]
+            results[i] = self._request_image(*batch[i])
+            self._cache_store(cache_keys[i], results[i])
+        elif missing:
+            sub_batch = [batch[i] for i in missing]
+            # 打包结果来自返回数组的 prompt，按批次组成单独缓存，只在再次发送相同的批次时使用
+            batch_keys = [self._cache_key(encoded_image, batch=sub_batch, index=j)
+                          for j, (_, encoded_image) in enumerate(sub_batch)]
+            responses = [self._cache_lookup(batch_key) for batch_key in batch_keys]
+            if any(response is None for response in responses):
+                responses, batched = self._request_batch(sub_batch)
+                # 打包解析失败后逐张请求的结果与单张请求相同，按单张的键缓存
+                store_keys = batch_keys if batched else [cache_keys[i] for i in missing]
+                for store_key, response_data in zip(store_keys, responses):
+                    self._cache_store(store_key, response_data)
+            for i, response_data in zip(missing, responses):
+                results[i] = response_data
         return results
 
+    def _request_batch(self, batch):
+        """
+        将多张图像打包为一次请求，要求模型按图像顺序返回结果数组，不经过缓存。
+        :param batch: (图像路径, base64 字符串) 列表
+        :return: (每张图像的原始结果字符串列表, 结果是否来自打包请求)，打包结果无法解析而逐张重新请求时为 False
+        """
+        prompt = []
+        for i, (image_path, encoded_image) in enumerate(batch):
+            prompt.append({"type": "text", "text": f"图像{i + 1}："})
+            prompt.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}})
+        prompt.append({"type": "text", "text": f"""以上共有 {len(batch)} 张图像，请分别对每张图像独立抽取关键信息。
+                                    {self._image_instruction()}
+                                    返回结果为长度为 {len(batch)} 的 json 数组，第 i 个元素为图像i的抽取结果，不要合并不同图像的结果。"""})
+
+        response = self._vlm_service(prompt, max_retries=5, delay=3, is_image_request=True)
+        results = self._parse_batch_response(response, len(batch))
+        if results is None:
+            # 模型未按要求返回数组时，逐张重新请求
+            logging.warning(f"打包请求的结果与图像数量 {len(batch)} 不一致，逐张重新处理。")
+            return [self._request_image(image_path, encoded_image) for image_path, encoded_image in batch], False
+        return [json.dumps(result, ensure_ascii=False) for result in results], True
+
+    def _run_bounded(self, tasks):
+        """
+        执行返回结果列表的任务，最多同时执行 pdf_max_inflight 个，结果按任务顺序合并。
+        :param tasks: 无参数可调用对象的可迭代对象，可以是按需生成的生成器
+        """
+        results = []
+        if self.pdf_page_mode == "sequential" or self.pdf_max_inflight == 1:
+            for task in tasks:
+                results.extend(task())
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.pdf_max_inflight, thread_name_prefix="vlm_page") as executor:
+            futures = deque()
+            for task in tasks:
+                # 达到并发上限时先等待最早的任务完成，同时限制内存中已编码页面的数量
+                if len(futures) >= self.pdf_max_inflight:
+                    results.extend(futures.popleft().result())
+                futures.append(executor.submit(task))
+            for future in futures:
+                results.extend(future.result())
+        return results
+
+    def _process_page(self, page_path, encoded_image):
+        return [self._process_image(page_path, encoded_image=encoded_image)]
+
+    def _process_pdf(self, pdf_path):
+        """
+        处理 PDF 文件。各页面的请求互不依赖（上下文 last_result 只在文件之间更新）：
+        concurrent 模式下最多同时请求 pdf_max_inflight 页，由 vLLM 连续批处理；
+        batch 模式下将多页打包为一次请求，批次之间同样并发；结果按页码顺序返回。
+        """
+        # 将 PDF 页面在内存中压缩编码，最大页数在渲染前限制，超出的页面不会被渲染
+        pages = self._encode_pdf_pages(pdf_path)
+        if self.pdf_page_mode == "batch" and self.batch_enabled:
+            tasks = (partial(self._process_batch, batch) for batch in self._pack_batches(pages, 2048))
+        else:
+            tasks = (partial(self._process_page, page_path, encoded_image) for page_path, encoded_image in pages)
+        return self._run_bounded(tasks)
+
     # 数据后处理
     def _post_process(self, response_data):
         try:
@@ -317,109 +598,114 @@ class VLM:
         self.last_result = results
 
         # 删除生成的文件，释放空间
-        if os.path.exists(self.image_dir):
+        if self.delete_files and os.path.exists(self.image_dir):
             for file in os.listdir(self.image_dir):
                 os.remove(os.path.join(self.image_dir, file))
 
         return results
 
-    def process_text(self, ocr_text):
+    def process_images(self, image_paths, chain_context=True):
         """
-        处理提取的文本，提取关键信息。
-        使用 VLM 模型的 API 进行情感分析和信息抽取。
+        将多张照片按数量上限和视觉 token 预算打包请求，减少请求次数。
+        每个批次完成后用已有结果更新 last_result，供后续批次补充空缺的关键信息。
+        :param image_paths: 图像文件路径列表
+        :param chain_context: 是否在批次之间传递 last_result，为 False 时每个批次都不带上下文
+        :return: 与 image_paths 一一对应的结果列表，格式与 process 的返回值一致，失败的图像为空字典
         """
-        # 分块处理文本
-        chunks = self._split_text_into_chunks(ocr_text, max_tokens=3000)
+        encoded = ((image_path, self._compress_image(image_path, quality=80, max_size=self.batch_image_size))
+                   for image_path in image_paths)
+        results = {}
+        for batch in self._pack_batches(encoded, self.batch_image_size):
+            if not chain_context:
+                self.last_result = None
+            responses = self._process_batch(batch)
+            for (image_path, _), response_data in zip(batch, responses):
+                results[image_path] = (self._post_process(response_data) if response_data else None) or {}
+            logging.info(f"已打包处理 {len(batch)} 张图像：{[os.path.basename(path) for path, _ in batch]}")
+            # 更新 last_result
+            self.last_result = self._merge_results(list(results.values()))
 
-        # 初始化结果列表
-        results = []
+        # 删除生成的文件，释放空间
+        if self.delete_files and os.path.exists(self.image_dir):
+            for file in os.listdir(self.image_dir):
+                os.remove(os.path.join(self.image_dir, file))
+
+        return [results.get(image_path, {}) for image_path in image_paths]
 
-        for chunk in chunks:
-            # 为每个分块创建独立的对话
-            prompt = [
-                {"type": "text", "text": f"""OCR文字：```{chunk}```"""},
-                {"type": "text", "text": f"""要抽取的关键信息：{self.key}, 其中公章为bool类型，只要有公章则为True；
+    def _text_instruction(self):
+        """文本抽取的指令文本"""
+        return f"""要抽取的关键信息：{self.key}, 其中公章为bool类型，只要有公章则为True；
                                         当事人最多不超过五个，其它字段唯一；
                                         建筑层数、占地面积和建筑面积均以数字表示，单位固定为平方米。若原始数据中出现其他单位，请自动转换为平方米，最终结果中不附加任何单位，若有小数部分，请保留小数。
                                         对于占地面积和建筑面积，无需进行推导计算，直接输出明确的结果。
                                         图斑编号的格式为：HZJGZWYYYYMM-XXXXXXXXXXXXZNNNN，即不是身份证号，也不是农宅施编号，严格以HZJGZW开头的编号格式。
                                         在返回结果时使用json格式，包含多个key-value对，key值为我指定的关键信息值唯一，value值为所抽取的结果。
-                                        如果认为图像中没有关键信息key，则将value赋值为“null”。请只输出json格式的结果，不要包含其它多余文字！"""}
-            ]
+                                        如果认为图像中没有关键信息key，则将value赋值为“null”。请只输出json格式的结果，不要包含其它多余文字！"""
 
+    def _process_chunk(self, chunk):
+        """
+        抽取单个分块的关键信息，请求失败或返回结果无法解析时重试 text_chunk_retries 次。
+        :return: 抽取结果字典，重试后仍失败时返回 None
+        """
+        prompt = [
+            {"type": "text", "text": f"""OCR文字：```{chunk}```"""},
+            {"type": "text", "text": self._text_instruction()}
+        ]
+        for attempt in range(self.text_chunk_retries + 1):
             try:
-                # 为每个分块创建独立的对话
                 response = self._vlm_service_text(prompt, max_retries=5, delay=3, is_image_request=False)
-                # 结果后处理
-                result = self._post_process(response)
+                # 请求失败时返回空字符串，不作为有效结果
+                result = self._post_process(response) if response else None
                 if result:
-                    results.append(result)
+                    return result
+                logging.warning(f"分块抽取结果无效，正在重试（{attempt + 1}/{self.text_chunk_retries + 1}）")
             except OpenAIError as e:  # 捕获 OpenAI 库的异常
-                logging.error(f"处理文本时发生网络问题：{e}")
-                return ""
+                logging.error(f"处理文本时发生网络问题（{attempt + 1}/{self.text_chunk_retries + 1}）：{e}")
             except Exception as e:
-                logging.error(f"处理文本时发生错误：{e}")
-                return ""
-
-        # 合并所有分块的结果
-        final_result = self._merge_results(results)
-        return final_result
+                logging.error(f"处理文本时发生错误（{attempt + 1}/{self.text_chunk_retries + 1}）：{e}")
+        return None
 
-    def _split_text_into_chunks(self, text, max_tokens=3000):
+    def process_text(self, ocr_text):
         """
-        将长文本分成多个小块，每块的长度不超过 max_tokens。
-        改进：考虑 prompt 和 completion 的 token 占用，确保总长度不超过模型限制。
+        处理提取的文本，提取关键信息。
+        文本超过一个分块时，最多同时请求 text_max_inflight 个分块，由 vLLM 连续批处理；
+        单个分块失败时合并其余分块的结果，全部分块失败时返回空字符串。
         """
-        # 使用 nltk 分句
-        sentences = sent_tokenize(text)
-
-        # 初始化分块列表
-        chunks = []
-        current_chunk = []
-        current_length = 0
-
-        # 预估 prompt 和 completion 的 token 数量
-        prompt_template = [
-            {"type": "text", "text": f"""OCR文字：```{text}```"""},
-            {"type": "text", "text": f"""要抽取的关键信息：{self.key}, 其中公章为bool类型，只要有公章则为True；
-                                    当事人最多不超过五个，其它字段唯一；
-                                    建筑层数、占地面积和建筑面积均以数字表示，单位固定为平方米。若原始数据中出现其他单位，请自动转换为平方米，最终结果中不附加任何单位，若有小数部分，请保留小数。
-                                    对于占地面积和建筑面积，无需进行推导计算，直接输出明确的结果。
-                                    图斑编号的格式为：HZJGZWYYYYMM-XXXXXXXXXXXXZNNNN，即不是身份证号，也不是农宅施编号，严格以HZJGZW开头的编号格式。
-                                    在返回结果时使用json格式，包含多个key-value对，key值为我指定的关键信息值唯一，value值为所抽取的结果。
-                                    如果认为图像中没有关键信息key，则将value赋值为“null”。请只输出json格式的结果，不要包含其它多余文字！"""}
-        ]
-        prompt_token_count = sum(len(self._tokenize_text(part["text"])) for part in prompt_template if part["type"] == "text")
-        completion_token_count = 512  # 假设 completion 占用约 512 tokens
-        max_available_tokens = 5120 - prompt_token_count - completion_token_count  # 预留 tokens 给 completion
-
-        for sentence in sentences:
-            sentence_length = len(self._tokenize_text(sentence))
-
-            # 如果当前块加上新句子的长度超过可用 tokens，则创建新块
-            if current_length + sentence_length > max_available_tokens:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_length = 0
+        # 分块处理文本
+        chunks = self._split_text_into_chunks(ocr_text)
+        if not chunks:
+            return ""
 
-            current_chunk.append(sentence)
-            current_length += sentence_length
+        # 各分块的请求互不依赖，结果按分块顺序合并
+        if len(chunks) == 1 or self.text_max_inflight == 1:
+            chunk_results = [self._process_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.text_max_inflight, len(chunks)),
+                                    thread_name_prefix="vlm_text") as executor:
+                chunk_results = list(executor.map(self._process_chunk, chunks))
 
-        # 添加最后一个块
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+        results = [result for result in chunk_results if result]
+        if not results:
+            logging.error(f"文本的 {len(chunks)} 个分块均处理失败")
+            return ""
+        if len(results) < len(chunks):
+            logging.warning(f"文本的 {len(chunks) - len(results)}/{len(chunks)} 个分块处理失败，合并其余分块的结果")
 
-        return chunks
+        # 合并所有分块的结果
+        final_result = self._merge_results(results)
+        return final_result
 
-    @staticmethod
-    def _tokenize_text(text):
+    def _split_text_into_chunks(self, text):
         """
-        简单的分词函数，用于估算文本的 token 数量。
-        改进：使用更精确的分词方法，例如基于模型的 tokenizer。
+        将长文本分成多个小块，每块的 token 数加上 prompt 和 completion 的 token 数不超过模型的上下文预算。
+        按中文句末标点、换行和表格边界切分，一次遍历装满每个分块，token 数由本地 tokenizer 计算并缓存。
         """
-        # 使用 OpenAI 的 tokenizer
-        tokenizer = tiktoken.get_encoding("cl100k_base")
-        return tokenizer.encode(text)
+        # prompt 中除 OCR 文字以外的部分（system、指令和格式字符）的 token 数
+        prompt_token_count = sum(self.chunker.count_tokens(part) for part in (
+            "你是一个文件解析助手，需要从我指定的关键信息中抽取结果", "OCR文字：``````", self._text_instruction()))
+        max_available_tokens = self.text_max_tokens - prompt_token_count - self.text_completion_tokens
+        # 只含空白的分块没有可提取的内容，不发送给模型
+        return [chunk for chunk in self.chunker.chunk(text, max_available_tokens) if chunk.strip()]
 
     @staticmethod
     def _merge_results(results):
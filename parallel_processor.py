@@ -9,21 +9,108 @@
 @Usage   :
 """
 import logging
+import multiprocessing
 import os
+import queue
 import shutil
 import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from utils import setup_logging, get_scan_interval
-from database import get_db, DataDownloader
-from workflow import get_workflow
+
+# 基准测试要求使用 MinerU 替身时设置该环境变量。spawn 启动的子进程不继承父进程的 sys.modules，
+# 子进程导入本模块（反序列化进程池初始化函数）时，需要在导入 models 之前重新注册替身
+if os.environ.get("AUDITS_MINERU_STAND_IN"):
+    from benchmark.stand_ins import install_mineru_stand_in
+    install_mineru_stand_in()
+
+from utils import setup_logging, get_scan_interval, get_worker_config  # noqa: E402
+from utils.memory import PeakRssSampler, wait_for_memory  # noqa: E402
+from utils.pipeline import Pipeline, Stage  # noqa: E402
+from utils.rasterizer import get_rasterizer  # noqa: E402
+from database import get_db, DataDownloader  # noqa: E402
+from models.http_session import log_endpoint_stats  # noqa: E402
+from workflow import get_workflow, get_raster_dpis  # noqa: E402
+
+# 进程模式下，每个子进程持有一个独立的工作流实例
+_process_workflow = None
+_process_memory_budget = None  # 子进程的内存预算（MB）
+
+
+def _init_process_worker(config):
+    """进程池初始化函数：为当前子进程创建独立的工作流实例和临时目录"""
+    global _process_workflow, _process_memory_budget
+    # spawn 启动的子进程不继承主进程的日志处理器，重新初始化，日志写入 audits_workers 目录
+    setup_logging(config, log_name="audits_workers")
+    worker_config = get_worker_config(config, f"proc_{os.getpid()}")
+    _process_workflow = get_workflow(worker_config)
+    _process_memory_budget = config.get("workflow_config", {}).get("memory_budget_mb")
+
+
+def _run_process_task(task_id, file_paths):
+    """在子进程中执行单个任务，内存超过预算时先等待回落，并记录任务的峰值内存"""
+    name = f"proc_{os.getpid()}"
+    wait_for_memory(_process_memory_budget, name=name)
+    with PeakRssSampler() as sampler:
+        results = _process_workflow.start_task({task_id: file_paths})
+    logging.info(f"{name} 任务 {task_id} 峰值内存 {sampler.peak_mb:.0f} MB（开始时 {sampler.start_mb:.0f} MB）")
+    return results
+
+
+class WorkerStats:
+    """单个处理单元的吞吐统计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.tasks_done = 0  # 成功完成的任务数
+        self.tasks_failed = 0  # 失败的任务数
+        self.busy_time = 0.0  # 处理任务的累计用时（秒）
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, success=True):
+        """记录一次任务处理"""
+        with self.lock:
+            self.busy_time += elapsed
+            if success:
+                self.tasks_done += 1
+            else:
+                self.tasks_failed += 1
+
+    def tasks_per_hour(self):
+        """按运行时长计算每小时完成的任务数"""
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        return self.tasks_done * 3600 / elapsed
+
+    def summary(self):
+        """返回统计摘要字符串"""
+        with self.lock:
+            elapsed = max(time.time() - self.start_time, 1e-6)
+            avg_time = self.busy_time / self.tasks_done if self.tasks_done else 0.0
+            return (f"{self.name}: 完成 {self.tasks_done} 个, 失败 {self.tasks_failed} 个, "
+                    f"平均用时 {avg_time:.1f} 秒, 吞吐 {self.tasks_done * 3600 / elapsed:.1f} 个/小时, "
+                    f"忙碌率 {self.busy_time / elapsed:.0%}")
+
 
 class ParallelProcessor:
     def __init__(self, config, process_initial_data=False, delete=True):
 
         self.config = config
         self.downloader = DataDownloader(self.config)
-        self.workflow = get_workflow(self.config)
+        self.workflow_config = self.config.get("workflow_config", {})
+        self.num_workers = max(int(self.workflow_config.get("num_workers", 1)), 1)  # 并行处理单元数量
+        self.worker_mode = self.workflow_config.get("worker_mode", "thread")  # 处理单元类型: thread 或 process
+        self.processor_mode = self.workflow_config.get("processor_mode", "worker")  # 处理方式: worker 或 pipeline
+        self.pipeline_config = self.config.get("pipeline_config", {})
+        self.pipeline = None  # 流水线模式下的多阶段流水线
+        self.raster_dpis = get_raster_dpis(self.config)  # 流水线渲染阶段的 PDF 渲染分辨率
+        self.processing_threads = []
+        self.stats_interval = self.workflow_config.get("stats_interval", 600)  # 吞吐统计日志间隔（秒）
+        self.worker_stats = [WorkerStats(f"worker_{i}") for i in range(self.num_workers)]
+        self.pipeline_stats = WorkerStats("pipeline")  # 流水线识别阶段之前失败、尚未分配处理单元的任务
+        self.executor = None  # 进程模式下的进程池
+        self.workflows = []  # 线程模式下各处理单元的工作流实例，停止时关闭
+        self.workflows_lock = threading.Lock()
         self.data_dir = self.config.get("data_config", {}).get("data_dir")  # 数据目录
         self.timestamp_file = self.config.get("workflow_config", {}).get("last_check_time")  # 保存时间戳的文件名
         self.logger = setup_logging(self.config, log_name='audits')  # 日志记录器
@@ -31,6 +118,9 @@ class ParallelProcessor:
         self.scan_interval = get_scan_interval(self.config)  # 使用时间扫描函数获取当前扫描间隔
         self.last_check_time = None
         self.running = True
+        self.stop_event = threading.Event()  # 停止信号，用于及时唤醒等待中的线程
+        self.queue_timeout = self.workflow_config.get("queue_timeout", 1)  # 阻塞取任务的超时时间（秒），决定停止响应速度
+        self.memory_budget_mb = self.workflow_config.get("memory_budget_mb")  # 每个处理单元的内存预算（MB），为空表示不限制
         self.process_initial_data = process_initial_data  # 是否处理初始数据
         self.delete = delete  # 是否删除下载的文件
 
@@ -94,73 +184,233 @@ class ParallelProcessor:
             # 使用时间扫描函数获取当前扫描间隔
             self.scan_interval = get_scan_interval(self.config)  # 动态更新扫描间隔
             logging.info(f"下次检查将在 {self.scan_interval} 秒后...")
-            time.sleep(self.scan_interval)
+            # 等待下一次扫描，收到停止信号时立即返回
+            self.stop_event.wait(self.scan_interval)
+
+    def _get_worker_workflow(self, worker_name):
+        """为线程模式的处理单元创建独立的工作流实例，进程模式下工作流由子进程持有"""
+        if self.worker_mode == "process":
+            return None
+        workflow = get_workflow(get_worker_config(self.config, worker_name))
+        with self.workflows_lock:
+            self.workflows.append(workflow)
+        return workflow
+
+    def _run_workflow(self, workflow, task_id, file_paths):
+        """使用处理单元自己的工作流实例执行任务，进程模式下峰值内存由子进程记录"""
+        if self.worker_mode == "process":
+            return self.executor.submit(_run_process_task, task_id, file_paths).result()
+        with PeakRssSampler() as sampler:
+            results = workflow.start_task({task_id: file_paths})
+        # 线程模式下各处理单元共享进程内存，记录的是任务期间整个进程的峰值
+        logging.info(f"任务 {task_id} 期间进程峰值内存 {sampler.peak_mb:.0f} MB（开始时 {sampler.start_mb:.0f} MB）")
+        return results
 
-    def process_task(self):
+    def _wait_for_memory(self, name):
+        """
+        内存超过预算时暂停领取新任务。线程模式下所有处理单元共享进程内存，预算为每个处理单元的预算乘以处理单元数；
+        进程模式下由子进程按自身内存检查。
+        """
+        if self.worker_mode == "process" or not self.memory_budget_mb:
+            return
+        wait_for_memory(self.memory_budget_mb * self.num_workers, stop_event=self.stop_event, name=name)
+
+    def _store_result(self, store_audit_result, task_id, results, time_start):
+        """保存任务结果到数据库，确认任务完成并删除数据"""
+        time_end = time.time()
+        if results.get('id') is not None:
+            store_audit_result(self.config, results)
+            logging.info(f"任务 {task_id} 的结果已保存到数据库, 用时 {time_end - time_start}")
+        else:
+            logging.warning(f"任务 {task_id} 没有返回结果")
+        # 标记任务完成
+        self.downloader.ack_task(task_id)
+        # 删除数据
+        if self.delete:
+            self.delete_data(task_id)
+
+    def process_task(self, worker_id=0):
         """处理任务队列中的任务"""
         logger = self.logger
-        logger.info("处理线程已启动")
+        stats = self.worker_stats[worker_id]
+        logger.info(f"处理线程 {stats.name} 已启动")
+        # 每个处理单元持有独立的工作流实例，避免共享 results_dict 等可变状态
+        workflow = self._get_worker_workflow(stats.name)
         # 为每个线程创建独立的数据库连接
         store_audit_result, _, _ = get_db(self.config)
-        first_scan = True  # 添加一个标志，用于判断是否是第一次扫描
+        idle = False  # 是否已输出过队列为空的日志
         while self.running:
-            if not self.task_queue.empty():
+            self._wait_for_memory(stats.name)
+            try:
+                # 阻塞等待新任务，下载线程放入任务后立即唤醒；超时后检查停止信号
+                task_id, file_paths = self.task_queue.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                if not idle:
+                    logging.info(f"{stats.name} 队列为空，等待新任务...")
+                    idle = True
+                continue
+            idle = False
+
+            time_start = time.time()
+            try:
+                logging.info(f"{stats.name} 开始处理任务 {task_id}， 队列中剩余任务数: {self.task_queue.qsize()}")
+                # 识别
+                results = self._run_workflow(workflow, task_id, file_paths)
+                # 保存结果到数据库
+                self._store_result(store_audit_result, task_id, results, time_start)
+                stats.record(time.time() - time_start, success=True)
+                logging.info(stats.summary())
+            except Exception as e:
+                logging.error(f"处理任务 {task_id} 时出错: {str(e)}")
+                stats.record(time.time() - time_start, success=False)
+                # 如果处理失败，将任务重新放回队列，超过最大尝试次数后不再重试
+                self.downloader.nack_task(task_id, str(e))
+
+    def _rasterize_stage(self, item, context):
+        """流水线渲染阶段：按第一阶段模型需要的 DPI 提前将任务中的 PDF 渲染为页面图像，供后续各模型共享，
+        只渲染前 pdf_max_pages 页"""
+        rasterizer = get_rasterizer(self.config)
+        max_pages = self.config.get("vlm_config", {}).get("pdf_max_pages", 10)
+        for file_path in item["file_paths"]:
+            if file_path.lower().endswith(".pdf"):
+                for dpi in self.raster_dpis:
+                    rasterizer.render(file_path, dpi=dpi, max_pages=max_pages)
+        return item
+
+    def _extract_stage(self, item, context):
+        """流水线识别阶段：印章识别、OCR、VLM 提取及结果合并，由各工作流完成"""
+        if "workflow" not in context:
+            context["stats"] = self.worker_stats[context["worker_id"] % self.num_workers]
+            context["workflow"] = self._get_worker_workflow(context["stats"].name)
+        # 处理单元统计随任务传递，由保存阶段或 _pipeline_error 记录任务的最终结果
+        item["stats"], item["extract_start"] = context["stats"], time.time()
+        logging.info(f"{context['stats'].name} 开始处理任务 {item['task_id']}， 队列中剩余任务数: {self.task_queue.qsize()}")
+        item["results"] = self._run_workflow(context["workflow"], item["task_id"], item["file_paths"])
+        return item
+
+    def _store_stage(self, item, context):
+        """流水线保存阶段：保存结果、确认任务并删除数据"""
+        if "store_audit_result" not in context:
+            context["store_audit_result"], _, _ = get_db(self.config)
+        self._store_result(context["store_audit_result"], item["task_id"], item["results"], item["time_start"])
+        stats = item["stats"]
+        stats.record(time.time() - item["extract_start"], success=True)
+        logging.info(stats.summary())
+        return None
+
+    def _pipeline_error(self, item, e):
+        """流水线任一阶段失败时，记录失败并将任务重新放回队列；识别阶段之前失败的任务单独计入流水线统计"""
+        logging.error(f"处理任务 {item['task_id']} 时出错: {str(e)}")
+        stats = item.get("stats") or self.pipeline_stats
+        stats.record(time.time() - item.get("extract_start", item["time_start"]), success=False)
+        self.downloader.nack_task(item["task_id"], str(e))
+
+    def feed_pipeline(self):
+        """从任务队列领取任务送入流水线，流水线已满时阻塞，任务保留在持久化队列中继续参与调度"""
+        logging.info("流水线取任务线程已启动")
+        while self.running:
+            self._wait_for_memory("流水线")
+            try:
+                task_id, file_paths = self.task_queue.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                continue
+            item = {"task_id": task_id, "file_paths": file_paths, "time_start": time.time()}
+            while self.running:
                 try:
-                    # 打印队列第一条数据
-                    # logger.info(f"队列中第一条数据: {self.task_queue.queue[0]}")
-                    # 获取一个任务
-                    time_start = time.time()
-                    task_id, file_paths = self.task_queue.get()
-                    logging.info(f"开始处理任务 {task_id}， 队列中剩余任务数: {self.task_queue.qsize()}")
-                    # 识别
-                    results = self.workflow.start_task({task_id: file_paths})
-                    # 保存结果到数据库
-                    time_end = time.time()
-                    if results.get('id') is not None:
-                        store_audit_result(self.config, results)
-                        logging.info(f"任务 {task_id} 的结果已保存到数据库, 用时 {time_end - time_start}")
-                    else:
-                        logging.warning(f"任务 {task_id} 没有返回结果")
-                    # 标记任务完成
-                    self.downloader.task_done()
-                    # 删除数据
-                    if self.delete:
-                        self.delete_data(task_id)
-                except Exception as e:
-                    logging.error(f"处理任务 {task_id} 时出错: {str(e)}")
-                    # 如果处理失败，将任务重新放回队列
-                    self.downloader.add_task(task_id, file_paths)
+                    self.pipeline.put(item, timeout=self.queue_timeout)
+                    break
+                except queue.Full:
+                    continue
             else:
-                # 如果队列为空，等待一段时间
-                if first_scan:
-                    wait_time = 3  # 第一次扫描等待10秒
-                    first_scan = False  # 标志设置为False，后续不再使用3秒等待
-                else:
-                    wait_time = self.scan_interval // 2
-                logging.info(f"队列为空，等待 {wait_time} 秒...")
-                time.sleep(wait_time)
+                # 停止时尚未送入流水线的任务放回队列
+                self.downloader.nack_task(task_id, "stopped")
+
+    def build_pipeline(self):
+        """构建 渲染 -> 识别 -> 保存 三阶段流水线，下载阶段由下载线程完成"""
+        queue_size = self.pipeline_config.get("queue_size", 2)
+        stages = [
+            Stage("rasterize", self._rasterize_stage, concurrency=self.pipeline_config.get("rasterize_workers", 2),
+                  queue_size=queue_size, on_error=self._pipeline_error),
+            Stage("extract", self._extract_stage, concurrency=self.num_workers,
+                  queue_size=queue_size, on_error=self._pipeline_error),
+            Stage("store", self._store_stage, concurrency=self.pipeline_config.get("store_workers", 1),
+                  queue_size=queue_size, on_error=self._pipeline_error),
+        ]
+        return Pipeline(stages)
+
+    def log_worker_stats(self):
+        """输出所有处理单元的吞吐统计"""
+        total = sum(stats.tasks_per_hour() for stats in self.worker_stats)
+        for stats in self.worker_stats:
+            logging.info(stats.summary())
+        logging.info(f"{self.num_workers} 个处理单元（{self.worker_mode}）总吞吐 {total:.1f} 个/小时")
+        if self.pipeline is not None:
+            logging.info(self.pipeline_stats.summary())
+            self.pipeline.log_stats()
+        # 进程模式下各子进程的服务请求统计在子进程中，这里只有主进程的统计
+        log_endpoint_stats()
+
+    def start_workers(self):
+        """启动处理单元或流水线"""
+        # 进程模式下，每个子进程在初始化时创建独立的工作流实例
+        if self.worker_mode == "process":
+            # 使用 spawn 启动子进程：此时下载线程、任务队列和日志处理器已在运行，fork 时被其它线程持有的锁
+            # 在子进程中永远不会释放，可能导致子进程死锁
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_init_process_worker, initargs=(self.config,))
+
+        if self.processor_mode == "pipeline":
+            self.pipeline = self.build_pipeline()
+            self.pipeline.start()
+            thread = threading.Thread(target=self.feed_pipeline, daemon=True)
+            thread.start()
+            self.processing_threads.append(thread)
+            logging.info(f"已启动流水线，识别阶段 {self.num_workers} 个处理单元，模式为 {self.worker_mode}")
+            return
+
+        # 启动多个处理线程，数量由 workflow_config.num_workers 配置
+        for worker_id in range(self.num_workers):
+            thread = threading.Thread(target=self.process_task, args=(worker_id,), daemon=True)
+            thread.start()
+            self.processing_threads.append(thread)
+        logging.info(f"已启动 {self.num_workers} 个处理单元，模式为 {self.worker_mode}")
+
+    def stop(self):
+        """停止下载、处理线程和流水线"""
+        self.running = False
+        self.stop_event.set()
+        for thread in self.processing_threads:
+            thread.join()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.executor is not None:
+            self.executor.shutdown()
+        # 释放各处理单元工作流的后台资源
+        with self.workflows_lock:
+            workflows, self.workflows = self.workflows, []
+        for workflow in workflows:
+            workflow.close()
+        self.log_worker_stats()
+
     def start(self):
         # 启动下载线程
         download_thread = threading.Thread(target=self.download_task, daemon=True)
         download_thread.start()
 
-        # 启动多个处理线程
-        num_processing_threads = 1  # 可以根据需要调整线程数量
-        processing_threads = []
-        for _ in range(num_processing_threads):
-            thread = threading.Thread(target=self.process_task, daemon=True)
-            thread.start()
-            processing_threads.append(thread)
+        self.start_workers()
 
-        # 主线程可以在这里执行其他任务，或者等待中断信号
+        # 主线程定期输出吞吐统计，或者等待中断信号
         try:
+            last_stats_time = time.time()
             while True:
                 time.sleep(1)
+                if time.time() - last_stats_time >= self.stats_interval:
+                    self.log_worker_stats()
+                    last_stats_time = time.time()
         except KeyboardInterrupt:
-            self.running = False
+            self.stop()
             download_thread.join()
-            for thread in processing_threads:
-                thread.join()
             logging.info("程序已停止")
 
     # 删除指定ID下的文件
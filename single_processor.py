@@ -10,11 +10,13 @@
 """
 import logging
 import os
+import queue
 import shutil
 import threading
 import time
 from datetime import datetime
-from utils import setup_logging
+from utils import setup_logging, get_worker_config
+from utils.memory import PeakRssSampler, wait_for_memory
 from database import get_db, DataDownloader
 from workflow import get_workflow
 
@@ -24,14 +26,17 @@ class ParallelProcessor:
 
         self.config = config
         self.task_id_list = task_id_list
-        self.downloader = DataDownloader(config)
-        self.workflow = get_workflow(config)
+        # 使用独立的持久化队列，避免处理到主程序队列中遗留的任务
+        task_queue_db = config.get("workflow_config", {}).get("task_queue_db", "./data/task_queue.db")
+        self.downloader = DataDownloader(config, task_queue_db=os.path.splitext(task_queue_db)[0] + "_single.db")
+        self.num_workers = max(int(config.get("workflow_config", {}).get("num_workers", 1)), 1)  # 并行处理单元数量
         self.data_dir = config.get("data_config", {}).get("data_dir")  # 数据目录
         self.logger = setup_logging(config, log_name='audits_sin')  # 日志记录器
         self.task_queue = self.downloader.get_task_queue()  # 使用 DataDownloader 的任务队列
         self.running = True
         self.delete = delete  # 是否删除下载的文件
-        self.scan_interval = 3
+        self.queue_timeout = 1  # 阻塞取任务的超时时间（秒），决定停止响应速度
+        self.memory_budget_mb = config.get("workflow_config", {}).get("memory_budget_mb")  # 每个处理单元的内存预算（MB）
         self.download_completed = False  # 新增标志，表示下载是否完成
 
     def download_task(self):
@@ -49,61 +54,64 @@ class ParallelProcessor:
 
         # 不再需要循环，下载完成后线程自然结束
 
-    def process_task(self):
+    def process_task(self, worker_id=0):
         """处理任务队列中的任务"""
         logger = self.logger
-        logger.info("处理线程已启动")
+        worker_name = f"worker_{worker_id}"
+        logger.info(f"处理线程 {worker_name} 已启动")
+        # 每个处理线程持有独立的工作流实例和临时目录
+        workflow = get_workflow(get_worker_config(self.config, worker_name))
         # 为每个线程创建独立的数据库连接
         store_audit_result, _, _ = get_db(self.config)
         while self.running:
-            if not self.task_queue.empty():
-                try:
-                    # 打印队列第一条数据
-                    # logger.info(f"队列中第一条数据: {self.task_queue.queue[0]}")
-                    # 获取一个任务
-                    time_start = time.time()
-                    task_id, file_paths = self.task_queue.get()
-                    logging.info(f"开始处理任务 {task_id}")
-                    # 提取
-                    results = self.workflow.start_task({task_id: file_paths})
-                    # 保存结果到数据库
-                    time_end = time.time()
-                    if results.get('id') is not None:
-                        store_audit_result(self.config, results)
-                        logging.info(f"任务 {task_id} 的结果已保存到数据库, 用时 {time_end - time_start}")
-                    else:
-                        logging.warning(f"任务 {task_id} 没有返回结果")
-                    # 标记任务完成
-                    self.downloader.task_done()
-                    # 删除数据
-                    if self.delete:
-                        self.delete_data(task_id)
-                except Exception as e:
-                    logging.error(f"处理任务时出错: {str(e)}")
-                    # 如果处理失败，将任务重新放回队列
-                    self.downloader.add_task(task_id, file_paths)
-            else:
-                # 如果队列为空且下载完成，等待一小段时间确保没有新任务，然后退出
+            # 内存超过预算时暂停领取新任务，各处理线程共享进程内存
+            if self.memory_budget_mb:
+                wait_for_memory(self.memory_budget_mb * self.num_workers, name=worker_name)
+            try:
+                # 阻塞等待新任务，下载线程放入任务后立即唤醒；超时后检查停止信号
+                task_id, file_paths = self.task_queue.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                # 如果队列为空且下载完成，所有任务已处理完毕
                 if self.download_completed:
-                    logging.info("队列为空且下载已完成，等待确认...")
-                    time.sleep(2)  # 短暂等待，确保没有新任务进入队列
-                    if self.task_queue.empty():
-                        logging.info("所有任务已处理完毕，处理线程将退出")
-                        break
-                # 如果队列为空但下载未完成，等待新任务
-                logging.info("队列为空，等待中...")
-                time.sleep(self.scan_interval)
+                    logging.info(f"所有任务已处理完毕，处理线程 {worker_name} 将退出")
+                    break
+                continue
+
+            try:
+                time_start = time.time()
+                logging.info(f"{worker_name} 开始处理任务 {task_id}")
+                # 提取
+                with PeakRssSampler() as sampler:
+                    results = workflow.start_task({task_id: file_paths})
+                logging.info(f"任务 {task_id} 期间进程峰值内存 {sampler.peak_mb:.0f} MB（开始时 {sampler.start_mb:.0f} MB）")
+                # 保存结果到数据库
+                time_end = time.time()
+                if results.get('id') is not None:
+                    store_audit_result(self.config, results)
+                    logging.info(f"任务 {task_id} 的结果已保存到数据库, 用时 {time_end - time_start}")
+                else:
+                    logging.warning(f"任务 {task_id} 没有返回结果")
+                # 标记任务完成
+                self.downloader.ack_task(task_id)
+                # 删除数据
+                if self.delete:
+                    self.delete_data(task_id)
+            except Exception as e:
+                logging.error(f"处理任务时出错: {str(e)}")
+                # 如果处理失败，将任务重新放回队列，超过最大尝试次数后不再重试
+                self.downloader.nack_task(task_id, str(e))
+        # 释放工作流的后台资源
+        workflow.close()
 
     def start(self):
         # 启动下载线程
         download_thread = threading.Thread(target=self.download_task, daemon=True)
         download_thread.start()
 
-        # 启动多个处理线程
-        num_processing_threads = 1  # 可以根据需要调整线程数量
+        # 启动多个处理线程，数量由 workflow_config.num_workers 配置
         processing_threads = []
-        for _ in range(num_processing_threads):
-            thread = threading.Thread(target=self.process_task, daemon=True)
+        for worker_id in range(self.num_workers):
+            thread = threading.Thread(target=self.process_task, args=(worker_id,), daemon=True)
             thread.start()
             processing_threads.append(thread)
 
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: conftest.py
+@Time    : 2025/4/8 上午11:30
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : pytest 公共配置：将项目根目录加入模块搜索路径，提供各测试共用的 fixture
+@Usage   : 在项目根目录执行 python -m pytest -q test
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture
+def task_queue_db(tmp_path):
+    """持久化任务队列的临时数据库路径"""
+    return str(tmp_path / "tasks.db")
+
+
+@pytest.fixture
+def task_queue(task_queue_db):
+    """使用临时数据库的持久化任务队列"""
+    # 在 fixture 中导入，只运行部分测试时不需要加载 database 包的依赖
+    from database.task_queue import PersistentTaskQueue
+
+    task_queue = PersistentTaskQueue(task_queue_db)
+    yield task_queue
+    task_queue.close()
+
+
+@pytest.fixture
+def result_cache_db(tmp_path):
+    """结果缓存的临时数据库路径"""
+    return str(tmp_path / "cache.db")
+
+
+@pytest.fixture
+def result_cache(result_cache_db):
+    """使用临时数据库、不限制容量的结果缓存"""
+    from utils.result_cache import ResultCache
+
+    cache = ResultCache(result_cache_db, "test")
+    yield cache
+    cache.close()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: test_db_downloader.py
+@Time    : 2025/4/16 下午2:10
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 下载记录的单元测试：材料列表指纹、材料未变化时跳过、队列中的任务材料变化后重新下载
+@Usage   : python -m pytest -q test/test_db_downloader.py
+"""
+import json
+
+import pytest
+
+from database.db_downloader_mt import DataDownloader, material_fingerprint
+
+MATERIALS = [{"id": "1", "fileName": "a.jpg", "fileSize": 100}, {"id": "2", "fileName": "b.pdf", "fileSize": 200}]
+
+
+@pytest.fixture
+def downloader(tmp_path, monkeypatch):
+    """开启 skip_unchanged 的下载器，附件下载替换为写入空文件"""
+    config = {"data_config": {"data_dir": str(tmp_path / "data")},
+              "workflow_config": {"task_queue_db": str(tmp_path / "tasks.db")},
+              "db_download_config": {"skip_unchanged": True}}
+    downloader = DataDownloader(config)
+    downloads = []
+
+    def download_file(file_url, file_path):
+        downloads.append(file_path)
+        open(file_path, "wb").close()
+        return True
+
+    monkeypatch.setattr(downloader, "download_file", download_file)
+    downloader.downloads = downloads
+    yield downloader
+    downloader.task_queue.close()
+
+
+def _row(materials):
+    return {"ID": "r1", "SCZZCL": json.dumps(materials)}
+
+
+def test_fingerprint_ignores_order():
+    assert material_fingerprint(MATERIALS) == material_fingerprint(MATERIALS[::-1])
+
+
+def test_fingerprint_changes_with_content():
+    reuploaded = [dict(MATERIALS[0], fileSize=101), MATERIALS[1]]
+    assert material_fingerprint(reuploaded) != material_fingerprint(MATERIALS)
+
+
+def test_fingerprint_none_without_content_fields():
+    assert material_fingerprint([{"id": "1", "fileName": "a.jpg"}]) is None
+    assert material_fingerprint([{"id": "1", "fileName": "a.jpg", "uploadTime": "2025-04-01"}]) is not None
+
+
+def test_skip_unchanged_after_audit(downloader):
+    downloader.process_record(_row(MATERIALS))
+    downloader.task_queue.get(block=False)
+    downloader.task_queue.ack("r1")
+    downloader.process_record(_row(MATERIALS))
+    assert len(downloader.downloads) == 2
+    assert not downloader.task_queue.is_queued("r1")
+    # 按 ID 列表下载时总是重新审核
+    downloader.process_record(_row(MATERIALS), force=True)
+    assert downloader.task_queue.is_queued("r1")
+
+
+def test_no_skip_without_content_fields(downloader):
+    materials = [{"id": "1", "fileName": "a.jpg"}]
+    downloader.process_record(_row(materials))
+    downloader.task_queue.get(block=False)
+    downloader.task_queue.ack("r1")
+    downloader.process_record(_row(materials))
+    assert downloader.task_queue.is_queued("r1")
+
+
+def test_queued_task_unchanged_is_not_downloaded_again(downloader):
+    downloader.process_record(_row(MATERIALS))
+    downloader.process_record(_row(MATERIALS))
+    assert len(downloader.downloads) == 2
+
+
+def test_pending_task_refreshed_when_materials_change(downloader):
+    downloader.process_record(_row(MATERIALS))
+    changed = MATERIALS + [{"id": "3", "fileName": "c.png", "fileSize": 300}]
+    downloader.process_record(_row(changed))
+    assert downloader.task_queue.qsize() == 1
+    assert downloader.task_queue.queued_fingerprint("r1") == material_fingerprint(changed)
+    task_id, file_paths = downloader.task_queue.get(block=False)
+    assert len(file_paths) == 3
+
+
+def test_claimed_task_deferred_when_materials_change(downloader):
+    downloader.process_record(_row(MATERIALS))
+    downloader.task_queue.get(block=False)
+    changed = [dict(MATERIALS[0], fileSize=101), MATERIALS[1]]
+    downloader.process_record(_row(changed))
+    assert "r1" in downloader.deferred_records
+
+    # 任务仍在处理中时继续推迟
+    downloader.process_deferred_records()
+    assert "r1" in downloader.deferred_records
+
+    # 任务完成后下次扫描时重新下载和审核
+    downloader.task_queue.ack("r1")
+    downloader.process_deferred_records()
+    assert downloader.deferred_records == {}
+    assert downloader.task_queue.queued_fingerprint("r1") == material_fingerprint(changed)
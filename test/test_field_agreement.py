@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: test_field_agreement.py
+@Time    : 2025/4/14 下午5:20
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 字段提前结束的单元测试：最少文件数、一致性比例、无效值过滤，以及工作流跳过剩余文件的判断
+@Usage   : python -m pytest -q test/test_field_agreement.py
+"""
+import pytest
+
+from workflow.workflow import Base_Workflow, FieldAgreement
+
+PATCH_ID = "HZJGZW44010020250000000000000001"
+RESULT = {"当事人": "张三", "图斑编号": PATCH_ID, "建筑层数": 3}
+FIELDS = ["当事人", "图斑编号", "建筑层数"]
+
+
+def test_requires_min_files():
+    agreement = FieldAgreement(FIELDS, min_files=3)
+    assert agreement.update(RESULT) is False
+    assert agreement.update(RESULT) is False
+    assert agreement.update(RESULT) is True
+    assert agreement.files == 3
+
+
+def test_requires_every_field():
+    agreement = FieldAgreement(FIELDS, min_files=1)
+    assert agreement.update({"当事人": "张三", "图斑编号": PATCH_ID}) is False
+    assert agreement.update({"建筑层数": 3}) is True
+
+
+def test_agreement_threshold():
+    agreement = FieldAgreement(FIELDS, agreement_threshold=0.6, min_files=2)
+    agreement.update(RESULT)
+    agreement.update({**RESULT, "当事人": "李四"})
+    # 当事人两个值各占一半，低于 0.6
+    assert agreement.satisfied() is False
+    agreement.update(RESULT)
+    assert agreement.satisfied() is True
+
+
+def test_invalid_values_ignored():
+    agreement = FieldAgreement(FIELDS, min_files=1)
+    # 空值、"null" 和格式不符的图斑编号不计入
+    assert agreement.update({"当事人": "null", "图斑编号": "HZJGZW123", "建筑层数": ""}) is False
+    assert all(not counter for counter in agreement.values.values())
+
+
+def test_list_values_joined():
+    agreement = FieldAgreement(["当事人"], min_files=2)
+    agreement.update({"当事人": ["张三", "李四"]})
+    assert agreement.update({"当事人": "张三, 李四"}) is True
+
+
+def test_update_with_batch_results():
+    agreement = FieldAgreement(FIELDS, min_files=3)
+    assert agreement.update([RESULT, None, RESULT]) is True
+    assert agreement.files == 3
+
+
+@pytest.fixture
+def workflow():
+    return Base_Workflow({"workflow_config": {"early_exit": {"enabled": True, "required_fields": FIELDS,
+                                                             "min_files": 2}}})
+
+
+def test_field_agreement_disabled():
+    assert Base_Workflow({})._field_agreement() is None
+
+
+def test_skip_remaining(workflow):
+    agreement = workflow._field_agreement()
+    assert agreement.min_files == 2
+    agreement.update(RESULT)
+    assert workflow._skip_remaining("1", agreement, 3) is False
+    agreement.update(RESULT)
+    assert workflow._skip_remaining("1", agreement, 0) is False
+    # 同一循环中识别印章时，未识别到印章不跳过
+    assert workflow._skip_remaining("1", agreement, 3, []) is False
+    assert workflow._skip_remaining("1", agreement, 3, [[]]) is False
+    assert workflow._skip_remaining("1", agreement, 3, [[{"seal_score": 0.9}]]) is True
+    assert (agreement.skipped, workflow.skipped_files) == (3, 3)
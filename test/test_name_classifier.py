@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: test_name_classifier.py
+@Time    : 2025/4/15 下午2:30
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 当事人类型判断的单元测试：机构后缀和姓氏规则、短名称保护、进程内 LRU 缓存和持久化缓存
+@Usage   : python -m pytest -q test/test_name_classifier.py
+"""
+import pytest
+
+import models.vlm_extraction
+from models.name_classifier import NameTypeClassifier, normalize_name, rule_name_type
+
+
+class FakeVLM:
+    """代替模型服务，记录调用次数并返回固定的判断结果"""
+    PROMPT_VERSION = "test"
+    calls = []
+    answer = 1
+
+    def __init__(self, config):
+        pass
+
+    def judge_name_type(self, names):
+        FakeVLM.calls.append(list(names))
+        return FakeVLM.answer
+
+
+@pytest.fixture
+def fake_vlm(monkeypatch):
+    FakeVLM.calls, FakeVLM.answer = [], 1
+    monkeypatch.setattr(models.vlm_extraction, "VLM", FakeVLM)
+    return FakeVLM
+
+
+@pytest.mark.parametrize("name", ["广州市某某科技有限公司", "某某集团", "某某村民委员会", "某某街道办事处",
+                                  "某某服务中心", "某某市人民医院", "某某五金店"])
+def test_org_names(name):
+    assert rule_name_type(name) == 1
+
+
+@pytest.mark.parametrize("name", ["张三", "李小明", "欧阳明", "司马相如"])
+def test_person_names(name):
+    assert rule_name_type(name) == 0
+
+
+@pytest.mark.parametrize("name", ["张中心", "王局", "李站", "陈馆"])
+def test_short_names_with_org_suffix_are_undecided(name):
+    # 以机构后缀结尾的短名称可能是人名，交给模型判断
+    assert rule_name_type(name) is None
+
+
+@pytest.mark.parametrize("name", ["ABC", "某某"])
+def test_unknown_names(name):
+    assert rule_name_type(name) is None
+
+
+def test_normalize_name():
+    assert normalize_name(" 某某 合伙企业（普通合伙） ") == "某某合伙企业(普通合伙)"
+
+
+def test_classify_by_rules(fake_vlm):
+    classifier = NameTypeClassifier({})
+    assert classifier.classify(["张三", "某某有限公司"]) == 1
+    assert classifier.classify(["张三", "李四"]) == 0
+    assert classifier.classify([]) is None
+    assert classifier.classify(["", None]) is None
+    assert fake_vlm.calls == []
+    assert classifier.stats["rule"] == 2
+
+
+def test_classify_uses_model_once_per_name_set(fake_vlm):
+    classifier = NameTypeClassifier({})
+    assert classifier.classify(["某甲"]) == 1
+    # 名称顺序、空白和重复不影响缓存
+    assert classifier.classify([" 某甲", "某甲"]) == 1
+    assert fake_vlm.calls == [["某甲"]]
+    assert classifier.stats == {"rule": 0, "cache": 1, "model": 1}
+
+
+def test_short_name_with_org_suffix_uses_model(fake_vlm):
+    fake_vlm.answer = 0
+    assert NameTypeClassifier({}).classify(["张中心", "李四"]) == 0
+    assert fake_vlm.calls == [["张中心", "李四"]]
+
+
+def test_invalid_model_answer_is_not_cached(fake_vlm):
+    fake_vlm.answer = None
+    classifier = NameTypeClassifier({})
+    assert classifier.classify(["某甲"]) is None
+    assert classifier.classify(["某甲"]) is None
+    assert len(fake_vlm.calls) == 2
+
+
+def test_memory_cache_evicts_least_recently_used(fake_vlm):
+    classifier = NameTypeClassifier({}, max_entries=2)
+    for name in ("某甲", "某乙", "某甲", "某丙"):
+        classifier.classify([name])
+    assert len(fake_vlm.calls) == 3
+    # 某乙最久未使用，已被淘汰
+    classifier.classify(["某甲"])
+    assert len(fake_vlm.calls) == 3
+    classifier.classify(["某乙"])
+    assert len(fake_vlm.calls) == 4
+
+
+def test_persistent_cache_shared_between_instances(fake_vlm, tmp_path):
+    config = {"cache_config": {"enabled": True, "db_path": str(tmp_path / "cache.db")},
+              "vlm_config": {"model": "test-model"}}
+    assert NameTypeClassifier(config).classify(["某甲"]) == 1
+    classifier = NameTypeClassifier(config)
+    assert classifier.classify(["某甲"]) == 1
+    assert len(fake_vlm.calls) == 1
+    assert classifier.stats["cache"] == 1
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: test_result_cache.py
+@Time    : 2025/4/12 上午10:20
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 结果缓存的单元测试：读写、命名空间隔离、过期、按条目数和容量淘汰、压缩
+@Usage   : python -m pytest -q test/test_result_cache.py
+"""
+import time
+from contextlib import closing
+
+from utils.result_cache import ResultCache, file_sha256, get_result_cache, make_cache_key
+
+
+def test_make_cache_key():
+    assert make_cache_key("a", {"x": 1, "y": 2}) == make_cache_key("a", {"y": 2, "x": 1})
+    assert make_cache_key("a", "b") != make_cache_key("ab")
+    assert make_cache_key("a", b"b") == make_cache_key("a", "b")
+
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"abc")
+    assert file_sha256(str(path), chunk_size=1) == \
+        "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+def test_get_set_and_stats(result_cache):
+    assert result_cache.get("k") is None
+    result_cache.set("k", {"当事人": "张三", "建筑层数": 3})
+    assert result_cache.get("k") == {"当事人": "张三", "建筑层数": 3}
+    stats = result_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_namespaces_are_isolated(result_cache, result_cache_db):
+    with closing(ResultCache(result_cache_db, "other")) as other:
+        result_cache.set("k", "test")
+        other.set("k", "other")
+        assert result_cache.get("k") == "test"
+        assert other.get("k") == "other"
+
+
+def test_ttl_expires_entries(result_cache_db):
+    with closing(ResultCache(result_cache_db, "test", ttl_seconds=0.05)) as cache:
+        cache.set("k", 1)
+        assert cache.get("k") == 1
+        time.sleep(0.1)
+        assert cache.get("k") is None
+        cache.evict()
+        assert cache.stats()["entries"] == 0
+
+
+def test_max_entries_evicts_least_recently_used(result_cache_db):
+    with closing(ResultCache(result_cache_db, "test", max_entries=2, evict_interval=1)) as cache:
+        cache.set("a", 1)
+        time.sleep(0.01)
+        cache.set("b", 2)
+        time.sleep(0.01)
+        cache.get("a")  # a 最近被访问，b 最久未使用
+        time.sleep(0.01)
+        cache.set("c", 3)
+        assert cache.stats()["entries"] == 2
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+
+def test_max_size_evicts_oldest(result_cache_db):
+    with closing(ResultCache(result_cache_db, "test", max_size_mb=1, evict_interval=1)) as cache:
+        value = "x" * (400 * 1024)
+        for key in ("a", "b", "c"):
+            cache.set(key, value)
+            time.sleep(0.01)
+        assert cache.stats()["size_mb"] <= 1
+        assert cache.get("a") is None
+        assert cache.get("c") == value
+
+
+def test_compression(result_cache, result_cache_db):
+    with closing(ResultCache(result_cache_db, "compressed", compress=True)) as compressed:
+        value = {"text": "当事人为张三。" * 1000}
+        result_cache.set("k", value)
+        compressed.set("k", value)
+        assert compressed.get("k") == value
+        assert compressed.stats()["size_mb"] < result_cache.stats()["size_mb"] / 10
+
+
+def test_plain_entries_readable_with_compression(result_cache, result_cache_db):
+    # 开启压缩前写入的条目仍可读取
+    result_cache.set("k", [1, 2, 3])
+    with closing(ResultCache(result_cache_db, "test", compress=True)) as cache:
+        assert cache.get("k") == [1, 2, 3]
+
+
+def test_get_result_cache(result_cache_db):
+    assert get_result_cache({}, "vlm") is None
+    config = {"cache_config": {"enabled": False, "db_path": result_cache_db,
+                               "ocr": {"enabled": True, "max_entries": 10}}}
+    assert get_result_cache(config, "vlm") is None
+    cache = get_result_cache(config, "ocr")
+    assert cache.max_entries == 10
+    assert get_result_cache(config, "ocr") is cache
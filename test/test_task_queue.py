@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: test_task_queue.py
+@Time    : 2025/4/8 上午11:40
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 持久化任务队列的单元测试：领取、确认、失败重试、重启恢复和调度策略
+@Usage   : python -m pytest -q test/test_task_queue.py
+"""
+import queue
+from contextlib import closing
+
+import pytest
+
+from database.task_queue import CLAIMED, DONE, FAILED, PENDING, PersistentTaskQueue, estimate_task_cost
+
+
+def _status(task_queue, task_id):
+    row = task_queue.conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+    return row[0] if row else None
+
+
+def test_claim_and_ack(task_queue):
+    assert task_queue.enqueue("a", ["1.jpg"]) is True
+    assert task_queue.qsize() == 1
+
+    assert task_queue.get(block=False) == ("a", ["1.jpg"])
+    assert _status(task_queue, "a") == CLAIMED
+    with pytest.raises(queue.Empty):
+        task_queue.get_nowait()
+
+    task_queue.ack("a")
+    assert _status(task_queue, "a") == DONE
+    assert task_queue.empty()
+
+
+def test_put_enqueues(task_queue):
+    task_queue.put(("a", ["1.jpg"]))
+    assert task_queue.get(block=False) == ("a", ["1.jpg"])
+
+
+def test_enqueue_skips_queued_task(task_queue):
+    assert task_queue.enqueue("a", ["1.jpg"]) is True
+    assert task_queue.enqueue("a", ["1.jpg"]) is False
+    task_queue.get(block=False)
+    assert task_queue.is_queued("a")
+    assert task_queue.enqueue("a", ["1.jpg"]) is False
+    task_queue.ack("a")
+    # 已完成的任务可以重新入队
+    assert not task_queue.is_queued("a")
+    assert task_queue.enqueue("a", ["1.jpg"]) is True
+
+
+def test_nack_retries_until_max_attempts(task_queue_db):
+    with closing(PersistentTaskQueue(task_queue_db, max_attempts=2)) as task_queue:
+        task_queue.enqueue("a", ["1.jpg"])
+
+        task_queue.get(block=False)
+        assert task_queue.nack("a", "error 1") is True
+        assert _status(task_queue, "a") == PENDING
+
+        task_queue.get(block=False)
+        assert task_queue.nack("a", "error 2") is False
+        assert _status(task_queue, "a") == FAILED
+        with pytest.raises(queue.Empty):
+            task_queue.get(block=False)
+
+
+def test_nack_unknown_task(task_queue):
+    assert task_queue.nack("missing") is False
+
+
+def test_recover_claimed_tasks_after_restart(task_queue, task_queue_db):
+    task_queue.enqueue("a", ["1.jpg"])
+    task_queue.enqueue("b", ["2.jpg"])
+    task_queue.get(block=False)
+    task_queue.close()
+
+    # 重新打开数据库时，上次被领取但未确认的任务恢复为待处理
+    with closing(PersistentTaskQueue(task_queue_db)) as restarted:
+        assert restarted.qsize() == 2
+        claimed = {restarted.get(block=False)[0], restarted.get(block=False)[0]}
+        assert claimed == {"a", "b"}
+
+
+def test_get_timeout_when_empty(task_queue):
+    with pytest.raises(queue.Empty):
+        task_queue.get(timeout=0.1)
+
+
+def test_estimate_task_cost(tmp_path):
+    image = tmp_path / "1.jpg"
+    image.write_bytes(b"0" * 1024 * 1024)
+    estimate = estimate_task_cost([str(image), str(tmp_path / "missing.png")], bytes_weight=0.5)
+    assert estimate == {"files": 2, "bytes": 1024 * 1024, "pages": 2, "cost": 2.5}
+
+
+def test_sjf_claims_cheapest_task_first(task_queue_db):
+    with closing(PersistentTaskQueue(task_queue_db, policy="sjf")) as task_queue:
+        task_queue.enqueue("large", ["1.jpg", "2.jpg", "3.jpg"])
+        task_queue.enqueue("small", ["4.jpg"])
+        task_queue.enqueue("medium", ["5.jpg", "6.jpg"])
+        assert [task_queue.get(block=False)[0] for _ in range(3)] == ["small", "medium", "large"]
+
+
+def test_fifo_claims_in_enqueue_order(task_queue):
+    task_queue.enqueue("large", ["1.jpg", "2.jpg"])
+    task_queue.enqueue("small", ["3.jpg"])
+    assert task_queue.get(block=False)[0] == "large"
+
+
+def test_invalid_policy(task_queue_db):
+    with pytest.raises(ValueError):
+        PersistentTaskQueue(task_queue_db, policy="unknown")
+
+
+def test_audited_fingerprint(task_queue):
+    task_queue.enqueue("a", ["1.jpg"], fingerprint="fp")
+    # 任务完成前没有已审核的指纹
+    assert task_queue.audited_fingerprint("a") is None
+    task_queue.get(block=False)
+    task_queue.ack("a")
+    assert task_queue.audited_fingerprint("a") == "fp"
+    assert task_queue.audited_fingerprint("missing") is None
+
+
+def test_queued_fingerprint_and_withdraw(task_queue):
+    task_queue.enqueue("a", ["1.jpg"], fingerprint="fp")
+    assert task_queue.queued_fingerprint("a") == "fp"
+    assert task_queue.withdraw("a") is True
+    assert task_queue.queued_fingerprint("a") is None
+    assert not task_queue.is_queued("a")
+
+    # 已被领取的任务不能撤回
+    task_queue.enqueue("b", ["2.jpg"], fingerprint="fp")
+    task_queue.get(block=False)
+    assert task_queue.withdraw("b") is False
+    assert task_queue.queued_fingerprint("b") == "fp"
+    task_queue.ack("b")
+    assert task_queue.queued_fingerprint("b") is None
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: test_text_chunker.py
+@Time    : 2025/4/14 下午3:10
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 文本分块的单元测试：分块拼接后与原文相同、每个分块不超过预算、空文本不分块
+@Usage   : python -m pytest -q test/test_text_chunker.py
+"""
+import pytest
+
+from utils.text_chunker import TextChunker
+
+SENTENCES = "当事人为张三。图斑编号为HZJGZW440100202500000000000001；建筑层数为3层！占地面积120平方米，建筑面积360平方米？\n"
+TABLE = "<table><tr><td>当事人</td><td>张三</td></tr><tr><td>建筑层数</td><td>3</td></tr></table>"
+LONG_SENTENCE = "，".join(f"第{i}项内容" for i in range(200)) + "。"
+TEXTS = [
+    SENTENCES,
+    SENTENCES * 20,
+    SENTENCES * 3 + TABLE + SENTENCES * 3,
+    (TABLE * 5) + SENTENCES,
+    LONG_SENTENCE,
+    "无标点的超长文本" * 100,
+]
+
+
+BUDGETS = [1, 16, 64, 256, 4096]
+
+
+@pytest.fixture(scope="module")
+def chunker():
+    return TextChunker()
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("budget", BUDGETS)
+def test_chunks_join_to_input(chunker, text, budget):
+    assert "".join(chunker.chunk(text, budget)) == text
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("budget", BUDGETS)
+def test_chunks_within_budget(chunker, text, budget):
+    chunks = chunker.chunk(text, budget)
+    assert chunks
+    assert all(chunker.count_tokens(chunk) <= budget for chunk in chunks)
+
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\n"])
+def test_empty_input(chunker, text):
+    assert chunker.chunk(text, 64) == []
+
+
+def test_tight_budget_keeps_whitespace(chunker):
+    # 预算很小时换行符单独成块，不能被丢弃
+    chunks = chunker.chunk("甲。\n乙。\n", 1)
+    assert "".join(chunks) == "甲。\n乙。\n"
+    assert "\n" in chunks
+
+
+def test_fitting_text_is_single_chunk(chunker):
+    text = SENTENCES * 2
+    assert chunker.chunk(text, chunker.count_tokens(text)) == [text]
+
+
+def test_table_kept_whole_when_it_fits(chunker):
+    text = SENTENCES + TABLE + SENTENCES
+    budget = chunker.count_tokens(TABLE)
+    assert TABLE in chunker.chunk(text, budget)
+
+
+def test_split_segments_join_to_input():
+    text = SENTENCES * 2 + TABLE + SENTENCES
+    segments = list(TextChunker.split_segments(text))
+    assert "".join(segments) == text
+    assert TABLE in segments
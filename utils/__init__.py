@@ -1 +1 @@
-from .utils import load_config, load_examples, setup_logging, get_scan_interval, retry_on_error
\ No newline at end of file
+from .utils import load_config, load_examples, setup_logging, get_scan_interval, retry_on_error, get_worker_config
\ No newline at end of file
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: memory.py
+@Time    : 2025/4/11 下午4:30
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 进程内存（RSS）统计与内存预算控制
+@Usage   : with PeakRssSampler() as sampler: ...; sampler.peak_mb 为期间的峰值内存；
+           wait_for_memory(budget_mb) 在内存超过预算时等待，避免多个处理单元同时占用大量内存
+"""
+import gc
+import logging
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 下没有 resource 模块
+    resource = None
+
+
+def get_rss_mb():
+    """
+    获取当前进程的常驻内存（RSS），单位为 MB。
+    优先读取 /proc/self/statm，不可用时退化为 getrusage 的历史峰值，均不可用时返回 0。
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        # Linux 下 ru_maxrss 单位为 KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return 0.0
+
+
+class PeakRssSampler:
+    """在后台线程中定期采样 RSS，记录代码块执行期间的峰值内存"""
+
+    def __init__(self, interval=0.2):
+        """
+        :param interval: 采样间隔（秒）
+        """
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, get_rss_mb())
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = get_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_event.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, get_rss_mb())
+        return False
+
+
+def wait_for_memory(budget_mb, stop_event=None, poll_interval=1, max_wait=300, name=""):
+    """
+    内存超过预算时先回收垃圾，仍超过则等待其他任务释放内存后再继续。
+    :param budget_mb: 内存预算（MB），为空或 0 表示不限制
+    :param stop_event: 停止信号，收到后立即返回
+    :param poll_interval: 检查间隔（秒）
+    :param max_wait: 最长等待时间（秒），超时后继续执行，避免内存无法回落时永久阻塞
+    :param name: 处理单元名称，用于日志
+    :return: 等待的秒数
+    """
+    if not budget_mb or get_rss_mb() <= budget_mb:
+        return 0.0
+    gc.collect()
+    time_start = time.time()
+    rss_mb = get_rss_mb()
+    if rss_mb > budget_mb:
+        logging.warning(f"{name} 当前内存 {rss_mb:.0f} MB 超过预算 {budget_mb} MB，暂停领取新任务")
+    while rss_mb > budget_mb:
+        if time.time() - time_start >= max_wait:
+            logging.warning(f"{name} 等待内存回落超过 {max_wait} 秒，当前内存 {rss_mb:.0f} MB，继续处理")
+            break
+        if stop_event is not None:
+            if stop_event.wait(poll_interval):
+                break
+        else:
+            time.sleep(poll_interval)
+        rss_mb = get_rss_mb()
+    return time.time() - time_start
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: pdf_utils.py
+@Time    : 2025/4/9 下午3:20
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : PDF 相关的工具函数
+@Usage   :
+"""
+import logging
+import os
+
+from pdf2image import pdfinfo_from_path
+
+
+def get_pdf_page_count(pdf_path, default=1):
+    """
+    获取 PDF 页数，只读取文档信息（pdfinfo），不渲染页面。
+    :param pdf_path: PDF 文件路径
+    :param default: 读取失败时的返回值
+    :return: 页数
+    """
+    try:
+        return int(pdfinfo_from_path(pdf_path)["Pages"])
+    except Exception as e:
+        logging.warning(f"读取 PDF {pdf_path} 页数失败: {e}")
+        return default
+
+
+def get_pages_dir(pdf_path, dpi):
+    """
+    PDF 页面图像的共享目录，位于任务数据目录下，随任务数据一起删除。
+    目录按 PDF 的修改时间、大小和 DPI 区分，记录更新后重新下载的同名 PDF 不会使用旧文件的页面图像。
+    """
+    pdf_dir, pdf_name = os.path.split(os.path.abspath(pdf_path))
+    stat = os.stat(pdf_path)
+    return os.path.join(pdf_dir, ".pages", pdf_name, f"{stat.st_mtime_ns}-{stat.st_size}", str(dpi))
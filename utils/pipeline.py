@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: pipeline.py
+@Time    : 2025/4/10 上午9:45
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 多阶段流水线，阶段之间通过有界队列连接，每个阶段有独立的并发数
+@Usage   : 下游阶段处理不过来时，上游阶段在 put 时阻塞（背压）；通过 summary() 查看各阶段利用率，定位瓶颈阶段
+"""
+import logging
+import queue
+import threading
+import time
+
+
+class Stage:
+    def __init__(self, name, func, concurrency=1, queue_size=2, on_error=None):
+        """
+        初始化流水线阶段。
+        :param name: 阶段名称
+        :param func: 处理函数 func(item, context)，返回值传给下一阶段，返回 None 则不再向下传递；
+                     context 为每个工作线程独立的字典，可用于保存线程私有的模型或连接
+        :param concurrency: 阶段的工作线程数
+        :param queue_size: 阶段输入队列的容量，队列满时上游阻塞
+        :param on_error: 处理失败时的回调 on_error(item, exception)
+        """
+        self.name = name
+        self.func = func
+        self.concurrency = max(int(concurrency), 1)
+        self.input_queue = queue.Queue(maxsize=max(int(queue_size), 1))
+        self.on_error = on_error
+        self.next_stage = None
+        self.threads = []
+        self.running = False
+        self.lock = threading.Lock()
+        self.items_done = 0  # 处理完成的数量
+        self.items_failed = 0  # 处理失败的数量
+        self.busy_time = 0.0  # 所有工作线程的累计处理用时（秒）
+        self.start_time = None
+
+    def put(self, item, timeout=None):
+        """放入待处理数据，队列满时阻塞"""
+        self.input_queue.put(item, timeout=timeout)
+
+    def start(self):
+        self.running = True
+        self.start_time = time.time()
+        for worker_id in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, args=(worker_id,), daemon=True,
+                                      name=f"{self.name}_{worker_id}")
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        # 停止后输入队列中尚未处理的数据同样交给 on_error，避免静默丢弃
+        while True:
+            try:
+                item = self.input_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._drop(item, f"流水线阶段 {self.name} 已停止，数据未处理")
+
+    def _drop(self, item, reason):
+        """丢弃无法继续处理的数据：记录日志并交给 on_error（如将任务放回队列）"""
+        logging.warning(reason)
+        if self.on_error is not None:
+            self.on_error(item, RuntimeError(reason))
+
+    def _forward(self, item):
+        """向下一阶段传递数据，下一阶段队列满时阻塞，并定期检查停止信号；停止时未能传递的数据交给 on_error"""
+        while self.running:
+            try:
+                self.next_stage.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        self._drop(item, f"流水线阶段 {self.name} 已停止，数据未能传递到 {self.next_stage.name}")
+
+    def _worker(self, worker_id):
+        context = {"worker_id": worker_id}
+        while self.running:
+            try:
+                item = self.input_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            time_start = time.time()
+            try:
+                result = self.func(item, context)
+                success = True
+            except Exception as e:
+                logging.error(f"流水线阶段 {self.name} 处理失败: {str(e)}")
+                result, success = None, False
+                if self.on_error is not None:
+                    self.on_error(item, e)
+            with self.lock:
+                self.busy_time += time.time() - time_start
+                if success:
+                    self.items_done += 1
+                else:
+                    self.items_failed += 1
+            if result is not None and self.next_stage is not None:
+                self._forward(result)
+
+    def utilisation(self):
+        """阶段利用率：累计处理用时 / (运行时长 * 并发数)"""
+        if self.start_time is None:
+            return 0.0
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        with self.lock:
+            return self.busy_time / (elapsed * self.concurrency)
+
+    def summary(self):
+        """返回统计摘要字符串"""
+        with self.lock:
+            done, failed = self.items_done, self.items_failed
+            avg_time = self.busy_time / (done + failed) if done + failed else 0.0
+        return (f"阶段 {self.name}（并发 {self.concurrency}）: 完成 {done} 个, 失败 {failed} 个, "
+                f"平均用时 {avg_time:.1f} 秒, 利用率 {self.utilisation():.0%}, "
+                f"队列 {self.input_queue.qsize()}/{self.input_queue.maxsize}")
+
+
+class Pipeline:
+    def __init__(self, stages):
+        """
+        初始化流水线，按顺序连接各阶段。
+        :param stages: Stage 列表
+        """
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def put(self, item, timeout=None):
+        """向第一个阶段放入数据，队列满时阻塞"""
+        self.stages[0].put(item, timeout=timeout)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def bottleneck(self):
+        """利用率最高的阶段"""
+        return max(self.stages, key=lambda stage: stage.utilisation())
+
+    def log_stats(self):
+        """输出各阶段的利用率统计"""
+        for stage in self.stages:
+            logging.info(stage.summary())
+        logging.info(f"当前瓶颈阶段: {self.bottleneck().name}")
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: rasterizer.py
+@Time    : 2025/4/11 下午2:05
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基于进程池的 PDF 渲染服务，按页并行渲染，同一 PDF 在同一 DPI 下只渲染一次，供各模型共享；
+           页面由 pdftoppm 直接写入磁盘，不在内存中解码，同时在渲染中的页面数不超过 max_pages_in_flight
+@Usage   : get_rasterizer(config).render(pdf_path, dpi=200, max_pages=10) 渲染前 max_pages 页；
+           get_rasterizer(config).iter_pages(pdf_path, dpi=200) 按需逐页渲染，提前停止时不再渲染剩余页面
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from pdf2image import convert_from_path
+
+from utils.pdf_utils import get_pages_dir, get_pdf_page_count
+
+_rasterizer = None  # 进程内共享的渲染服务
+_rasterizer_lock = threading.Lock()
+
+
+def _render_page(pdf_path, page_no, dpi, output_path):
+    """
+    在子进程中渲染 PDF 的单页。页面由 pdftoppm 直接写入临时文件再重命名，
+    不解码为 PIL 图像，保证页面文件存在即完整。
+    :return: 页面图像路径，页码超出范围时返回 None
+    """
+    output_dir, file_name = os.path.split(output_path)
+    tmp_name = f"{os.path.splitext(file_name)[0]}.{os.getpid()}.tmp"
+    tmp_paths = convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no, fmt="jpeg",
+                                  output_folder=output_dir, output_file=tmp_name, single_file=True, paths_only=True)
+    if not tmp_paths:
+        return None
+    os.replace(tmp_paths[0], output_path)
+    return output_path
+
+
+def _render_document(pdf_path, dpi, pages_dir, max_pages=None):
+    """在子进程中逐页渲染整个 PDF（最多 max_pages 页），用于无法读取页数的文档"""
+    image_paths = []
+    while max_pages is None or len(image_paths) < max_pages:
+        page_no = len(image_paths) + 1
+        try:
+            image_path = _render_page(pdf_path, page_no, dpi, os.path.join(pages_dir, f"page_{page_no}.jpg"))
+        except Exception:
+            if page_no == 1:
+                raise
+            break
+        if image_path is None:
+            break
+        image_paths.append(image_path)
+    return image_paths
+
+
+class PdfRasterizer:
+    def __init__(self, num_processes=None, max_pages_in_flight=None):
+        """
+        初始化渲染服务。
+        :param num_processes: 渲染进程数，默认为 CPU 核数
+        :param max_pages_in_flight: 逐页渲染时每个 PDF 最多提前渲染的页数，默认为渲染进程数
+        """
+        self.num_processes = num_processes or os.cpu_count() or 1
+        self.max_pages_in_flight = max_pages_in_flight or self.num_processes
+        # 使用 spawn 启动子进程，避免在多线程进程中 fork
+        self.executor = ProcessPoolExecutor(max_workers=self.num_processes,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        self.lock = threading.Lock()
+        self.pending = {}  # (页面文件路径) -> Future，合并对同一页面的并发请求
+
+    def _submit(self, key, fn, *args):
+        """提交渲染任务，同一页面正在渲染时复用已有的 Future"""
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            future = self.executor.submit(fn, *args)
+            self.pending[key] = future
+        # 回调在锁外注册：渲染已完成时回调在当前线程立即执行，_release 需要再次获取锁
+        future.add_done_callback(lambda _: self._release(key))
+        return future
+
+    def _release(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+
+    @staticmethod
+    def _done(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def _page_future(self, pdf_path, page_no, dpi, pages_dir):
+        """获取单页的渲染结果，已渲染的页面直接返回"""
+        page_path = os.path.join(pages_dir, f"page_{page_no}.jpg")
+        if os.path.exists(page_path):
+            return self._done(page_path)
+        return self._submit(page_path, _render_page, pdf_path, page_no, dpi, page_path)
+
+    @staticmethod
+    def _remove_stale_pages(pages_dir):
+        """删除同名 PDF 旧版本（修改时间或大小不同）的页面图像"""
+        version_dir = os.path.dirname(pages_dir)
+        pdf_pages_dir = os.path.dirname(version_dir)
+        if not os.path.isdir(pdf_pages_dir):
+            return
+        for name in os.listdir(pdf_pages_dir):
+            path = os.path.join(pdf_pages_dir, name)
+            if path != version_dir:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def iter_pages(self, pdf_path, dpi=200, max_pages=None, prefetch=None):
+        """
+        按需逐页渲染 PDF，每页作为一个任务分发到进程池，最多提前提交 prefetch 页。
+        调用方提前停止迭代时，剩余页面不会被渲染。
+        :param pdf_path: PDF 文件路径
+        :param dpi: 渲染分辨率
+        :param max_pages: 最多渲染的页数，None 表示全部页面
+        :param prefetch: 提前渲染的页数，默认为 max_pages_in_flight
+        :return: 页面图像路径的生成器
+        """
+        pages_dir = get_pages_dir(pdf_path, dpi)
+        if not os.path.isdir(pages_dir):
+            self._remove_stale_pages(pages_dir)
+            os.makedirs(pages_dir, exist_ok=True)
+        page_count = get_pdf_page_count(pdf_path, default=None)
+        if page_count is None:
+            logging.warning(f"无法读取 {pdf_path} 的页数，整体渲染")
+            yield from self._submit(pages_dir, _render_document, pdf_path, dpi, pages_dir, max_pages).result()
+            return
+        if max_pages is not None:
+            page_count = min(page_count, max_pages)
+
+        prefetch = max(prefetch or self.max_pages_in_flight, 1)
+        futures = deque()
+        next_page = 1
+        while next_page <= page_count and len(futures) < prefetch:
+            futures.append(self._page_future(pdf_path, next_page, dpi, pages_dir))
+            next_page += 1
+        while futures:
+            future = futures.popleft()
+            if next_page <= page_count:
+                futures.append(self._page_future(pdf_path, next_page, dpi, pages_dir))
+                next_page += 1
+            yield future.result()
+
+    def render(self, pdf_path, dpi=200, max_pages=None):
+        """
+        将 PDF 的前 max_pages 页并行渲染为 JPEG 页面图像。
+        :param pdf_path: PDF 文件路径
+        :param dpi: 渲染分辨率
+        :param max_pages: 最多渲染的页数，None 表示全部页面
+        :return: 页面图像路径列表
+        """
+        prefetch = max_pages or get_pdf_page_count(pdf_path)
+        return list(self.iter_pages(pdf_path, dpi=dpi, max_pages=max_pages, prefetch=prefetch))
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def get_rasterizer(config):
+    """获取进程内共享的渲染服务"""
+    global _rasterizer
+    with _rasterizer_lock:
+        if _rasterizer is None:
+            raster_config = config.get("raster_config", {})
+            _rasterizer = PdfRasterizer(num_processes=raster_config.get("num_processes"),
+                                        max_pages_in_flight=raster_config.get("max_pages_in_flight"))
+            logging.info(f"PDF 渲染服务已启动，进程数为 {_rasterizer.num_processes}，"
+                         f"每个 PDF 最多提前渲染 {_rasterizer.max_pages_in_flight} 页")
+        return _rasterizer
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: result_cache.py
+@Time    : 2025/4/13 下午2:30
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : 基于 SQLite(WAL) 的持久化结果缓存，按内容哈希缓存模型识别结果，任务重试或重新审核时不再重复请求模型；
+           按命名空间分别设置最大条目数、最大容量和过期时间，超出时淘汰最久未访问的条目（LRU）
+@Usage   : cache = get_result_cache(config, "vlm")；key = make_cache_key(image_sha256, prompt, model)；
+           cache.get(key)、cache.set(key, value)，缓存未开启时 get_result_cache 返回 None；
+           较大的结果（如 OCR 输出）可以在命名空间配置中开启 compress，使用 zlib 压缩后保存
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+_caches = {}  # (数据库路径, 命名空间) -> ResultCache
+_caches_lock = threading.Lock()
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """分块读取文件计算 SHA-256，不将整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(*parts):
+    """将多个部分（内容哈希、prompt、模型名称等）组合为缓存键，非字符串部分先序列化为 JSON"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (str, bytes)):
+            part = json.dumps(part, ensure_ascii=False, sort_keys=True, default=str)
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, db_path, namespace, max_entries=None, max_size_mb=None, ttl_seconds=None, compress=False,
+                 evict_interval=100):
+        """
+        初始化结果缓存。
+        :param db_path: SQLite 数据库文件路径，多个命名空间可以共用一个文件
+        :param namespace: 命名空间，如 vlm、ocr
+        :param max_entries: 最大条目数，为空表示不限制
+        :param max_size_mb: 最大容量（MB），为空表示不限制
+        :param ttl_seconds: 过期时间（秒），为空表示不过期
+        :param compress: 是否使用 zlib 压缩写入的值，容量按压缩后的大小计算
+        :param evict_interval: 每写入多少条检查一次容量
+        """
+        self.db_path = db_path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.ttl_seconds = ttl_seconds
+        self.compress = compress
+        self.evict_interval = max(int(evict_interval), 1)
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = self.connect_db()
+        self.create_table()
+        self.evict()
+
+    def connect_db(self) -> sqlite3.Connection:
+        """连接到 SQLite 数据库并开启 WAL 模式，多个处理进程可以同时读写"""
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create_table(self):
+        """创建缓存表"""
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            compressed INTEGER NOT NULL DEFAULT 0,  -- 值是否使用 zlib 压缩，按条目记录
+            PRIMARY KEY (namespace, key)
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (namespace, accessed_at)")
+
+    def _encode(self, value):
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        return zlib.compress(data) if self.compress else data
+
+    @staticmethod
+    def _decode(data, compressed):
+        data = bytes(data)
+        if compressed:
+            data = zlib.decompress(data)
+        return json.loads(data.decode("utf-8"))
+
+    def get(self, key):
+        """
+        读取缓存，命中时更新访问时间。
+        :param key: 缓存键
+        :return: 缓存的值，未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at, compressed FROM cache WHERE namespace = ? AND key = ?",
+                                    (self.namespace, key)).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                              (now, self.namespace, key))
+            self.hits += 1
+        try:
+            return self._decode(row[0], row[2])
+        except (ValueError, UnicodeDecodeError, zlib.error) as e:
+            logging.warning(f"缓存 {self.namespace} 中的条目 {key} 无法解析，已忽略：{e}")
+            return None
+
+    def set(self, key, value):
+        """
+        写入缓存，值需要可以序列化为 JSON。
+        :param key: 缓存键
+        :param value: 缓存的值
+        """
+        data = self._encode(value)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("""
+            INSERT OR REPLACE INTO cache (namespace, key, value, size, created_at, accessed_at, compressed)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (self.namespace, key, sqlite3.Binary(data), len(data), now, now, int(self.compress)))
+            self._writes += 1
+            evict = self._writes % self.evict_interval == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期的条目，并按访问时间淘汰超出条目数或容量上限的条目"""
+        with self.lock:
+            removed = 0
+            if self.ttl_seconds:
+                removed += self.conn.execute("DELETE FROM cache WHERE namespace = ? AND created_at < ?",
+                                             (self.namespace, time.time() - self.ttl_seconds)).rowcount
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?",
+                                             (self.namespace,)).fetchone()
+            if self.max_entries and count > self.max_entries:
+                removed += self.conn.execute("""
+                DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at LIMIT ?)
+                """, (self.namespace, self.namespace, count - self.max_entries)).rowcount
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?",
+                                          (self.namespace,)).fetchone()[0]
+            if self.max_bytes and total > self.max_bytes:
+                # 按访问时间从旧到新累计，删除累计容量超出部分的条目
+                rows = self.conn.execute("SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at",
+                                         (self.namespace,)).fetchall()
+                excess, keys = total - self.max_bytes, []
+                for key, size in rows:
+                    if excess <= 0:
+                        break
+                    keys.append((self.namespace, key))
+                    excess -= size
+                self.conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", keys)
+                removed += len(keys)
+        if removed:
+            logging.info(f"缓存 {self.namespace} 淘汰 {removed} 个条目")
+
+    def stats(self):
+        """命中次数、未命中次数、条目数和容量（MB）"""
+        with self.lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?",
+                                             (self.namespace,)).fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": count, "size_mb": total / 1024 / 1024}
+
+    def close(self):
+        self.conn.close()
+
+
+def get_result_cache(config, namespace):
+    """
+    获取进程内共享的结果缓存。cache_config 中的通用配置可以被同名命名空间下的配置覆盖。
+    :param config: 完整配置
+    :param namespace: 命名空间
+    :return: ResultCache，缓存未开启时返回 None
+    """
+    cache_config = config.get("cache_config", {})
+    options = {**cache_config, **(cache_config.get(namespace) or {})}
+    if not options.get("enabled", False):
+        return None
+    db_path = options.get("db_path", "./data/result_cache.db")
+    key = (db_path, namespace)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            ttl_days = options.get("ttl_days")
+            cache = ResultCache(db_path, namespace,
+                                max_entries=options.get("max_entries"),
+                                max_size_mb=options.get("max_size_mb"),
+                                ttl_seconds=ttl_days * 86400 if ttl_days else None,
+                                compress=options.get("compress", False))
+            _caches[key] = cache
+            logging.info(f"结果缓存 {namespace} 已启用，数据库为 {db_path}")
+        return cache
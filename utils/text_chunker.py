@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+@Project : Audits
+@FileName: text_chunker.py
+@Time    : 2025/4/14 下午3:20
+@Author  : ZhouFei
+@Email   : zhoufei.net@gmail.com
+@Desc    : OCR 文本分块：按中文句末标点、换行和表格边界切分，一次线性遍历按 token 预算装满每个分块。
+           优先使用本地的 Qwen tokenizer（transformers）计数，未安装时依次退回 tiktoken 和按字符计数
+@Usage   : chunker = get_text_chunker(tokenizer_dir)；chunks = chunker.chunk(text, budget=4000)
+"""
+import logging
+import re
+import threading
+from functools import lru_cache
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # transformers 为可选依赖
+    AutoTokenizer = None
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖
+    tiktoken = None
+
+_chunkers = {}  # tokenizer 目录 -> TextChunker
+_chunkers_lock = threading.Lock()
+
+# 表格（MinerU 输出的 HTML 表格）作为整体，不在内部切分
+_TABLE_PATTERN = re.compile(r"<table.*?</table>", re.S | re.I)
+# 句子以中文句末标点、分号或换行结尾，最后一句可以没有结尾
+_SENTENCE_PATTERN = re.compile(r"[^。！？；!?;\n]*(?:[。！？；!?;\n]+|$)")
+# 超出预算的句子或表格依次按表格行、逗号切分
+_FALLBACK_PATTERNS = (re.compile(r".*?</tr>|.+$", re.S | re.I), re.compile(r"[^，,、]*(?:[，,、]+|$)"))
+
+
+def _load_encoder(tokenizer_dir):
+    """加载 token 编码函数和名称，依次尝试本地 Qwen tokenizer、tiktoken 和按字符计数"""
+    if tokenizer_dir and AutoTokenizer is not None:
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir, local_files_only=True, trust_remote_code=True)
+            return lambda text: tokenizer.encode(text, add_special_tokens=False), f"transformers({tokenizer_dir})"
+        except Exception as e:
+            logging.warning(f"加载 tokenizer {tokenizer_dir} 失败，使用备用计数方式：{e}")
+    if tiktoken is not None:
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return encoding.encode, "tiktoken(cl100k_base)"
+    # 中文约 1 字 1 token，按字符计数偏保守
+    return list, "characters"
+
+
+class TextChunker:
+    def __init__(self, tokenizer_dir=None, cache_size=65536):
+        """
+        初始化文本分块器。
+        :param tokenizer_dir: 本地 tokenizer 目录（如 Qwen 模型目录），为空时使用 tiktoken
+        :param cache_size: 缓存的句子 token 数数量
+        """
+        self._encode, self.tokenizer_name = _load_encoder(tokenizer_dir)
+        self.count_tokens = lru_cache(maxsize=cache_size)(self._count_tokens)
+        logging.info(f"文本分块使用 {self.tokenizer_name} 计数")
+
+    def _count_tokens(self, text):
+        return len(self._encode(text))
+
+    @staticmethod
+    def split_segments(text):
+        """
+        一次线性遍历将文本切分为不可再分的片段：整个表格为一个片段，其余文本按句切分，片段拼接后与原文相同。
+        """
+        position = 0
+        for match in _TABLE_PATTERN.finditer(text):
+            yield from (s for s in _SENTENCE_PATTERN.findall(text, position, match.start()) if s)
+            yield match.group()
+            position = match.end()
+        yield from (s for s in _SENTENCE_PATTERN.findall(text, position) if s)
+
+    def _split_oversized(self, segment, budget, level=0):
+        """将超出预算的片段依次按表格行、逗号切分，仍超出时按字符数切分"""
+        if level < len(_FALLBACK_PATTERNS):
+            parts = [part for part in _FALLBACK_PATTERNS[level].findall(segment) if part]
+            if len(parts) > 1:
+                for part in parts:
+                    if self.count_tokens(part) > budget:
+                        yield from self._split_oversized(part, budget, level + 1)
+                    else:
+                        yield part
+                return
+            yield from self._split_oversized(segment, budget, level + 1)
+            return
+        # 按平均每 token 字符数估算切分长度，再逐段校验
+        step = max(int(len(segment) * budget / max(self.count_tokens(segment), 1)), 1)
+        start = 0
+        while start < len(segment):
+            end = min(start + step, len(segment))
+            while end - start > 1 and self.count_tokens(segment[start:end]) > budget:
+                end = start + max((end - start) * 9 // 10, 1)
+            yield segment[start:end]
+            start = end
+
+    def chunk(self, text, budget):
+        """
+        按 token 预算将文本分块，依次装入片段，下一个片段放不下时开始新的分块。
+        分块拼接后与原文相同，预算很小时可能出现只含空白的分块，由调用方决定是否跳过。
+        :param text: OCR 文本
+        :param budget: 每个分块的最大 token 数
+        :return: 分块列表，空白文本返回空列表
+        """
+        if not text or not text.strip():
+            return []
+        budget = max(int(budget), 1)
+        chunks, current, current_tokens = [], [], 0
+        for segment in self.split_segments(text):
+            tokens = self.count_tokens(segment)
+            pieces = [(segment, tokens)] if tokens <= budget else \
+                [(piece, self.count_tokens(piece)) for piece in self._split_oversized(segment, budget)]
+            for piece, piece_tokens in pieces:
+                if current and current_tokens + piece_tokens > budget:
+                    chunks.append("".join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current:
+            chunks.append("".join(current))
+        return chunks
+
+
+def get_text_chunker(tokenizer_dir=None):
+    """获取进程内共享的文本分块器，tokenizer 只加载一次，句子的 token 数在各任务之间共享缓存"""
+    with _chunkers_lock:
+        chunker = _chunkers.get(tokenizer_dir)
+        if chunker is None:
+            chunker = TextChunker(tokenizer_dir)
+            _chunkers[tokenizer_dir] = chunker
+        return chunker
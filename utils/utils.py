@@ -8,6 +8,7 @@
 @Desc    : 
 @Usage   :
 """
+import copy
 import logging
 import os
 import sys
@@ -31,6 +32,22 @@ def load_examples(example_file):
         examples = yaml.safe_load(f)
     return examples
 
+def get_worker_config(config, worker_name):
+    """
+    为单个处理单元生成独立的配置副本。
+    各模型的中间文件（PDF 页面图像、OCR 输出等）均写在 output_dir 下的固定文件名中，
+    多个处理单元共享同一目录会互相覆盖，因此将 output_dir 隔离到 output_dir/workers/<worker_name>。
+    :param config: 全局配置
+    :param worker_name: 处理单元名称
+    :return: 处理单元的配置副本
+    """
+    worker_config = copy.deepcopy(config)
+    data_config = worker_config.setdefault("data_config", {})
+    output_dir = data_config.get("output_dir") or "./data/output"
+    data_config["output_dir"] = os.path.join(output_dir, "workers", worker_name)
+    return worker_config
+
+
 def suppress_print():
     """屏蔽 print 输出"""
     sys.stdout = open(os.devnull, 'w')
@@ -12,6 +12,22 @@ import logging
 
 from .workflow import Base_Workflow
 
+# 各工作流第一阶段需要 PDF 页面图像的模型配置，流水线渲染阶段按这些模型的 DPI 提前渲染
+PDF_CONSUMERS = {
+    "mini": ["vlm_config"],
+    "lite": ["seal_config"],
+    "ultra": ["vlm_config"],
+    "pro": ["seal_config"],
+    "plus": ["vlm_config"],
+}
+
+
+def get_raster_dpis(config):
+    """获取当前工作流第一阶段需要的 PDF 渲染分辨率"""
+    workflow_type = config.get("workflow_config").get("workflow_type", "mini")
+    return sorted({config.get(section, {}).get("pdf_dpi", 200) for section in PDF_CONSUMERS.get(workflow_type, [])})
+
+
 def get_workflow(config):
     workflow_type = config.get("workflow_config").get("workflow_type", "mini")
     if workflow_type == "mini":
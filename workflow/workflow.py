@@ -8,18 +8,75 @@
 @Desc    : Workflow基类
 @Usage   :
 """
+import logging
 from collections import Counter
 
 from fontTools.qu2cu.qu2cu import List
 from sympy import Dict
 
 from models import VLM
+from models.name_classifier import get_name_classifier
+
+
+class FieldAgreement:
+    def __init__(self, required_fields, agreement_threshold=0.6, min_files=3):
+        """
+        跟踪任务中已处理文件的抽取结果，判断必填字段是否都已填充且结果一致，满足时可以跳过剩余文件。
+        :param required_fields: 必填字段列表
+        :param agreement_threshold: 出现次数最多的值在给出该字段的文件中所占的最低比例
+        :param min_files: 至少处理的文件数
+        """
+        self.required_fields = list(required_fields)
+        self.agreement_threshold = agreement_threshold
+        self.min_files = max(int(min_files), 1)
+        self.files = 0  # 已处理的文件数
+        self.skipped = 0  # 提前结束而跳过的文件数
+        self.values = {field: Counter() for field in self.required_fields}
+
+    @staticmethod
+    def _normalize(field, value):
+        """与 _merge_results 相同的取值规则，无效值返回 None"""
+        if isinstance(value, list):
+            value = ", ".join(map(str, value))
+        if value is None or value == "null" or value == "":
+            return None
+        if field == "图斑编号" and (not str(value).startswith("HZJGZW") or not (30 <= len(str(value)) <= 33)):
+            return None
+        return value
+
+    def update(self, results):
+        """
+        记录一个文件的抽取结果。
+        :param results: 单个文件的抽取结果字典，或打包处理的多个文件的结果列表
+        :return: 是否满足提前结束条件
+        """
+        for result in results if isinstance(results, list) else [results]:
+            self.files += 1
+            for field in self.required_fields:
+                value = self._normalize(field, (result or {}).get(field))
+                if value is not None:
+                    self.values[field][value] += 1
+        return self.satisfied()
+
+    def satisfied(self):
+        """已处理的文件数不少于 min_files，且每个必填字段出现次数最多的值所占比例不低于 agreement_threshold"""
+        if self.files < self.min_files:
+            return False
+        for counter in self.values.values():
+            if not counter:
+                return False
+            if counter.most_common(1)[0][1] / sum(counter.values()) < self.agreement_threshold:
+                return False
+        return True
 
 
 class Base_Workflow:
     def __init__(self, config):
         self.config = config
         self.max_empty_count = self.config.get("workflow_config", {}).get("max_empty_count", 2)
+        # 字段提前结束：必填字段都已填充且结果一致后，跳过任务中的剩余文件
+        self.early_exit_config = self.config.get("workflow_config", {}).get("early_exit", {}) or {}
+        self.skipped_files = 0  # 提前结束而跳过的文件总数
         self.results_dict = {
                 "id": None,
                 "公章": False,
@@ -33,6 +90,90 @@ class Base_Workflow:
     def init_models(self):
         pass
 
+    def close(self):
+        """释放工作流持有的资源（如后台线程池），处理单元退出时调用"""
+        pass
+
+    def _field_agreement(self):
+        """创建任务的字段一致性跟踪器，未开启提前结束时返回 None"""
+        if not self.early_exit_config.get("enabled", False):
+            return None
+        required_fields = self.early_exit_config.get("required_fields") or \
+            [field for field in self.results_dict.keys() if field not in ("id", "公章")]
+        return FieldAgreement(required_fields,
+                              agreement_threshold=self.early_exit_config.get("agreement_threshold", 0.6),
+                              min_files=self.early_exit_config.get("min_files", 3))
+
+    def _skip_remaining(self, task_id, agreement, remaining, seal_results=None):
+        """
+        判断是否跳过任务中的剩余文件，跳过时记录跳过的文件数。
+        :param task_id: 任务 id
+        :param agreement: 字段一致性跟踪器，为 None 时不跳过
+        :param remaining: 剩余的文件数
+        :param seal_results: 同一循环中进行印章识别时传入循环已得到的印章识别结果，只有其中已有印章才跳过，
+                             与 post_process 的判断一致，避免公章结果变化
+        :return: 是否跳过
+        """
+        if agreement is None or not remaining or not agreement.satisfied():
+            return False
+        if seal_results is not None and not any(seal_results):
+            return False
+        agreement.skipped += remaining
+        self.skipped_files += remaining
+        logging.info(f"任务 {task_id} 的必填字段已填充且结果一致（已处理 {agreement.files} 个文件），"
+                     f"跳过剩余 {remaining} 个文件，累计跳过 {self.skipped_files} 个文件")
+        return True
+
+    def _vlm_extract_files(self, task_id, input_paths, vlm=None):
+        """
+        使用 VLM 逐个文件抽取关键信息。开启打包（vlm_config.batch_max_images 大于 1）且任务中有多张图像时，
+        图像打包请求，PDF 仍逐个处理。开启 workflow_config.early_exit 时每个文件（批次）的结果返回后判断
+        必填字段是否都已填充且结果一致，满足时跳过剩余文件。
+        :param task_id: 任务 id
+        :param input_paths: 任务的文件路径列表
+        :param vlm: 共享上下文的 VLM 实例，为空时每个文件（批次）使用新的 VLM 实例
+        :return: 每个文件的抽取结果列表
+        """
+        new_vlm = vlm is None
+        vlm = vlm or VLM(self.config)
+        image_paths = [path for path in input_paths if path.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        agreement = self._field_agreement()
+        vlm_results = []
+        if vlm.batch_enabled and len(image_paths) > 1:
+            # 开启提前结束时按 batch_max_images 分组请求，每组结果返回后判断是否跳过剩余文件
+            step = vlm.batch_max_images if agreement is not None else len(image_paths)
+            for start in range(0, len(image_paths), step):
+                group = image_paths[start:start + step]
+                try:
+                    logging.info(f"开始对任务 {task_id} 中的 {len(group)} 张图像进行打包vlm提取...")
+                    # 未传入共享的 VLM 实例时文件之间不传递上下文，打包的批次之间同样不传递
+                    group_results = vlm.process_images(group, chain_context=not new_vlm)
+                    vlm_results.extend(result for result in group_results if result)
+                    if agreement is not None:
+                        agreement.update(group_results)
+                except Exception as e:
+                    logging.error(f"任务 {task_id} 中的图像打包处理失败！错误信息：{str(e)}")
+                remaining = len(input_paths) - start - len(group)
+                if self._skip_remaining(task_id, agreement, remaining):
+                    return vlm_results
+            input_paths = [path for path in input_paths if path not in image_paths]
+
+        for index, input_path in enumerate(input_paths):
+            if self._skip_remaining(task_id, agreement, len(input_paths) - index):
+                break
+            try:
+                # 处理文件
+                logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行vlm提取...")
+                if new_vlm:
+                    vlm = VLM(self.config)
+                vlm_result = vlm.process(input_path)
+                vlm_results.append(vlm_result)
+                if agreement is not None:
+                    agreement.update(vlm_result)
+            except Exception as e:
+                logging.error(f"任务 {task_id} 中的文件 {input_path} 处理失败！错误信息：{str(e)}")
+        return vlm_results
+
     def _update_building_area(self):
         """对占地面积和建筑面积进行判断更新"""
         occupied_area = self.results_dict['占地面积']
@@ -51,7 +192,6 @@ class Base_Workflow:
             self.results_dict['建筑面积'] = None
 
     def _merge_results(self, results):
-        vlm = VLM(self.config)
         # 使用列表推导式提取当事人字段
         names_merge = [item.get("当事人") for item in results if
                        item.get("当事人") is not None and item.get("当事人") != '']
@@ -68,7 +208,8 @@ class Base_Workflow:
         names = [name for name, count in name_counts.most_common()]
         if len(names) >= 3:
             names = names[:3]
-        name_type = vlm.judge_name_type(names)
+        # 规则能判断的名称不请求模型，模型的判断结果按名称组合缓存
+        name_type = get_name_classifier(self.config).classify(names)
 
         if name_type == 1:
             # 对多材料企业信息的处理, 要求当事人字段结果合并，用,分隔，其余值的处理与else处理一致
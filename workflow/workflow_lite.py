@@ -52,7 +52,10 @@ class Workflow(Base_Workflow):
                 "建筑面积": None
             }
             seal_results, miner_results, paddle_results, llm_m_results, llm_p_results = [], [], [], [], []  # 识别结果
-            for input_path in input_paths:
+            agreement = self._field_agreement()
+            for index, input_path in enumerate(input_paths):
+                if self._skip_remaining(task_id, agreement, len(input_paths) - index, seal_results):
+                    break
                 # 防止上下文过长,每次重新初始化一个VLM模型
                 vlm_m = VLM(self.config)
                 try:
@@ -71,6 +74,8 @@ class Workflow(Base_Workflow):
                         # vlm 提取minerUOCR识别结果
                         logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行vlm提取...")
                         llm_m_result = vlm_m.process_text(miner_text)
+                        if agreement is not None:
+                            agreement.update(llm_m_result)
                         if llm_m_result:
                             llm_m_results.append(llm_m_result)
                         else:
@@ -85,7 +90,10 @@ class Workflow(Base_Workflow):
             results_miner = copy.deepcopy(self.results_dict)
             if empty_count >= self.max_empty_count:
                 logging.info(f"任务 {task_id} 中空字段数量大于 {self.max_empty_count} ，使用PaddlexOCR识别！")
-                for input_path in input_paths:
+                agreement = self._field_agreement()
+                for index, input_path in enumerate(input_paths):
+                    if self._skip_remaining(task_id, agreement, len(input_paths) - index):
+                        break
                     # 防止上下文过长,每次重新初始化一个VLM模型
                     vlm_p = VLM(self.config)
                     try:
@@ -98,6 +106,8 @@ class Workflow(Base_Workflow):
                             # llm 提取paddleOCR识别结果
                             logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行vlm提取...")
                             llm_p_result = vlm_p.process_text(paddle_text)
+                            if agreement is not None:
+                                agreement.update(llm_p_result)
                             if llm_p_result:
                                 llm_p_results.append(llm_p_result)
                             else:
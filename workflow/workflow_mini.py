@@ -44,14 +44,7 @@ class Workflow(Base_Workflow):
                 "建筑面积": None
             }
 
-            vlm_results = [] # 存储vlm结果
-            for input_path in input_paths:
-                try:
-                    # 处理文件
-                    vlm_result = vlm.process(input_path)
-                    vlm_results.append(vlm_result)
-                except Exception as e:
-                    logging.error(f"任务 {task_id} 中的文件 {input_path} 处理失败！错误信息：{str(e)}")
+            vlm_results = self._vlm_extract_files(task_id, input_paths, vlm)  # 存储vlm结果
 
             # 开始对结果进行后处理合并
             logging.info(f"开始对 {task_id} 结果进行后处理！")
@@ -10,11 +10,115 @@
 """
 import copy
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from models import MinerUOCR, SealExtractor, VLM
 from workflow.workflow import Base_Workflow
 
 
+class _Speculation:
+    def __init__(self, executor, task_id, input_paths, seal_extractor, miner_ocr):
+        """
+        在后台线程中逐个文件预先进行印章识别和 MinerU OCR，与第一阶段的 VLM 提取并行。
+        :param executor: 执行推测任务的线程池
+        :param task_id: 任务 id
+        :param input_paths: 预先识别的文件路径列表
+        :param seal_extractor: 任务的印章识别实例
+        :param miner_ocr: 任务的 MinerU OCR 实例
+        """
+        self.task_id = task_id
+        self.input_paths = list(input_paths)
+        self.seal_extractor = seal_extractor
+        self.miner_ocr = miner_ocr
+        self.cancelled = threading.Event()
+        self.results = {}  # 文件路径 -> (印章识别结果, MinerU 文本)
+        self.done = {input_path: threading.Event() for input_path in self.input_paths}
+        self.future = executor.submit(self._run)
+
+    def _run(self):
+        try:
+            for input_path in self.input_paths:
+                # 取消后不再开始新的文件，正在识别的文件完成后结束
+                if self.cancelled.is_set():
+                    break
+                try:
+                    logging.info(f"推测执行：对任务 {self.task_id} 中的文件 {input_path} 进行印章识别和minerUOCR识别...")
+                    seal_result = self.seal_extractor.process(input_path)
+                    miner_text = self.miner_ocr.process(input_path, llm_text=True)
+                    self.results[input_path] = (seal_result, miner_text)
+                except Exception as e:
+                    logging.error(f"推测执行：任务 {self.task_id} 中的文件 {input_path} 处理失败！错误信息：{str(e)}")
+                finally:
+                    self.done[input_path].set()
+        finally:
+            for event in self.done.values():
+                event.set()
+
+    def get(self, input_path):
+        """
+        等待并获取文件的预先识别结果。
+        :return: (印章识别结果, MinerU 文本)，文件未预先识别或识别失败时返回 None
+        """
+        event = self.done.get(input_path)
+        if event is None:
+            return None
+        event.wait()
+        return self.results.get(input_path)
+
+    def cancel(self):
+        """
+        取消推测执行，已得到的结果丢弃。等待正在识别的文件完成后返回，
+        避免任务结束、数据删除后推测线程仍在处理单元的输出目录中写入文件。
+        """
+        self.cancelled.set()
+        if not self.future.cancel():
+            self.future.result()
+
+
 class Workflow(Base_Workflow):
+    def __init__(self, config):
+        super().__init__(config)
+        # 推测执行：与第一阶段的 VLM 提取并行预先进行印章识别和 MinerU OCR，第一阶段结果满足要求时丢弃
+        speculative_config = self.config.get("workflow_config", {}).get("speculative", {}) or {}
+        self.speculative_enabled = speculative_config.get("enabled", False)
+        self.speculative_max_files = speculative_config.get("max_files")  # 每个任务最多预先识别的文件数，为空表示不限制
+        self._speculation_executor = None
+        self.speculation_stats = {"started": 0, "hits": 0, "discarded": 0}
+        self._speculation_lock = threading.Lock()  # 保护推测执行线程池的创建和统计
+
+    def _start_speculation(self, task_id, input_paths, seal_extractor, miner_ocr):
+        """开始任务的推测执行，未开启时返回 None"""
+        if not self.speculative_enabled:
+            return None
+        with self._speculation_lock:
+            if self._speculation_executor is None:
+                # 单个线程执行，被取消的推测任务最多继续识别一个文件，额外的 GPU 占用有上限
+                self._speculation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate")
+            self.speculation_stats["started"] += 1
+            executor = self._speculation_executor
+        paths = input_paths[:self.speculative_max_files] if self.speculative_max_files else input_paths
+        return _Speculation(executor, task_id, paths, seal_extractor, miner_ocr)
+
+    def _finish_speculation(self, task_id, speculation, hit):
+        """记录推测执行是否命中，未命中时取消并等待正在识别的文件完成，丢弃结果"""
+        if speculation is None:
+            return
+        if not hit:
+            speculation.cancel()
+        with self._speculation_lock:
+            self.speculation_stats["hits" if hit else "discarded"] += 1
+            stats = dict(self.speculation_stats)
+        logging.info(f"任务 {task_id} 推测执行{'命中' if hit else '未命中，已取消'}，累计命中率 "
+                     f"{stats['hits']}/{stats['started']}（{stats['hits'] / stats['started']:.0%}）")
+
+    def close(self):
+        """关闭推测执行线程池，尚未开始的推测任务取消，正在识别的文件完成后线程退出"""
+        with self._speculation_lock:
+            executor, self._speculation_executor = self._speculation_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def init_models(self):
         # 加载模型
         try:
@@ -50,17 +154,12 @@ class Workflow(Base_Workflow):
                 "建筑面积": None
             }
             seal_results, miner_results, paddle_results, vlm_results, llm_m_results, llm_p_results = [], [], [], [], [], []  # 识别结果
+            # 推测执行的印章识别和 MinerU OCR 与 VLM 提取同时进行
+            speculation = self._start_speculation(task_id, input_paths, seal_extractor, miner_ocr)
             vlm = VLM(self.config)
             # TODO: 添加对文件名称列表的提取
             vlm.process_file_list(input_paths)
-            for input_path in input_paths:
-                try:
-                    # 处理文件
-                    logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行vlm提取...")
-                    vlm_result = vlm.process(input_path)
-                    vlm_results.append(vlm_result)
-                except Exception as e:
-                    logging.error(f"任务 {task_id} 中的文件 {input_path} 在第一阶段中处理失败！错误信息：{str(e)}")
+            vlm_results = self._vlm_extract_files(task_id, input_paths, vlm)
 
             # 开始对结果进行后处理合并
             logging.info(f"开始对 {task_id} 结果进行后处理！")
@@ -68,26 +167,37 @@ class Workflow(Base_Workflow):
             empty_count = sum(1 for value in self.results_dict.values() if value is None or value == "")
             # 将vlm结果深拷贝
             results_vlm = copy.deepcopy(self.results_dict)
+            self._finish_speculation(task_id, speculation, empty_count >= self.max_empty_count)
             if empty_count >= self.max_empty_count:
                 # 防止上下文过长,每次重新初始化一个VLM模型
                 vlm_m = VLM(self.config)
-                for input_path in input_paths:
+                agreement = self._field_agreement()
+                for index, input_path in enumerate(input_paths):
+                    if self._skip_remaining(task_id, agreement, len(input_paths) - index, seal_results):
+                        break
                     try:
-                        # 识别印章
-                        logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行印章识别...")
-                        seal_result = seal_extractor.process(input_path)
+                        # 推测执行已识别的文件直接使用其结果，未识别或识别失败的文件重新识别
+                        speculated = speculation.get(input_path) if speculation is not None else None
+                        if speculated is not None:
+                            seal_result, miner_text = speculated
+                        else:
+                            # 识别印章
+                            logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行印章识别...")
+                            seal_result = seal_extractor.process(input_path)
+
+                            # minerUOCR 识别
+                            logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行minerUOCR识别...")
+                            miner_text = miner_ocr.process(input_path, llm_text=True)
                         if seal_result:
                             seal_results.append(seal_result)
-
-                        # minerUOCR 识别
-                        logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行minerUOCR识别...")
-                        miner_text = miner_ocr.process(input_path, llm_text=True)
                         if miner_text:
                             miner_results.append(miner_text)
 
                             # vlm 提取minerUOCR识别结果
                             logging.info(f"开始对任务 {task_id} 中的文件 {input_path} 进行vlm提取...")
                             llm_m_result = vlm_m.process_text(miner_text)
+                            if agreement is not None:
+                                agreement.update(llm_m_result)
                             if llm_m_result:
                                 llm_m_results.append(llm_m_result)
                             else:
@@ -96,6 +206,10 @@ class Workflow(Base_Workflow):
                     except Exception as e:
                         logging.error(f"任务 {task_id} 中的文件 {input_path} 处理失败！错误信息：{str(e)}")
 
+                if speculation is not None:
+                    # 提前结束时停止识别剩余的文件，并在任务返回前等待正在识别的文件完成
+                    speculation.cancel()
+
                 # 开始对结果进行后处理合并
                 logging.info(f"开始对 {task_id} 结果进行后处理！")
                 self.post_process(seal_results, llm_m_results)